@@ -0,0 +1,96 @@
+"""Benchmark StrictPython3Checker over a large synthetic corpus.
+
+Compares the per-file cost of the checker against the previous
+implementation, which resolved the scope of every Name node before checking
+whether the name was a changed built-in.
+
+Run with ``python benchmarks/pylint_checker.py [--files N] [--functions N]``.
+"""
+from __future__ import print_function
+
+import argparse
+import random
+import timeit
+
+import astroid
+from pylint import testutils
+
+from caniusepython3.pylint_checker import StrictPython3Checker
+
+
+class LookupEveryNameChecker(StrictPython3Checker):
+
+    """The checker as it was before names were filtered by a scope index."""
+
+    def visit_module(self, node):
+        pass
+
+    def visit_name(self, node):
+        if hasattr(node, 'name') and getattr(node.lookup(node.name)[0], 'name', '') == '__builtin__':
+            if node.name in self._changed_builtins:
+                self.add_message(node.name + '-builtin', node=node)
+
+
+FUNCTION_TEMPLATE = '''
+def func_{index}(arg_{index}, *args, **kwargs):
+    total = arg_{index}
+    for item in args:
+        total = total + len(item) + {other}
+    values = [value for value in kwargs.values() if value]
+    with {opener}('file_{index}.txt') as file:
+        data = file.read()
+    return total, values, data
+'''
+
+
+def synthetic_module(functions, rng):
+    """Create the source of a module with the specified number of functions."""
+    parts = ['import io\n']
+    if rng.random() < 0.2:
+        # Some modules shadow the built-in, forcing the slow path.
+        parts.append('from io import open\n')
+    for index in range(functions):
+        parts.append(FUNCTION_TEMPLATE.format(
+            index=index, other=rng.randint(0, 100),
+            opener=rng.choice(['open', 'io.open'])))
+    return ''.join(parts)
+
+
+def names_in(module):
+    return list(module.nodes_of_class(astroid.nodes.Name))
+
+
+def run_checker(checker_class, corpus):
+    checker = checker_class(testutils.UnittestLinter())
+    for module, names in corpus:
+        checker.visit_module(module)
+        for name in names:
+            checker.visit_name(name)
+        checker.linter.release_messages()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--functions', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=3)
+    parsed = parser.parse_args()
+
+    rng = random.Random(42)
+    corpus = []
+    for _ in range(parsed.files):
+        module = astroid.parse(synthetic_module(parsed.functions, rng))
+        corpus.append((module, names_in(module)))
+    name_count = sum(len(names) for _, names in corpus)
+    print('{0} files, {1} Name nodes'.format(len(corpus), name_count))
+
+    for label, checker_class in [('before', LookupEveryNameChecker),
+                                 ('after', StrictPython3Checker)]:
+        best = min(timeit.repeat(lambda: run_checker(checker_class, corpus),
+                                 number=1, repeat=parsed.repeat))
+        print('{0:>6}: {1:.3f} ms/file'.format(
+                label, best / len(corpus) * 1000))
+
+
+if __name__ == '__main__':
+    main()
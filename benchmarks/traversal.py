@@ -0,0 +1,76 @@
+"""Benchmark the search for blockers over a large synthetic dependency graph.
+
+Measures the algorithmic cost of dependencies.Traversal alone by answering its
+lookups from recorded results, so no time is spent on the index or on
+threads.
+
+Run with ``python benchmarks/traversal.py [--projects N] [--roots N]``.
+"""
+from __future__ import print_function
+
+import argparse
+import random
+import timeit
+
+from caniusepython3 import dependencies
+
+
+def synthetic_results(projects, fan_out, ported, rng):
+    """Record the lookup results of a random graph of the specified size.
+
+    Projects only depend on projects after them, as most graphs are close to
+    acyclic, apart from a few cycles.
+    """
+    names = ['project-{0}'.format(index) for index in range(projects)]
+    results = {}
+    for index, name in enumerate(names):
+        later = names[index + 1:index + 1 + 50 * fan_out]
+        deps = set(rng.sample(later, min(len(later),
+                                         rng.randint(0, 2 * fan_out))))
+        if rng.random() < 0.001:
+            deps.add(rng.choice(names[:index + 1]))
+        results[dependencies.Lookup(dependencies.SUPPORT, name)] = (
+                rng.random() < ported)
+        results[dependencies.Lookup(dependencies.DEPENDENCIES, name)] = deps
+    return names, results
+
+
+def run_traversal(roots, results):
+    """Search below the roots, returning the blockers and lookup count."""
+    replay = dependencies.replay_resolver(results)
+    lookups = [0]
+
+    def resolve(batch):
+        lookups[0] += len(batch)
+        return replay(batch)
+
+    reasons = dependencies.drive(dependencies.Traversal(roots), resolve)
+    return reasons, lookups[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--projects', type=int, default=100000)
+    parser.add_argument('--roots', type=int, default=1000)
+    parser.add_argument('--fan-out', type=int, default=4,
+                        help='average number of dependencies of a project')
+    parser.add_argument('--ported', type=float, default=0.3,
+                        help='fraction of the projects which are ported')
+    parser.add_argument('--repeat', type=int, default=3)
+    parsed = parser.parse_args()
+
+    rng = random.Random(42)
+    names, results = synthetic_results(parsed.projects, parsed.fan_out,
+                                       parsed.ported, rng)
+    roots = rng.sample(names, parsed.roots)
+    reasons, lookups = run_traversal(roots, results)
+    print('{0} projects, {1} roots: {2} blockers found with {3} '
+          'lookups'.format(len(names), len(roots), len(reasons), lookups))
+
+    best = min(timeit.repeat(lambda: run_traversal(roots, results),
+                             number=1, repeat=parsed.repeat))
+    print('{0:.3f} s, {1:.2f} us/lookup'.format(best, best / lookups * 1e6))
+
+
+if __name__ == '__main__':
+    main()
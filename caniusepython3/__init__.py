@@ -18,6 +18,7 @@ from __future__ import unicode_literals
 
 from caniusepython3 import projects as projects_
 from caniusepython3 import pypi
+from caniusepython3.checker import Checker, Report
 
 import multiprocessing
 
@@ -36,18 +37,25 @@ def check(requirements_paths=[], metadata=[], projects=[]):
     representing metadata. The 'projects' argument takes a sequence of project
     names.
 
-    Any project that is not listed on PyPI will be considered ported.
+    Any project that is not listed on PyPI will be considered ported. Projects
+    pinned to an exact version in a requirements file have that release
+    checked.
     """
+    versions = projects_.pinned_versions(requirements_paths)
     dependencies = []
     dependencies.extend(projects_.projects_from_requirements(requirements_paths))
     dependencies.extend(projects_.projects_from_metadata(metadata))
     dependencies.extend(projects)
 
     manual_overrides = pypi.manual_overrides()
+    known_ported = pypi.known_ported()
 
     for dependency in dependencies:
         if dependency in manual_overrides:
             continue
-        elif not pypi.supports_py3(dependency):
+        elif dependency not in versions and dependency in known_ported:
+            continue
+        elif not pypi.supports_py3(dependency,
+                                   version=versions.get(dependency)):
             return False
     return True
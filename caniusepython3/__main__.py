@@ -15,25 +15,93 @@
 from __future__ import print_function
 from __future__ import unicode_literals
 
+from caniusepython3 import cache
+from caniusepython3 import cassette
 from caniusepython3 import dependencies
 from caniusepython3 import projects as projects_
 from caniusepython3 import pypi
 
 import packaging.utils
 
+import requests
+import requests.adapters
+
 import argparse
+import concurrent.futures
 import io
+import itertools
+import json
 import logging
+import re
 import sys
+import time
+
+try:
+    _now = time.monotonic
+except AttributeError:  #pragma: no cover
+    _now = time.time
 
 # Without this, the 'ciu' logger will emit nothing.
 logging.basicConfig(format='[%(levelname)s] %(message)s')
 
+OUTPUT_FORMATS = ('text', 'json')
+
+# Descriptions of why checking stopped early (see
+# dependencies.IncompleteResolution).
+STOPPED_REASONS = {
+    'deadline': 'deadline reached',
+    'max-depth': 'maximum depth reached',
+    'max-requests': 'maximum number of requests made',
+}
+
+# Version of the file format written by --save-reasons.
+REASONS_FORMAT = 1
+
+# Warming the cache is purely I/O-bound, so it defaults to more concurrent
+# lookups than checking does while staying polite to the index.
+WARM_JOBS = 32
+
+
+def shard_spec(value):
+    """Parse a shard specified as 'I/N' into a (0-based) index and count."""
+    try:
+        index, count = map(int, value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+                'expected I/N (e.g. 1/4), not {0!r}'.format(value))
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(
+                'shard {0} is not between 1 and {1}'.format(index, count))
+    return index - 1, count
+
+
+def python_target(value):
+    """Parse a Python version to check for (e.g. '3' or '3.8')."""
+    if not re.match(r'\d+(\.\d+)?$', value):
+        raise argparse.ArgumentTypeError(
+                'expected a Python version like 3 or 3.8, not {0!r}'.format(
+                        value))
+    return value
+
 
 def arguments_from_cli(args):
-    """Parse and verify arguments through the CLI meet minimum requirements."""
-    description = ('Determine if a set of project dependencies will work with '
-                   'Python 3')
+    """Parse and verify arguments through the CLI meet minimum requirements.
+
+    If the first argument is 'warm' then the arguments are for warming the
+    cache instead of checking projects.
+    """
+    args = list(args)
+    if args[:1] == ['warm']:
+        command = args.pop(0)
+        description = ('Populate the result cache with everything needed to '
+                       'check a set of project dependencies')
+    else:
+        command = 'check'
+        description = ('Determine if a set of project dependencies will work '
+                       'with Python 3 (use "warm" as the first argument to '
+                       'only populate the result cache, "cache" to share '
+                       'it, "merge" to report on saved shards, or '
+                       '"ecosystem" to analyse a metadata dump)')
     parser = argparse.ArgumentParser(description=description)
     req_help = 'path(s) to a pip requirements file (e.g. requirements.txt)'
     parser.add_argument('--requirements', '-r', nargs='+', default=(),
@@ -43,35 +111,350 @@ def arguments_from_cli(args):
                         help=meta_help)
     parser.add_argument('--projects', '-p', nargs='+', default=(),
                         help='name(s) of projects to test for Python 3 support')
+    lock_help = ('path(s) to a lockfile (poetry.lock, Pipfile.lock or a '
+                 '`pip install --report` file) whose resolved dependencies '
+                 'are used instead of looking them up')
+    parser.add_argument('--lockfile', '-l', nargs='+', default=(),
+                        help=lock_help)
     parser.add_argument('--verbose', '-v', action='store_true',
                         help='verbose output (e.g. list compatibility overrides)')
+    exclude_help = ('project to skip along with everything only it depends '
+                    'on, as a name, glob (e.g. mycorp-*) or re:REGEX; may be '
+                    'repeated')
     parser.add_argument('--exclude', '-e', action='append', default=[],
-                        help='Ignore list')
+                        help=exclude_help)
+    parser.add_argument('--ported-file', action='append', default=[],
+                        metavar='PATH',
+                        help='file listing projects (or patterns, one per '
+                             'line) to treat as ported without looking up')
     index_help = 'index to to search for packages (e.g. https://pypi.org/pypi)'
     parser.add_argument('--index', '-i', default=pypi.PYPI_INDEX_URL,
                         help=index_help)
+    python_help = ('Python version to evaluate dependency markers against '
+                   '(defaults to the running interpreter)')
+    parser.add_argument('--python-version', help=python_help)
+    platform_help = ('platform to evaluate dependency markers against '
+                     '(e.g. linux, darwin, win32; defaults to the current one)')
+    parser.add_argument('--platform', help=platform_help)
+    parser.add_argument('--extras', nargs='+', default=(),
+                        help='extras to consider requested of all projects')
+    target_help = ('Python version(s) to report the blockers of separately, '
+                   'from their classifiers and requires_python (e.g. 3 for '
+                   'any Python 3, 3.8)')
+    parser.add_argument('--target', nargs='+', type=python_target,
+                        default=(), help=target_help)
+    cache_help = ('directory to cache results in, which may be shared '
+                  '(defaults to $CIU_CACHE_DIR or the user cache directory)')
+    parser.add_argument('--cache-dir', default=None, help=cache_help)
+    parser.add_argument('--no-cache', action='store_true',
+                        help='do not cache any results')
+    batch_help = ('ask the index about all the projects found at each level '
+                  'of dependencies in one request (for indexes supporting '
+                  'batch queries; others are asked one project at a time)')
+    parser.add_argument('--batch', action='store_true', help=batch_help)
+    changelog_help = ("invalidate the cached results of projects changed on "
+                      "the index since the last run (using the index's "
+                      "changelog) instead of expiring them by age")
+    parser.add_argument('--changelog', action='store_true',
+                        help=changelog_help)
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help='number of concurrent lookups (defaults to the '
+                             'CPU count)')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='seconds to wait on each request to the index '
+                             '(default: {0})'.format(pypi.DEFAULT_TIMEOUT))
+    deadline_help = ('seconds the whole run may take before stopping with '
+                     'the results found so far (exit code 4)')
+    parser.add_argument('--deadline', type=float, default=None,
+                        help=deadline_help)
+    parser.add_argument('--max-depth', type=int, default=None,
+                        help='only look up dependencies up to this many '
+                             'levels below the specified projects')
+    parser.add_argument('--max-requests', type=int, default=None,
+                        help='maximum number of lookups to make')
+    parser.add_argument('--fail-fast', action='store_true',
+                        help='stop at the first confirmed blocker (only '
+                             'the blockers found by then are reported)')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS,
+                        default=OUTPUT_FORMATS[0], help='output format')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='split the projects into shards checked by this '
+                             'many processes')
+    shard_help = ('only check shard I of N of the projects (e.g. one per '
+                  'machine, sharing a cache directory) and save what was '
+                  'found with --save-reasons for "merge"')
+    parser.add_argument('--shard', type=shard_spec, metavar='I/N',
+                        help=shard_help)
+    parser.add_argument('--save-reasons', metavar='PATH',
+                        help='file to save the reasons found for a shard in')
+    recording = parser.add_mutually_exclusive_group()
+    recording.add_argument('--record', metavar='PATH',
+                           help='record all index traffic into a cassette '
+                                'file (disables the cache)')
+    recording.add_argument('--replay', metavar='PATH',
+                           help='replay index traffic from a cassette file '
+                                'instead of using the network')
     parsed = parser.parse_args(args)
-    if not (parsed.requirements or parsed.metadata or parsed.projects):
-        parser.error("Missing 'requirements', 'metadata', or 'projects'")
+    parsed.command = command
+    # --deadline bounds the whole run, reading the inputs included.
+    parsed.started = _now()
+    if not (parsed.requirements or parsed.metadata or parsed.projects or
+            parsed.lockfile):
+        parser.error("Missing 'requirements', 'metadata', 'projects', or "
+                     "'lockfile'")
+    if command == 'warm' and (parsed.no_cache or parsed.record or
+                              parsed.replay):
+        parser.error("'warm' requires the result cache")
+    if bool(parsed.shard) != bool(parsed.save_reasons):
+        parser.error('--shard and --save-reasons must be used together')
+    if (parsed.processes or parsed.shard) and (parsed.no_cache or
+                                               parsed.record or parsed.replay):
+        # Shards can only reuse each other's lookups through the cache.
+        parser.error('--processes and --shard require the result cache')
+    if parsed.target and (parsed.processes or parsed.shard):
+        parser.error('--target can not be used with --processes or --shard')
     if parsed.verbose:
         logging.getLogger('ciu').setLevel(logging.INFO)
 
     return parsed
 
 
-def projects_from_parsed(parsed):
-    """Take parsed arguments from CLI to create a list of specified projects."""
+def cache_arguments_from_cli(args):
+    """Parse the arguments for managing the result cache."""
+    parser = argparse.ArgumentParser(
+            prog='caniusepython3 cache',
+            description='Share the result cache through bundle files')
+    parser.add_argument('action', choices=['export', 'import'],
+                        help='write the cache into a bundle or merge bundles '
+                             'into the cache')
+    parser.add_argument('bundles', nargs='+', metavar='BUNDLE',
+                        help='path(s) of bundle files (only one for export)')
+    cache_help = ('directory of the result cache (defaults to $CIU_CACHE_DIR '
+                  'or the user cache directory)')
+    parser.add_argument('--cache-dir', default=None, help=cache_help)
+    parsed = parser.parse_args(args)
+    if parsed.action == 'export' and len(parsed.bundles) > 1:
+        parser.error('only one bundle can be exported to')
+    return parsed
+
+
+def merge_arguments_from_cli(args):
+    """Parse the arguments for reporting on saved shards."""
+    parser = argparse.ArgumentParser(
+            prog='caniusepython3 merge',
+            description='Report on the reasons saved for every shard')
+    parser.add_argument('paths', nargs='+', metavar='PATH',
+                        help='files saved with --save-reasons')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS,
+                        default=OUTPUT_FORMATS[0], help='output format')
+    return parser.parse_args(args)
+
+
+def ecosystem_arguments_from_cli(args):
+    """Parse the arguments for analysing a metadata dump."""
+    parser = argparse.ArgumentParser(
+            prog='caniusepython3 ecosystem',
+            description='Rank every project in a metadata dump by its '
+                        'blockers and by how many projects it blocks')
+    parser.add_argument('dumps', nargs='+', metavar='DUMP',
+                        help='JSON lines file(s) of release metadata '
+                             '(optionally gzipped)')
+    parser.add_argument('--target', type=python_target, default='3',
+                        help='Python version to judge projects for (e.g. 3 '
+                             'for any Python 3, 3.8)')
+    parser.add_argument('--python-version',
+                        help='Python version to evaluate dependency markers '
+                             'against (defaults to the running interpreter)')
+    parser.add_argument('--platform',
+                        help='platform to evaluate dependency markers against')
+    parser.add_argument('--extras', nargs='+', default=(),
+                        help='extras to consider requested of all projects')
+    parser.add_argument('--top', type=int, default=20,
+                        help='number of projects to list in each ranking '
+                             '(0 for all)')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS,
+                        default=OUTPUT_FORMATS[0], help='output format')
+    return parser.parse_args(args)
+
+
+def analyse_ecosystem(parsed):
+    """Report on the blockers of every project in the dumps specified."""
+    # Imported here as NumPy and SciPy are slow to import.
+    from caniusepython3 import ecosystem
+    environment = environment_from_parsed(parsed)
+    try:
+        graph = ecosystem.load_dump(parsed.dumps, environment, parsed.target)
+        analysis = ecosystem.analyse(graph)
+    except ImportError as exc:
+        sys.exit('error: {0}'.format(exc))
+    top = parsed.top or None
+    blocked = ecosystem.ranked(graph.names, analysis.blockers, top)
+    unblocks = ecosystem.ranked(graph.names, analysis.unblocks, top)
+    blocking = int((~graph.ported).sum())
+    if parsed.format == 'json':
+        document = {'projects': len(graph.names), 'blocking': blocking,
+                    'blocked': [[name, int(count)] for name, count in blocked],
+                    'unblocks': [[name, int(count)]
+                                 for name, count in unblocks]}
+        print(json.dumps(document, indent=2, sort_keys=True))
+        return
+    print('{0} of {1} projects are blocking'.format(blocking,
+                                                    len(graph.names)))
+    if blocked:
+        print('\nProjects with the most blockers:')
+        for name, count in blocked:
+            print('  {0}: {1}'.format(name, count))
+    if unblocks:
+        print('\nProjects which would unblock the most others if ported:')
+        for name, count in unblocks:
+            print('  {0}: {1}'.format(name, count))
+
+
+def save_reasons(path, reasons, shard):
+    """Save the reasons found for a shard."""
+    document = {'format': REASONS_FORMAT, 'shard': list(shard),
+                'reasons': reasons}
+    with io.open(path, 'w', encoding='utf-8') as file:
+        file.write(json.dumps(document, indent=2, sort_keys=True))
+
+
+def load_reasons(path):
+    """Load the (shard, reasons) saved by save_reasons()."""
+    with io.open(path, encoding='utf-8') as file:
+        try:
+            document = json.load(file)
+        except ValueError:
+            document = None
+    if (not isinstance(document, dict) or
+            document.get('format') != REASONS_FORMAT):
+        raise ValueError('{0} is not a saved shard'.format(path))
+    return tuple(document['shard']), document['reasons']
+
+
+def merge(paths, output_format='text'):
+    """Report on the blockers of every shard saved in the paths."""
+    saved = sorted(map(load_reasons, paths), key=lambda pair: pair[0])
+    counts = {count for (_, count), _ in saved}
+    indexes = {index for (index, _), _ in saved}
+    if len(counts) != 1 or len(indexes) != len(saved):
+        raise ValueError('the saved shards are not from the same run')
+    missing = set(range(counts.pop())) - indexes
+    if missing:
+        raise ValueError('missing shard(s) {0}'.format(
+                ', '.join(str(index + 1) for index in sorted(missing))))
+    reasons = dependencies.merge_reasons(reasons for _, reasons in saved)
+    blockers = dependencies.reasons_to_paths(reasons)
+    report(blockers, output_format)
+    return len(blockers) == 0
+
+
+def manage_cache(parsed):
+    """Export or import cache bundles as specified through the CLI."""
+    result_cache = cache.ResultCache(parsed.cache_dir or
+                                     cache.default_directory())
+    if parsed.action == 'export':
+        count = result_cache.export_bundle(parsed.bundles[0])
+        print('Exported {0} entr{1} to {2}'.format(
+                count, 'y' if count == 1 else 'ies', parsed.bundles[0]))
+    else:
+        for bundle in parsed.bundles:
+            read, stored = result_cache.import_bundle(bundle)
+            print('Imported {0} of {1} entr{2} from {3}'.format(
+                    stored, read, 'y' if read == 1 else 'ies', bundle))
+
+
+def iter_projects_from_parsed(parsed, locked=None):
+    """Yield the projects specified through the CLI as the inputs are read.
+
+    The quickest inputs to read come first, and the projects of each file are
+    yielded as soon as it has been read. A project may be yielded more than
+    once. The 'locked' argument is the projects.LockedGraph read from the
+    lockfiles.
+    """
     projects = []
-    projects.extend(projects_.projects_from_requirements(parsed.requirements))
-    metadata = []
-    for metadata_path in parsed.metadata:
-        with io.open(metadata_path) as file:
-            metadata.append(file.read())
-    projects.extend(projects_.projects_from_metadata(metadata))
+    if locked is not None:
+        projects.extend(dependencies.requirement_names(
+                locked.requirements, environment_from_parsed(parsed)))
     projects.extend(map(packaging.utils.canonicalize_name, parsed.projects))
+    streams = [projects]
+    streams.extend(projects_.projects_from_requirements([path])
+                   for path in parsed.requirements)
+    streams.append(projects_.projects_from_metadata_files(parsed.metadata))
+    excluded = excluded_from_parsed(parsed)
+    for project in itertools.chain.from_iterable(streams):
+        if not excluded(project):
+            yield project
+
+
+def projects_from_parsed(parsed, locked=None):
+    """Take parsed arguments from CLI to create a list of specified projects.
+
+    The 'locked' argument is the projects.LockedGraph read from the lockfiles.
+    """
+    return set(iter_projects_from_parsed(parsed, locked))
+
+
+def excluded_from_parsed(parsed):
+    """Create the matcher of the projects excluded through the CLI."""
+    patterns = list(parsed.exclude)
+    patterns.extend(projects_.patterns_from_files(parsed.ported_file))
+    return projects_.ProjectMatcher(patterns)
+
+
+def versions_from_parsed(parsed, locked=None):
+    """Map the projects pinned through the CLI to their versions.
+
+    Pins in requirements files take precedence over locked versions.
+    """
+    versions = {} if locked is None else dict(locked.versions)
+    versions.update(projects_.pinned_versions(parsed.requirements))
+    return versions
+
+
+def environment_from_parsed(parsed):
+    """Create the target environment specified through the CLI."""
+    return dependencies.target_environment(parsed.python_version,
+                                           parsed.platform, parsed.extras)
+
 
-    projects = {i for i in projects if i not in parsed.exclude}
-    return projects
+def deadline_from_parsed(parsed):
+    """Return the seconds left before the deadline specified through the CLI.
+
+    None is returned if there is no deadline.
+    """
+    if parsed.deadline is None:
+        return None
+    return max(0, parsed.deadline - (_now() - parsed.started))
+
+
+def cache_from_parsed(parsed):
+    """Create the result cache requested through the CLI (if any).
+
+    With --changelog, the cache is synced with the index's changelog.
+    """
+    # Cached results would keep requests from being recorded or replayed.
+    if parsed.no_cache or parsed.record or parsed.replay:
+        return None
+    result_cache = cache.ResultCache(parsed.cache_dir or
+                                     cache.default_directory())
+    if parsed.changelog:
+        pypi.sync_cache(result_cache, parsed.index, parsed.timeout)
+    return result_cache
+
+
+def batch_from_parsed(parsed):
+    """Create the batch query protocol requested through the CLI (if any)."""
+    return pypi.JSONBatchProtocol() if parsed.batch else None
+
+
+def cassette_from_parsed(parsed):
+    """Create the cassette requested through the CLI (if any)."""
+    if parsed.record:
+        return cassette.Cassette(parsed.record, 'record')
+    elif parsed.replay:
+        return cassette.Cassette(parsed.replay, 'replay')
+    else:
+        return None
 
 
 def message(blockers):
@@ -106,7 +489,7 @@ def message(blockers):
     return formatted_need, formatted_can_port
 
 
-def pprint_blockers(blockers):
+def pprint_blockers(blockers, unresolved=()):
     """Pretty print blockers into a sequence of strings.
 
     Results will be sorted by top-level project name. This means that if a
@@ -114,6 +497,9 @@ def pprint_blockers(blockers):
     what is used in the sorting, not the project at the bottom of the
     dependency graph.
 
+    Blockers in 'unresolved' did not have their dependencies checked, so they
+    are marked as truncated.
+
     """
     pprinted = []
     for blocker in sorted(blockers, key=lambda x: tuple(reversed(x))):
@@ -122,31 +508,330 @@ def pprint_blockers(blockers):
             buf.append(' (which is blocking ')
             buf.append(', which is blocking '.join(blocker[1:]))
             buf.append(')')
+        if blocker[0] in unresolved:
+            buf.append(' [truncated]')
         pprinted.append(''.join(buf))
     return pprinted
 
 
-def check(projects, index_url=pypi.PYPI_INDEX_URL):
-    """Check the specified projects for Python 3 compatibility."""
+def json_blockers(blockers, incomplete=None, fail_fast=False):
+    """Create a JSON document describing the blockers.
+
+    If finding the blockers did not finish then 'incomplete' is the
+    dependencies.IncompleteResolution explaining why. If 'fail_fast' was used
+    then any blockers found may not be all of them.
+    """
+    document = {'ported': not blockers and incomplete is None,
+                'blockers': sorted(map(list, blockers),
+                                   key=lambda x: tuple(reversed(x)))}
+    if fail_fast and blockers:
+        document['incomplete'] = 'fail-fast'
+    if incomplete is not None:
+        document['incomplete'] = incomplete.reason
+        document['unresolved'] = sorted(incomplete.unresolved)
+        document['truncated'] = [path for path in document['blockers']
+                                 if path[0] in incomplete.unresolved]
+    return json.dumps(document, indent=2, sort_keys=True)
+
+
+def check(projects, index_url=pypi.PYPI_INDEX_URL, environment=None,
+          versions={}, cache=None, max_workers=None, timeout=None,
+          output_format='text', deadline=None, fail_fast=False,
+          max_depth=None, max_requests=None, processes=None, graph=None,
+          batch=None, targets=(), executor=None, overrides=None,
+          session=None, excluded=None):
+    """Check the specified projects for Python 3 compatibility.
+
+    If the check stops early (including when cut short by 'max_depth' or
+    'max_requests') then what was found is reported before
+    dependencies.IncompleteResolution is re-raised. With 'fail_fast', checking
+    stops at the first confirmed blocker. If 'processes' is more than 1 then
+    the projects are split into that many shards which are checked by separate
+    processes. The 'graph', 'batch' and 'excluded' arguments are those of
+    dependencies.blockers().
+
+    If 'targets' are specified then the blockers of each of those Python
+    versions are found in a single search and reported separately, and the
+    check only passes if nothing blocks any of them.
+
+    The 'executor', 'overrides' and 'session' arguments are shared with the
+    search, as dependencies.blockers() explains (they can't be used along
+    with 'processes').
+    """
     log = logging.getLogger('ciu')
     log.info('{0} top-level projects to check'.format(len(projects)))
-    print('Finding and checking dependencies ...')
-    blockers = dependencies.blockers(projects, index_url)
+    if output_format == 'text':
+        print('Finding and checking dependencies ...')
+    options = dict(environment=environment, versions=versions, cache=cache,
+                   max_workers=max_workers, timeout=timeout,
+                   deadline=deadline, fail_fast=fail_fast,
+                   max_depth=max_depth, max_requests=max_requests,
+                   graph=graph, batch=batch, excluded=excluded)
+    shared = dict(executor=executor, overrides=overrides, session=session)
+    options.update((name, value) for name, value in shared.items()
+                   if value is not None)
+    incomplete = None
+    try:
+        if targets:
+            by_target = dependencies.target_reasons(projects, targets,
+                                                    index_url, **options)
+            blockers_by_target = [
+                    (target, dependencies.reasons_to_paths(by_target[target]))
+                    for target in targets]
+            report_targets(blockers_by_target, output_format, fail_fast)
+            return not any(blockers for _, blockers in blockers_by_target)
+        elif processes and processes > 1:
+            blockers = dependencies.sharded_blockers(projects, processes,
+                                                     index_url=index_url,
+                                                     **options)
+        else:
+            blockers = dependencies.blockers(projects, index_url, **options)
+    except dependencies.IncompleteResolution as exc:
+        incomplete = exc
+        blockers = exc.blockers
 
-    print('')
-    for line in message(blockers):
-        print(line)
+    report(blockers, output_format, incomplete, fail_fast)
+    if incomplete is not None:
+        raise incomplete
+    return len(blockers) == 0
 
-    print('')
-    for line in pprint_blockers(blockers):
-        print(' ', line)
 
-    return len(blockers) == 0
+def report(blockers, output_format='text', incomplete=None, fail_fast=False):
+    """Print the report on the blockers.
+
+    The 'incomplete' argument is the dependencies.IncompleteResolution raised
+    if finding the blockers stopped early.
+    """
+    if output_format == 'json':
+        print(json_blockers(blockers, incomplete, fail_fast))
+    else:
+        if incomplete is not None:
+            print('')
+            print('Stopped early ({0}); results are incomplete.'.format(
+                    STOPPED_REASONS.get(incomplete.reason, incomplete.reason)))
+        elif fail_fast and blockers:
+            print('')
+            print('Stopped at the first confirmed blocker; others may exist.')
+        print('')
+        for line in message(blockers):
+            print(line)
+
+        print('')
+        unresolved = () if incomplete is None else incomplete.unresolved
+        for line in pprint_blockers(blockers, unresolved):
+            print(' ', line)
+
+        if incomplete is not None:
+            print('')
+            print('Unresolved projects ({0}): {1}'.format(
+                    len(incomplete.unresolved),
+                    ', '.join(sorted(incomplete.unresolved))))
+
+
+def report_targets(blockers_by_target, output_format='text', fail_fast=False):
+    """Print the report on the blockers of several targets.
+
+    The 'blockers_by_target' argument is a sequence of (target, blockers)
+    pairs.
+    """
+    if output_format == 'json':
+        document = {'targets': {}}
+        for target, blockers in blockers_by_target:
+            document['targets'][target] = {
+                    'ported': not blockers,
+                    'blockers': sorted(map(list, blockers),
+                                       key=lambda x: tuple(reversed(x)))}
+        if fail_fast and any(blockers for _, blockers in blockers_by_target):
+            document['incomplete'] = 'fail-fast'
+        print(json.dumps(document, indent=2, sort_keys=True))
+        return
+    if fail_fast and any(blockers for _, blockers in blockers_by_target):
+        print('')
+        print('Stopped at the first confirmed blocker; others may exist.')
+    for target, blockers in blockers_by_target:
+        flattened_blockers = set()
+        for path in blockers:
+            flattened_blockers.update(path)
+        print('')
+        print('Python {0}: {1} project{2} blocking'.format(
+                target, len(flattened_blockers),
+                's' if len(flattened_blockers) != 1 else ''))
+        for line in pprint_blockers(blockers):
+            print(' ', line)
+
+
+def start_lookups(parsed, locked, environment, versions, result_cache):
+    """Read the projects specified through the CLI while looking them up.
+
+    The overrides are fetched and the top-level projects looked up (see
+    dependencies.prefetched()) while the inputs are still being read. Lookups
+    which haven't started once every input is read are cancelled, as the
+    search makes them itself in its own order (e.g. likely blockers first).
+    Returns the projects along with the resources shared with the search, as
+    keyword arguments for check().
+    """
+    jobs = parsed.jobs or pypi.CPU_COUNT
+    executor = concurrent.futures.ThreadPoolExecutor(jobs)
+    overrides = executor.submit(pypi.manual_overrides)
+    session = requests.Session()
+    # Let every worker keep a connection to the index open.
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=jobs)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    # Without a cache to keep them in, lookups finished before the search
+    # starts would be lost.
+    if result_cache is None:
+        memory = cache.MemoryCache()
+    else:
+        memory = cache.MemoryCache(max_age=result_cache.max_age,
+                                   backing=result_cache)
+        memory.trusted_since = result_cache.trusted_since
+    prefetches = []
+    try:
+        projects = set(dependencies.prefetched(
+                iter_projects_from_parsed(parsed, locked), executor,
+                parsed.index, environment, versions, memory, parsed.timeout,
+                session, locked.graph, overrides, prefetches))
+    finally:
+        # Lookups already running are joined by the search instead.
+        for future in prefetches:
+            future.cancel()
+    return projects, dict(cache=memory, executor=executor,
+                          overrides=overrides.result(), session=session)
+
+
+def check_parsed(parsed):
+    """Check the projects specified through the CLI.
+
+    Unless the projects are split between processes or the number of
+    requests is bounded, they are looked up while the inputs are read.
+    """
+    locked = projects_.read_lockfiles(parsed.lockfile)
+    environment = environment_from_parsed(parsed)
+    versions = versions_from_parsed(parsed, locked)
+    result_cache = cache_from_parsed(parsed)
+    batch = batch_from_parsed(parsed)
+    shared = dict(cache=result_cache)
+    if ((parsed.processes or 1) > 1 or parsed.max_requests is not None or
+            batch is not None):
+        projects = projects_from_parsed(parsed, locked)
+    else:
+        projects, shared = start_lookups(parsed, locked, environment,
+                                         versions, result_cache)
+    try:
+        return check(projects, parsed.index, environment, versions,
+                     max_workers=parsed.jobs, timeout=parsed.timeout,
+                     output_format=parsed.format,
+                     deadline=deadline_from_parsed(parsed),
+                     fail_fast=parsed.fail_fast, max_depth=parsed.max_depth,
+                     max_requests=parsed.max_requests,
+                     processes=parsed.processes, graph=locked.graph,
+                     batch=batch, targets=parsed.target,
+                     excluded=excluded_from_parsed(parsed), **shared)
+    finally:
+        if 'executor' in shared:
+            # Don't wait on lookups which are still running after being
+            # stopped.
+            shared['executor'].shutdown(wait=False)
+            shared['session'].close()
+
+
+def shard_parsed(parsed):
+    """Find the reasons for the shard of projects specified through the CLI."""
+    index, count = parsed.shard
+    locked = projects_.read_lockfiles(parsed.lockfile)
+    projects = dependencies.shard(sorted(projects_from_parsed(parsed, locked)),
+                                  index, count)
+    print('Checking shard {0} of {1} ({2} project{3}) ...'.format(
+            index + 1, count, len(projects),
+            's' if len(projects) != 1 else ''))
+    reasons = dependencies.blocker_reasons(
+            projects, parsed.index, environment_from_parsed(parsed),
+            versions_from_parsed(parsed, locked), cache_from_parsed(parsed),
+            parsed.jobs, parsed.timeout, deadline_from_parsed(parsed),
+            fail_fast=parsed.fail_fast, max_depth=parsed.max_depth,
+            max_requests=parsed.max_requests, graph=locked.graph,
+            batch=batch_from_parsed(parsed),
+            excluded=excluded_from_parsed(parsed))
+    save_reasons(parsed.save_reasons, reasons, parsed.shard)
+    print('Saved to {0}'.format(parsed.save_reasons))
+    return True
+
+
+def warm(projects, index_url=pypi.PYPI_INDEX_URL, environment=None,
+         versions={}, cache=None, max_workers=WARM_JOBS, timeout=None,
+         deadline=None, graph=None, batch=None, excluded=None):
+    """Populate the cache with the lookups needed to check the projects."""
+    log = logging.getLogger('ciu')
+    log.info('{0} top-level projects to warm the cache for'.format(
+                len(projects)))
+    try:
+        dependencies.blockers(projects, index_url, environment=environment,
+                              versions=versions, cache=cache,
+                              max_workers=max_workers, timeout=timeout,
+                              deadline=deadline, graph=graph, batch=batch,
+                              excluded=excluded, closures=False)
+    finally:
+        print('Fetched {0}, refreshed {1}, and skipped {2} cached '
+              'lookup{3}'.format(cache.stats['missing'],
+                                 cache.stats['expired'], cache.stats['hit'],
+                                 's' if cache.stats['hit'] != 1 else ''))
+    return True
+
+
+def warm_parsed(parsed):
+    """Warm the cache for the projects specified through the CLI."""
+    locked = projects_.read_lockfiles(parsed.lockfile)
+    return warm(projects_from_parsed(parsed, locked), parsed.index,
+                environment_from_parsed(parsed),
+                versions_from_parsed(parsed, locked), cache_from_parsed(parsed),
+                parsed.jobs or WARM_JOBS, parsed.timeout,
+                deadline_from_parsed(parsed),
+                locked.graph, batch_from_parsed(parsed),
+                excluded_from_parsed(parsed))
 
 
 def main(args=sys.argv[1:]):
+    if list(args[:1]) == ['cache']:
+        try:
+            manage_cache(cache_arguments_from_cli(args[1:]))
+        except (cache.BundleError, IOError) as exc:
+            sys.exit('error: {0}'.format(exc))
+        return
+    if list(args[:1]) == ['ecosystem']:
+        parsed = ecosystem_arguments_from_cli(args[1:])
+        try:
+            analyse_ecosystem(parsed)
+        except (ValueError, IOError) as exc:
+            sys.exit('error: {0}'.format(exc))
+        return
+    if list(args[:1]) == ['merge']:
+        parsed = merge_arguments_from_cli(args[1:])
+        try:
+            passed = merge(parsed.paths, parsed.format)
+        except (ValueError, IOError) as exc:
+            sys.exit('error: {0}'.format(exc))
+        if not passed:
+            sys.exit(3)
+        return
     parsed = arguments_from_cli(args)
-    passed = check(projects_from_parsed(parsed), parsed.index)
+    if parsed.command == 'warm':
+        run = warm_parsed
+    elif parsed.shard:
+        run = shard_parsed
+    else:
+        run = check_parsed
+    try:
+        recording = cassette_from_parsed(parsed)
+        if recording is None:
+            passed = run(parsed)
+        else:
+            with cassette.inserted(recording):
+                passed = run(parsed)
+    except (cassette.ReplayError, projects_.LockfileError) as exc:
+        sys.exit('error: {0}'.format(exc))
+    except dependencies.IncompleteResolution:
+        sys.exit(4)
     if not passed:
       sys.exit(3)
 
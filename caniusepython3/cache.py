@@ -0,0 +1,355 @@
+# Copyright 2014 Google Inc. All rights reserved.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""On-disk cache of index lookup results."""
+
+from __future__ import unicode_literals
+
+import collections
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import zlib
+
+
+def default_directory():
+    """Return the directory to use for the cache.
+
+    The CIU_CACHE_DIR environment variable takes precedence, e.g. to point at a
+    directory shared between machines. Otherwise the user's cache directory is
+    used.
+    """
+    directory = os.environ.get('CIU_CACHE_DIR')
+    if directory:
+        return directory
+    base = (os.environ.get('XDG_CACHE_HOME') or os.environ.get('LOCALAPPDATA')
+            or os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'caniusepython3')
+
+
+# How long, in seconds, results which can change are trusted for by default.
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+# How many results a MemoryCache holds by default.
+DEFAULT_MAX_ENTRIES = 10000
+
+# Version of the bundle file format written by ResultCache.export_bundle().
+BUNDLE_FORMAT = 1
+
+# Prefixes of the keys which pypi.sync_cache() keeps its changelog serial and
+# its record of the stored closures under. They only hold for the cache they
+# were stored in, so they are never bundled.
+_LOCAL_KEY_PREFIXES = ('serial:', 'closures:')
+
+
+class BundleError(Exception):
+    """Raised when a file is not a usable cache bundle."""
+
+
+class ResultCache(object):
+
+    """A directory of lookup results stored as JSON.
+
+    Every entry is kept in its own file which is replaced atomically, so a
+    directory can be shared by concurrent processes without locking. Entries
+    expire after 'max_age' seconds unless they were stored as immutable.
+    """
+
+    def __init__(self, directory, max_age=DEFAULT_MAX_AGE):
+        self.directory = directory
+        self.max_age = max_age
+        # Entries stored from this time on never expire, as they are
+        # invalidated when they change instead (see pypi.sync_cache()).
+        self.trusted_since = None
+        # Counts of get() outcomes: 'hit', 'expired', and 'missing'.
+        self.stats = collections.Counter()
+        self._stats_lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks can't be pickled (e.g. to pass the cache to another process).
+        state = self.__dict__.copy()
+        del state['_stats_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._stats_lock = threading.Lock()
+
+    def _count(self, outcome):
+        with self._stats_lock:
+            self.stats[outcome] += 1
+
+    def _path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + '.json')
+
+    def _read(self, path):
+        try:
+            with io.open(path, encoding='utf-8') as file:
+                return json.load(file)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _write(self, entry):
+        log = logging.getLogger('ciu')
+        path = self._path(entry['key'])
+        try:
+            directory = os.path.dirname(path)
+            if not os.path.isdir(directory):
+                try:
+                    os.makedirs(directory)
+                except OSError:
+                    # Another process may have just created it.
+                    if not os.path.isdir(directory):
+                        raise
+            fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with io.open(fd, 'wb') as file:
+                file.write(json.dumps(entry, sort_keys=True).encode('utf-8'))
+            getattr(os, 'replace', os.rename)(temp_path, path)
+        except (IOError, OSError) as exc:
+            # Caching is an optimization, so never fail a run over it.
+            log.warning('could not cache {0} ({1})'.format(entry['key'], exc))
+
+    def entry(self, key):
+        """Return the unexpired entry stored for the key, or None."""
+        entry = self._read(self._path(key))
+        # Guard against the (unlikely) case of a hash collision.
+        if entry is None or entry.get('key') != key:
+            self._count('missing')
+            return None
+        if expired(entry, self.max_age, self.trusted_since):
+            self._count('expired')
+            return None
+        self._count('hit')
+        return entry
+
+    def get(self, key):
+        """Return the value stored for the key, or None if there isn't one."""
+        entry = self.entry(key)
+        return None if entry is None else entry['value']
+
+    def invalidate(self, key):
+        """Remove the entry stored for the key (if there is one)."""
+        path = self._path(key)
+        entry = self._read(path)
+        if entry is None or entry.get('key') != key:
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            # Another process may have just removed it.
+            pass
+
+    def set(self, key, value, immutable=False):
+        """Store a JSON-serializable value for the key.
+
+        Immutable values never expire.
+        """
+        self._write({'key': key, 'value': value, 'stored': time.time(),
+                     'immutable': immutable})
+
+    def entries(self):
+        """Yield every stored entry (including expired ones)."""
+        if not os.path.isdir(self.directory):
+            return
+        for subdirectory in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, subdirectory)
+            if not os.path.isdir(path):
+                continue
+            for filename in sorted(os.listdir(path)):
+                if filename.endswith('.json'):
+                    entry = self._read(os.path.join(path, filename))
+                    if entry is not None:
+                        yield entry
+
+    def prune(self):
+        """Remove every expired entry. Returns the number removed."""
+        removed = 0
+        for entry in list(self.entries()):
+            if expired(entry, self.max_age, self.trusted_since):
+                self.invalidate(entry['key'])
+                removed += 1
+        return removed
+
+    def merge(self, entry):
+        """Store an entry unless the one already stored is newer.
+
+        Returns True if the entry was stored.
+        """
+        stored = self._read(self._path(entry['key']))
+        if (stored is not None and stored.get('key') == entry['key'] and
+                stored['stored'] >= entry['stored']):
+            return False
+        self._write(entry)
+        return True
+
+    def export_bundle(self, path):
+        """Write every entry into a single compressed bundle file.
+
+        The bookkeeping of pypi.sync_cache() is left out. Returns the number
+        of entries exported.
+        """
+        count = 0
+        temp_path = path + '.tmp'
+        with gzip.open(temp_path, 'wb') as file:
+            header = {'format': BUNDLE_FORMAT, 'created': time.time()}
+            file.write(json.dumps(header).encode('utf-8') + b'\n')
+            for entry in self.entries():
+                if entry['key'].startswith(_LOCAL_KEY_PREFIXES):
+                    continue
+                file.write(json.dumps(entry, sort_keys=True).encode('utf-8') +
+                           b'\n')
+                count += 1
+        getattr(os, 'replace', os.rename)(temp_path, path)
+        return count
+
+    def import_bundle(self, path):
+        """Merge the entries of a bundle file created by export_bundle().
+
+        Newer entries win, so bundles from several sources can be imported in
+        any order. Changes to the projects of imported entries may not have
+        been seen by the changelog serial kept by pypi.sync_cache(), so once
+        any are stored it is dropped and cached results expire as usual until
+        the next sync. Returns the number of entries read and how many of
+        them were stored.
+        """
+        read = stored = 0
+        serial_keys = [entry['key'] for entry in self.entries()
+                       if entry['key'].startswith('serial:')]
+        with gzip.open(path, 'rb') as file:
+            read_bundle_header(file, path)
+            try:
+                for line in file:
+                    read += 1
+                    entry = json.loads(line.decode('utf-8'))
+                    if not isinstance(entry, dict) or not {
+                            'key', 'value', 'stored'} <= set(entry):
+                        raise ValueError('not a cache entry')
+                    if entry['key'].startswith(_LOCAL_KEY_PREFIXES):
+                        # Bundled by an older caniusepython3.
+                        continue
+                    if self.merge(entry):
+                        stored += 1
+            except (EOFError, zlib.error, ValueError) as exc:
+                raise BundleError('{0} is corrupt at entry {1} ({2})'.format(
+                        path, read, exc))
+        if stored:
+            for key in serial_keys:
+                self.invalidate(key)
+            self.trusted_since = None
+        return read, stored
+
+
+class MemoryCache(object):
+
+    """A bounded, thread-safe in-memory cache of lookup results.
+
+    Once 'max_entries' entries are held, the least recently used one is evicted
+    to make room. Entries expire like those of ResultCache. If a 'backing'
+    ResultCache is provided then misses are looked up in it and everything
+    stored is also stored there.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_age=DEFAULT_MAX_AGE, backing=None):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.trusted_since = None
+        self.backing = backing
+        # Counts of get() outcomes: 'hit', 'expired', and 'missing'.
+        self.stats = collections.Counter()
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _remember(self, entry):
+        with self._lock:
+            self._entries.pop(entry['key'], None)
+            self._entries[entry['key']] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def entry(self, key):
+        """Return the unexpired entry stored for the key, or None."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                outcome = 'missing'
+            elif expired(entry, self.max_age, self.trusted_since):
+                outcome = 'expired'
+                entry = None
+            else:
+                outcome = 'hit'
+                # Re-inserting marks the entry as the most recently used.
+                self._entries[key] = entry
+            self.stats[outcome] += 1
+        if entry is None and self.backing is not None:
+            entry = self.backing.entry(key)
+            if entry is not None:
+                self._remember(entry)
+        return entry
+
+    def get(self, key):
+        """Return the value stored for the key, or None if there isn't one."""
+        entry = self.entry(key)
+        return None if entry is None else entry['value']
+
+    def set(self, key, value, immutable=False):
+        """Store a value for the key.
+
+        Immutable values never expire.
+        """
+        self._remember({'key': key, 'value': value, 'stored': time.time(),
+                        'immutable': immutable})
+        if self.backing is not None:
+            self.backing.set(key, value, immutable)
+
+    def invalidate(self, key):
+        """Remove the entry stored for the key (if there is one)."""
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.backing is not None:
+            self.backing.invalidate(key)
+
+
+def expired(entry, max_age, trusted_since=None):
+    """Check if an entry has expired.
+
+    Immutable entries and those stored since 'trusted_since' never expire.
+    """
+    if entry.get('immutable'):
+        return False
+    if trusted_since is not None and entry['stored'] >= trusted_since:
+        return False
+    return time.time() - entry['stored'] > max_age
+
+
+def read_bundle_header(file, path):
+    """Read and validate the header of a bundle file."""
+    try:
+        header = json.loads(file.readline().decode('utf-8'))
+    except (IOError, EOFError, zlib.error, ValueError):
+        raise BundleError('{0} is not a cache bundle'.format(path))
+    if not isinstance(header, dict) or header.get('format') != BUNDLE_FORMAT:
+        raise BundleError('{0} has an unsupported bundle format'.format(path))
+    return header
@@ -0,0 +1,147 @@
+# Copyright 2014 Google Inc. All rights reserved.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Record and replay the traffic to indexes.
+
+A cassette is an SQLite database of every request made (keyed by the kind of
+request and what was requested) along with its compressed response. While a
+cassette is inserted, all index traffic goes through it.
+"""
+
+from __future__ import unicode_literals
+
+import requests
+
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+
+FORMAT_VERSION = 1
+
+_active = None
+
+
+class ReplayError(LookupError):
+    """Raised when replaying a request that was never recorded."""
+
+
+class Cassette(object):
+
+    """Recorded index traffic.
+
+    In 'record' mode every response is fetched and kept, and the cassette file
+    is written by close(). In 'replay' mode the whole file is read into memory
+    and nothing is ever fetched.
+    """
+
+    def __init__(self, path, mode):
+        if mode not in ('record', 'replay'):
+            raise ValueError('unknown cassette mode: {0!r}'.format(mode))
+        self.path = path
+        self.mode = mode
+        self._responses = {}
+        self._lock = threading.Lock()
+        if mode == 'replay':
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise ReplayError('no cassette at {0}'.format(self.path))
+        connection = sqlite3.connect(self.path)
+        try:
+            rows = connection.execute(
+                    'SELECT kind, key, status, body FROM responses')
+            for kind, key, status, body in rows:
+                self._responses[kind, key] = status, zlib.decompress(bytes(body))
+        finally:
+            connection.close()
+
+    def play(self, kind, key, fetch):
+        """Return the (status, body) response for a request.
+
+        The 'fetch' argument is called to make the request when recording.
+        """
+        if self.mode == 'replay':
+            try:
+                return self._responses[kind, key]
+            except KeyError:
+                raise ReplayError('{0} {1} was not recorded'.format(kind, key))
+        status, body = fetch()
+        with self._lock:
+            self._responses[kind, key] = status, body
+        return status, body
+
+    def close(self):
+        """Write out the recorded responses."""
+        if self.mode != 'record':
+            return
+        temp_path = self.path + '.tmp'
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        connection = sqlite3.connect(temp_path)
+        try:
+            with connection:
+                connection.execute('CREATE TABLE metadata '
+                                   '(name TEXT PRIMARY KEY, value TEXT)')
+                connection.executemany(
+                        'INSERT INTO metadata VALUES (?, ?)',
+                        [('format', str(FORMAT_VERSION)),
+                         ('recorded', str(time.time()))])
+                connection.execute('CREATE TABLE responses '
+                                   '(kind TEXT, key TEXT, status INTEGER, '
+                                   'body BLOB, PRIMARY KEY (kind, key))')
+                with self._lock:
+                    rows = [(kind, key, status,
+                             sqlite3.Binary(zlib.compress(body)))
+                            for (kind, key), (status, body)
+                            in self._responses.items()]
+                connection.executemany(
+                        'INSERT INTO responses VALUES (?, ?, ?, ?)', rows)
+        finally:
+            connection.close()
+        getattr(os, 'replace', os.rename)(temp_path, self.path)
+
+
+def active():
+    """Return the inserted cassette, or None if there isn't one."""
+    return _active
+
+
+@contextlib.contextmanager
+def inserted(cassette):
+    """Send all index traffic through the cassette while in the block.
+
+    The cassette is closed when the block is exited.
+    """
+    global _active
+    previous, _active = _active, cassette
+    try:
+        yield cassette
+    finally:
+        _active = previous
+        cassette.close()
+
+
+def response(url, status, body):
+    """Create a requests.Response for a replayed response."""
+    replayed = requests.Response()
+    replayed.url = url
+    replayed.status_code = status
+    replayed._content = body
+    replayed.encoding = 'utf-8'
+    return replayed
@@ -0,0 +1,147 @@
+# Copyright 2014 Google Inc. All rights reserved.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Check projects repeatedly while sharing resources between the checks."""
+
+from __future__ import unicode_literals
+
+from caniusepython3 import cache as cache_
+from caniusepython3 import dependencies
+from caniusepython3 import projects as projects_
+from caniusepython3 import pypi
+
+import packaging.utils
+import requests
+import requests.adapters
+
+import collections
+import concurrent.futures
+import threading
+
+
+class Report(collections.namedtuple('Report', ['projects', 'blockers'])):
+
+    """The outcome of a check.
+
+    The 'projects' attribute is the frozenset of the projects which were
+    checked and 'blockers' is the frozenset of the dependency paths to the
+    projects blocking them (as returned by dependencies.blockers()).
+    """
+
+    __slots__ = ()
+
+    @property
+    def passed(self):
+        """True if nothing blocks the projects from supporting Python 3."""
+        return not self.blockers
+
+
+class Checker(object):
+
+    """Check projects for Python 3 support.
+
+    A checker owns the connection pool used for the index, the threads which
+    make lookups, the overrides and a bounded in-memory cache of results, all
+    of which are shared by every check it makes. The overrides are read once,
+    on the first check. A checker can be used by several threads at once and
+    should be closed once it is no longer needed.
+
+    The 'cache' argument is a cache.ResultCache for results to also be kept
+    in. At most 'max_entries' results are kept in memory. The 'batch' argument
+    is the batch query protocol to use with the index (see
+    dependencies.blockers()).
+    """
+
+    def __init__(self, index_url=pypi.PYPI_INDEX_URL, environment=None,
+                 cache=None, max_workers=None, timeout=None,
+                 max_entries=cache_.DEFAULT_MAX_ENTRIES, batch=None):
+        self.index_url = index_url
+        if environment is None:
+            environment = dependencies.target_environment()
+        self.environment = environment
+        self.timeout = timeout
+        self.batch = batch
+        max_age = cache_.DEFAULT_MAX_AGE if cache is None else cache.max_age
+        self.cache = cache_.MemoryCache(max_entries, max_age, backing=cache)
+        max_workers = max_workers or pypi.CPU_COUNT
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+        self._session = requests.Session()
+        # Let every worker keep a connection to the index open.
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_workers)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self._overrides = None
+        self._overrides_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def overrides(self):
+        """The projects which are considered ported regardless of the index."""
+        with self._overrides_lock:
+            if self._overrides is None:
+                self._overrides = pypi.manual_overrides()
+            return self._overrides
+
+    def blockers(self, project_names, versions={}, deadline=None,
+                 fail_fast=False, max_depth=None, max_requests=None,
+                 graph=None):
+        """Find the projects blocking the specified ones.
+
+        The arguments are like those of dependencies.blockers(), which
+        explains when IncompleteResolution is raised. Returns a Report.
+        """
+        project_names = frozenset(project_names)
+        found = dependencies.blockers(project_names, self.index_url,
+                                      self.environment, versions, self.cache,
+                                      timeout=self.timeout, deadline=deadline,
+                                      executor=self._executor,
+                                      overrides=self.overrides,
+                                      session=self._session,
+                                      fail_fast=fail_fast,
+                                      max_depth=max_depth,
+                                      max_requests=max_requests,
+                                      graph=graph, batch=self.batch)
+        return Report(project_names, frozenset(found))
+
+    def check(self, requirements_paths=[], metadata=[], projects=[],
+              deadline=None, fail_fast=False, max_depth=None,
+              max_requests=None, lockfiles=[]):
+        """Check the specified projects along with their dependencies.
+
+        The arguments are like those of caniusepython3.check(), with projects
+        pinned to an exact version in a requirements file having that release
+        checked. The top-level projects of the 'lockfiles' (as read by
+        projects.read_lockfiles()) are checked at their locked versions,
+        using the dependencies they record. Returns a Report.
+        """
+        locked = projects_.read_lockfiles(lockfiles)
+        versions = dict(locked.versions)
+        versions.update(projects_.pinned_versions(requirements_paths))
+        names = dependencies.requirement_names(locked.requirements,
+                                               self.environment)
+        names.update(projects_.projects_from_requirements(requirements_paths))
+        names.update(projects_.projects_from_metadata(metadata))
+        names.update(map(packaging.utils.canonicalize_name, projects))
+        return self.blockers(names, versions, deadline, fail_fast, max_depth,
+                             max_requests, locked.graph)
+
+    def close(self):
+        """Release the threads and connections held by the checker."""
+        self._executor.shutdown(wait=False)
+        self._session.close()
@@ -15,10 +15,12 @@
 from __future__ import unicode_literals
 
 import setuptools
+from distutils.errors import DistutilsOptionError
 import sys
 
 import caniusepython3 as ciu
 import caniusepython3.__main__ as ciu_main
+from caniusepython3 import cache
 from caniusepython3 import pypi
 
 
@@ -26,7 +28,20 @@ class Command(setuptools.Command):
 
     description = """Run caniusepython3 over a setup.py file."""
 
-    user_options = []
+    user_options = [
+        ('index=', 'i', 'index to search for packages '
+                        '(default: {0})'.format(pypi.PYPI_INDEX_URL)),
+        ('jobs=', 'j', 'number of concurrent lookups (default: CPU count)'),
+        ('cache-dir=', None, 'directory of the result cache, which can be '
+                             'shared by every setup.py in a build '
+                             '(default: $CIU_CACHE_DIR or the user cache)'),
+        ('no-cache', None, 'do not cache any results'),
+        ('timeout=', None, 'seconds to wait on each request to the index'),
+        ('output-format=', None, 'output format ({0})'.format(
+                                    ', '.join(ciu_main.OUTPUT_FORMATS))),
+        ('fail-fast', None, 'stop at the first confirmed blocker'),
+    ]
+    boolean_options = ['no-cache', 'fail-fast']
 
     def _dependencies(self):
         projects = []
@@ -42,12 +57,41 @@ class Command(setuptools.Command):
         return projects
 
     def initialize_options(self):
-        pass
+        self.index = None
+        self.jobs = None
+        self.cache_dir = None
+        self.no_cache = False
+        self.timeout = None
+        self.output_format = None
+        self.fail_fast = False
 
     def run(self):
-        passed = ciu_main.check(self._dependencies())
+        if self.no_cache:
+            result_cache = None
+        else:
+            result_cache = cache.ResultCache(self.cache_dir or
+                                             cache.default_directory())
+        passed = ciu_main.check(self._dependencies(), self.index,
+                                cache=result_cache, max_workers=self.jobs,
+                                timeout=self.timeout,
+                                output_format=self.output_format,
+                                fail_fast=self.fail_fast)
         if not passed:
             sys.exit(3)
 
     def finalize_options(self):
-        pass
+        if self.index is None:
+            self.index = pypi.PYPI_INDEX_URL
+        try:
+            if self.jobs is not None:
+                self.jobs = int(self.jobs)
+            if self.timeout is not None:
+                self.timeout = float(self.timeout)
+        except ValueError as exc:
+            raise DistutilsOptionError(str(exc))
+        if self.output_format is None:
+            self.output_format = ciu_main.OUTPUT_FORMATS[0]
+        elif self.output_format not in ciu_main.OUTPUT_FORMATS:
+            raise DistutilsOptionError(
+                    'output-format must be one of: {0}'.format(
+                        ', '.join(ciu_main.OUTPUT_FORMATS)))
@@ -16,19 +16,65 @@ from __future__ import unicode_literals
 
 import setuptools  # To silence a warning.
 import distlib.locators
+import packaging.markers
+import packaging.requirements
 import packaging.utils
 
 import caniusepython3 as ciu
+from caniusepython3 import cassette
 from caniusepython3 import pypi
 
+import collections
 import concurrent.futures
+import hashlib
+import json
 import logging
+import multiprocessing
+import time
+
+
+# Values of the platform-related marker variables for the platforms which can
+# be targeted by name.
+PLATFORMS = {
+    'linux': {'os_name': 'posix', 'platform_system': 'Linux'},
+    'darwin': {'os_name': 'posix', 'platform_system': 'Darwin'},
+    'win32': {'os_name': 'nt', 'platform_system': 'Windows'},
+}
 
 
 class CircularDependencyError(Exception):
     """Raised if there are circular dependencies detected."""
 
 
+class IncompleteResolution(Exception):
+
+    """Raised when finding blockers stops before it finishes.
+
+    The 'reason' attribute is why it stopped ('deadline', 'interrupted',
+    'max-depth' or 'max-requests'). The 'blockers' attribute holds the blocker
+    paths found so far, although the dependencies of a blocker may not have
+    been checked yet. The 'unresolved' attribute is the set of projects whose
+    support or dependencies were not found; a blocker path ending with one of
+    them is a truncated branch.
+    """
+
+    def __init__(self, reason, blockers, unresolved):
+        super(IncompleteResolution, self).__init__(reason)
+        self.reason = reason
+        self.blockers = blockers
+        self.unresolved = unresolved
+
+    def __reduce__(self):
+        # So it can be raised in a worker process.
+        return (self.__class__, (self.reason, self.blockers, self.unresolved))
+
+
+try:
+    _now = time.monotonic
+except AttributeError:  #pragma: no cover
+    _now = time.time
+
+
 def reasons_to_paths(reasons):
     """Calculate the dependency paths to the reasons of the blockers.
 
@@ -52,64 +98,906 @@ def reasons_to_paths(reasons):
     return paths
 
 
-def dependencies(project_name):
-    """Get the dependencies for a project."""
+def target_environment(python_version=None, platform=None, extras=()):
+    """Create the environment that dependency markers are evaluated against.
+
+    Anything not specified is taken from the running interpreter. If the
+    interpreter is not Python 3 then a Python version must be specified for
+    markers to be evaluated against Python 3. The 'extras' argument is the
+    sequence of extras which are considered requested for every project.
+    """
+    environment = packaging.markers.default_environment()
+    if python_version:
+        environment['python_version'] = python_version
+        if python_version.count('.') < 2:
+            python_version += '.0'
+        environment['python_full_version'] = python_version
+    if platform:
+        environment['sys_platform'] = platform
+        environment.update(PLATFORMS.get(platform, {}))
+    environment['extras'] = tuple(extras)
+    return environment
+
+
+def _applies(requirement, environment):
+    """Check if a requirement is needed in the target environment."""
+    if requirement.marker is None:
+        return True
+    marker_environment = dict(environment)
+    extras = marker_environment.pop('extras', ())
+    for extra in extras or ('',):
+        marker_environment['extra'] = extra
+        if requirement.marker.evaluate(marker_environment):
+            return True
+    return False
+
+
+def _locate(requirement):
+    located = distlib.locators.locate(requirement, prereleases=True)
+    if not located:
+        return None
+    return sorted(located.run_requires)
+
+
+_locate_calls = pypi.SingleFlight()
+
+
+def _requirement(project_name, version):
+    if version is None:
+        return project_name
+    else:
+        return '{0} (== {1})'.format(project_name, version)
+
+
+def _cached_requirements(project_name, version=None, cache=None):
+    """Return the requirement strings of a project from the cache alone."""
+    if cache is None:
+        return None
+    return cache.get('distlib:' + _requirement(project_name, version))
+
+
+def _located_requirements(project_name, version=None, cache=None):
+    """Locate the requirement strings of a project (release).
+
+    Concurrent calls for the same requirement share a single lookup.
+    """
+    requirement = _requirement(project_name, version)
+    return _locate_calls.call(
+            requirement,
+            lambda: _fetch_located_requirements(requirement,
+                                                version is not None, cache))
+
+
+def _fetch_located_requirements(requirement, immutable, cache):
+    log = logging.getLogger('ciu')
+    key = 'distlib:' + requirement
+    if cache is not None:
+        run_requires = cache.get(key)
+        if run_requires is not None:
+            log.info('Using cached dependencies for {0}'.format(requirement))
+            return run_requires
+    recording = cassette.active()
+    if recording is None:
+        run_requires = _locate(requirement)
+    else:
+        def fetch():
+            return 200, json.dumps(_locate(requirement)).encode('utf-8')
+        _, body = recording.play('distlib', requirement, fetch)
+        run_requires = json.loads(body.decode('utf-8'))
+    if run_requires is None:
+        return None
+    if cache is not None:
+        cache.set(key, run_requires, immutable=immutable)
+    return run_requires
+
+
+def dependencies(project_name, environment=None, version=None, cache=None):
+    """Get the dependencies for a project.
+
+    Dependencies whose environment markers do not match the target environment
+    (as created by target_environment()) are skipped. If a version is
+    specified then the dependencies of that release are found instead of the
+    latest one. The 'cache' argument is a cache.ResultCache.
+    """
     log = logging.getLogger('ciu')
     log.info('Locating dependencies for {}'.format(project_name))
-    located = distlib.locators.locate(project_name, prereleases=True)
-    if not located:
+    run_requires = _located_requirements(project_name, version, cache)
+    if run_requires is None:
         log.warning('{0} not found; false-negatives possible'.format(project_name))
         return None
-    return {packaging.utils.canonicalize_name(pypi.just_name(dep))
-            for dep in located.run_requires}
+    return requirement_names(run_requires, environment, project_name)
 
 
-def blockers(project_names, index_url=pypi.PYPI_INDEX_URL):
+def requirement_names(requirements, environment=None, project_name=None):
+    """Get the names of the projects needed by requirement strings.
+
+    Requirements whose environment markers do not match the target environment
+    (as created by target_environment()) are skipped. The 'project_name'
+    argument is the project the requirements are of, for logging.
+    """
     log = logging.getLogger('ciu')
-    overrides = pypi.manual_overrides()
+    if environment is None:
+        environment = target_environment()
+    where = ' for {0}'.format(project_name) if project_name else ''
+    names = set()
+    for dep in requirements:
+        try:
+            requirement = packaging.requirements.Requirement(dep)
+        except packaging.requirements.InvalidRequirement:
+            name = pypi.just_name(dep)
+        else:
+            if not _applies(requirement, environment):
+                log.info('Skipping {0}{1}: not needed by the target '
+                         'environment'.format(requirement.name, where))
+                continue
+            name = requirement.name
+        names.add(packaging.utils.canonicalize_name(name))
+    return names
+
+
+def _known_ported(index_url):
+    # The snapshot is of PyPI, so it says nothing about the projects of other
+    # indexes (which may share names with popular PyPI projects).
+    if index_url.rstrip('/') != pypi.PYPI_INDEX_URL:
+        return frozenset()
+    return pypi.known_ported()
+
+
+def _closure_context(index_url, environment, overrides, known_ported,
+                     excluded_patterns):
+    """Digest what the blockers below a project depend on besides versions.
+
+    Changes to the projects in a closure are handled by pypi.sync_cache()
+    invalidating it instead.
+    """
+    context = [index_url, sorted(environment.items()), sorted(overrides),
+               sorted(known_ported), sorted(excluded_patterns)]
+    return hashlib.sha1(json.dumps(context).encode('utf-8')).hexdigest()
+
+
+def _closure(project_name, edges, versions):
+    """Collect the blockers below a project.
+
+    The 'edges' argument maps blockers to their dependencies. The closure maps
+    every blocker reachable from the project to its dependencies ('edges'), and
+    every project reachable from it to the version it was checked at
+    ('checked', with None for the latest release).
+    """
+    seen = {project_name}
+    stack = [project_name]
+    while stack:
+        for dep in edges.get(stack.pop(), ()):
+            if dep not in seen:
+                seen.add(dep)
+                stack.append(dep)
+    return {'checked': dict((project, versions.get(project))
+                            for project in seen),
+            'edges': dict((project, edges[project]) for project in seen
+                          if project in edges)}
+
+
+def _gather(executor, func, items, deadline=None, until=None):
+    """Call func on every item concurrently.
+
+    The calls are submitted in the order of the items. If 'until' is specified
+    then the remaining calls are cancelled as soon as it returns True for the
+    result of a finished call.
+
+    Returns the (item, result) pairs of the calls which finished, in the order
+    of the items, along with why the remaining calls were cancelled
+    ('deadline', 'interrupted' or 'until'), or None if every call finished.
+    """
+    futures = [(item, executor.submit(func, item)) for item in items]
+    stopped = None
+    if until is None:
+        return_when = concurrent.futures.ALL_COMPLETED
+    else:
+        return_when = concurrent.futures.FIRST_COMPLETED
+    not_done = [f for _, f in futures]
+    try:
+        while not_done:
+            timeout = None if deadline is None else max(0, deadline - _now())
+            done, not_done = concurrent.futures.wait(not_done, timeout,
+                                                     return_when)
+            if until is not None and any(until(f.result()) for f in done):
+                stopped = 'until'
+                break
+            if not_done and (until is None or not done):
+                stopped = 'deadline'
+                break
+    except KeyboardInterrupt:
+        stopped = 'interrupted'
+    if stopped:
+        for _, future in futures:
+            future.cancel()
+    finished = [(item, future.result()) for item, future in futures
+                if future.done() and not future.cancelled()]
+    return finished, stopped
+
+
+# Kinds of lookups made by a Traversal.
+SUPPORT = 'support'
+DEPENDENCIES = 'dependencies'
+
+
+class Lookup(collections.namedtuple('Lookup', ['kind', 'project'])):
+
+    """A lookup needed by a Traversal.
+
+    The 'kind' attribute is SUPPORT for whether the project supports Python 3,
+    with True or False as the result, or DEPENDENCIES for the names of its
+    dependencies, with a set of names (or None if they can't be found) as the
+    result.
+    """
+
+    __slots__ = ()
+
+
+class Traversal(object):
+
+    """The search for the blockers of projects, without any I/O.
+
+    The lookups the search needs next are returned by lookups() and their
+    results are handed back through feed(), until lookups() returns nothing.
+    Lookups are asked for a level of the dependency graph at a time: whether
+    every project found at the level supports Python 3, then the dependencies
+    of those which don't. How the lookups are made is up to the caller (see
+    drive() and blocker_reasons()).
+
+    Projects in 'known' are considered checked already (e.g. the overrides)
+    and projects for which 'excluded' returns True are skipped. The
+    'max_depth' and 'max_requests' bounds are those of blocker_reasons(),
+    with the dependencies of the projects in 'free' (e.g. those in a lockfile
+    graph) not counted as requests. Every blocker is mapped to its
+    dependencies in 'edges' (a new dict if not provided).
+
+    The 'reasons' attribute maps the blockers found so far to their parents
+    (as returned by blocker_reasons()) and 'unresolved' is the set of projects
+    whose support or dependencies are not known yet.
+    """
+
+    def __init__(self, project_names, known=(), excluded=None, max_depth=None,
+                 max_requests=None, free=(), edges=None):
+        log = logging.getLogger('ciu')
+        self.reasons = {}
+        self.edges = {} if edges is None else edges
+        self.unresolved = set()
+        # Why the search was cut short (if it was).
+        self.truncated = set()
+        # Whether a blocker has been confirmed (i.e. its dependencies found).
+        self.confirmed = False
+        # The number of lookups asked for which count towards max_requests.
+        self.requests = 0
+        self.max_depth = max_depth
+        self.max_requests = max_requests
+        self.free = free
+        if excluded is None:
+            excluded = lambda project_name: False
+        self._excluded = excluded
+        self._evaluated = set(known)
+        self._depths = {}
+        # The (project, parent) pairs found at the level to be checked next.
+        self.pending = []
+        self._phase = SUPPORT
+        self._asked = []
+        self._waiting = set()
+        self._parents = {}
+        self._blocking = []
+        for project in project_names:
+            if excluded(project):
+                log.info('Skipping excluded project: {0}'.format(project))
+                continue
+            log.info('Checking top-level project: {0} ...'.format(project))
+            self._evaluated.add(project)
+            self.unresolved.add(project)
+            self._depths[project] = 0
+            self.pending.append((project, None))
+
+    def _within_budget(self, projects):
+        # Trim the projects to those which can be looked up without exceeding
+        # max_requests.
+        if self.max_requests is None:
+            return projects
+        allowed = projects[:max(0, self.max_requests - self.requests)]
+        self.requests += len(allowed)
+        if len(allowed) < len(projects):
+            self.truncated.add('max-requests')
+        return allowed
+
+    def _support_lookups(self, order):
+        if order is not None:
+            self.pending.sort(key=lambda pair: order(pair[0]))
+        self._parents = dict(self.pending)
+        projects = self._within_budget([project
+                                        for project, _ in self.pending])
+        self.pending = []
+        self._blocking = []
+        return [Lookup(SUPPORT, project) for project in projects]
+
+    def _dependency_lookups(self):
+        log = logging.getLogger('ciu')
+        blocking = self._blocking
+        if self.max_depth is not None:
+            shallow = [project for project in blocking
+                       if self._depths[project] < self.max_depth]
+            if len(shallow) < len(blocking):
+                log.info('Not looking up dependencies beyond a depth of '
+                         '{0}'.format(self.max_depth))
+                self.truncated.add('max-depth')
+            blocking = shallow
+        free = [project for project in blocking if project in self.free]
+        blocking = free + self._within_budget(
+                [project for project in blocking if project not in self.free])
+        return [Lookup(DEPENDENCIES, project) for project in blocking]
+
+    def lookups(self, order=None):
+        """Return the lookups needed next, or an empty list once finished.
+
+        The lookups are all of the same kind. Until every one of them has been
+        fed back, the ones still outstanding are returned. The projects whose
+        support is checked next can be put in order by an 'order' sort key
+        (which also decides which are dropped by max_requests).
+        """
+        while not self._waiting:
+            if self._phase == SUPPORT:
+                if not self.pending:
+                    return []
+                self._asked = self._support_lookups(order)
+                self._phase = DEPENDENCIES
+            else:
+                self._asked = self._dependency_lookups()
+                self._phase = SUPPORT
+            self._waiting = set(self._asked)
+        return [lookup for lookup in self._asked if lookup in self._waiting]
+
+    def feed(self, results):
+        """Take in the (lookup, result) pairs of lookups made."""
+        log = logging.getLogger('ciu')
+        for lookup, result in results:
+            self._waiting.discard(lookup)
+            project = lookup.project
+            if lookup.kind == SUPPORT:
+                if result:
+                    self.unresolved.discard(project)
+                else:
+                    self.reasons[project] = self._parents[project]
+                    self._blocking.append(project)
+                continue
+            self.unresolved.discard(project)
+            if result is None:
+                # Can't find any results for a project, so ignore it so as to
+                # not accidentally consider indefinitely that a project can't
+                # port.
+                del self.reasons[project]
+                continue
+            self.confirmed = True
+            log.info('Dependencies of {0}: {1}'.format(project, result))
+            self.edges[project] = sorted(result)
+            for dep in sorted(result):
+                if dep in self._evaluated:
+                    log.info('{0} already checked'.format(dep))
+                elif self._excluded(dep):
+                    log.info('Skipping excluded project: {0}'.format(dep))
+                    self._evaluated.add(dep)
+                else:
+                    self._evaluated.add(dep)
+                    self.unresolved.add(dep)
+                    self._depths[dep] = self._depths[project] + 1
+                    self.pending.append((dep, project))
+
+    def splice(self, project, parent, edges):
+        """Take the blockers below a pending project from its closure.
+
+        The 'edges' argument maps the blockers below the project (including
+        itself) to their dependencies, as stored by blocker_reasons(). The
+        project must have been taken out of 'pending'. Dependencies found
+        already are left to be searched as usual.
+        """
+        self.unresolved.discard(project)
+        self.reasons[project] = parent
+        self.edges[project] = edges[project]
+        queue = collections.deque([project])
+        while queue:
+            node = queue.popleft()
+            for dep in edges.get(node, ()):
+                if dep in self._evaluated:
+                    continue
+                self._evaluated.add(dep)
+                if dep in edges:
+                    self.reasons[dep] = node
+                    self.edges[dep] = edges[dep]
+                    queue.append(dep)
+
+    def confirmed_reasons(self):
+        """Return the reasons of the blockers confirmed so far.
+
+        Blockers whose dependencies haven't been found (yet) are left out, as
+        a finished search would drop them if their dependencies can't be
+        found.
+        """
+        return dict((project, parent)
+                    for project, parent in self.reasons.items()
+                    if project in self.edges)
+
+    def incomplete(self, reason):
+        """Create the IncompleteResolution for stopping for the reason."""
+        return IncompleteResolution(reason, reasons_to_paths(self.reasons),
+                                    self.unresolved)
+
+    def result(self):
+        """Return the reasons found by the finished search.
+
+        IncompleteResolution is raised if a bound cut the search short.
+        """
+        if self.truncated:
+            # Running out of requests stops the search wherever it is, so
+            # it's the more important reason to report.
+            if 'max-requests' in self.truncated:
+                raise self.incomplete('max-requests')
+            raise self.incomplete('max-depth')
+        return self.reasons
+
+
+def drive(traversal, resolve, fail_fast=False):
+    """Run a traversal to the end, making its lookups through 'resolve'.
+
+    The 'resolve' function is called with each list of lookups and returns
+    the (lookup, result) pairs for them (see threaded_resolver(),
+    asyncio_resolver() and replay_resolver()). With 'fail_fast', the search
+    stops at the first level at which a blocker is confirmed. Returns the
+    reasons found, like blocker_reasons().
+    """
+    while True:
+        lookups = traversal.lookups()
+        if not lookups:
+            return traversal.result()
+        traversal.feed(resolve(lookups))
+        if fail_fast and traversal.confirmed:
+            return traversal.confirmed_reasons()
+
+
+def threaded_resolver(fetch, executor):
+    """Create a resolver for drive() calling 'fetch' on every lookup in the
+    executor's threads (or processes)."""
+    def resolve(lookups):
+        return zip(lookups, executor.map(fetch, lookups))
+    return resolve
+
+
+def asyncio_resolver(fetch, loop):
+    """Create a resolver for drive() running the coroutines returned by
+    'fetch' for every lookup concurrently on an asyncio event loop."""
+    import asyncio
+
+    def resolve(lookups):
+        # The futures are tied to the loop so gather() doesn't pick another.
+        futures = [asyncio.ensure_future(fetch(lookup), loop=loop)
+                   for lookup in lookups]
+        results = loop.run_until_complete(asyncio.gather(*futures))
+        return zip(lookups, results)
+    return resolve
+
+
+def replay_resolver(results):
+    """Create a resolver for drive() answering from recorded results.
+
+    The 'results' argument maps every lookup to its result. LookupError is
+    raised for any lookup which wasn't recorded.
+    """
+    def resolve(lookups):
+        try:
+            return [(lookup, results[lookup]) for lookup in lookups]
+        except KeyError as exc:
+            raise LookupError('{0} {1} was not recorded'.format(*exc.args[0]))
+    return resolve
+
+
+def blockers(project_names, *args, **kwargs):
+    """Find the projects blocking the specified ones from supporting Python 3.
+
+    The arguments are those of blocker_reasons(). The blockers are returned as
+    the dependency paths calculated by reasons_to_paths().
+    """
+    return reasons_to_paths(blocker_reasons(project_names, *args, **kwargs))
+
+
+def blocker_reasons(project_names, index_url=pypi.PYPI_INDEX_URL,
+                    environment=None, versions={}, cache=None,
+                    max_workers=None, timeout=None, deadline=None,
+                    executor=None, overrides=None, session=None,
+                    fail_fast=False, max_depth=None, max_requests=None,
+                    graph=None, batch=None, ported=None, edges=None,
+                    excluded=None, closures=True):
+    """Find the reasons the specified projects can't support Python 3.
+
+    Every project not supporting Python 3 which was found is mapped to the
+    project it was found to be a dependency of (or None if it is one of the
+    specified projects).
+
+    The 'versions' argument maps project names to the version to check instead
+    of the latest release. The 'cache' argument is a cache.ResultCache. Up to
+    'max_workers' lookups (defaulting to the CPU count) are made concurrently,
+    each waiting up to 'timeout' seconds on the index.
+
+    If 'deadline' seconds pass or a KeyboardInterrupt is received before the
+    search finishes, the outstanding lookups are cancelled and
+    IncompleteResolution is raised.
+
+    To share resources between calls, an 'executor' to make the lookups with,
+    the set of 'overrides' (from pypi.manual_overrides()) and a requests
+    'session' can be provided; the executor is then left running.
+
+    With 'fail_fast', the search stops as soon as any blocker is confirmed
+    (i.e. a project is found to not support Python 3 and its dependencies can
+    be located), so only the reasons found by then are returned. Projects which
+    the cache already knows to be blocking, and then those with the most
+    dependencies, are looked up first.
+
+    The search can be bounded by only looking up the dependencies of projects
+    less than 'max_depth' dependencies away from the specified ones (which are
+    at a depth of 0), and by making no more than 'max_requests' lookups. If a
+    bound cuts the search short then IncompleteResolution is raised once the
+    rest of the search is done.
+
+    The 'graph' argument maps projects to the requirement strings of their
+    dependencies (e.g. from projects.read_lockfiles()). The dependencies of
+    the projects in it are taken from it instead of being looked up, so they
+    make no requests (and don't count towards 'max_requests').
+
+    If a 'batch' protocol (e.g. a pypi.JSONBatchProtocol) is provided, whether
+    the projects found at each level of the search support Python 3 is asked
+    of the index in a single query. Projects are looked up one by one instead
+    if the index can't answer batch queries.
+
+    Once a search finishes, the blockers found below every blocking project
+    (its closure) are stored in the cache. Later searches reaching a project
+    (at the same version, with the same versions pinned below it) splice in
+    its closure instead of searching below it again. Closures are kept apart
+    by the patterns of an 'excluded' ProjectMatcher. They aren't used with a
+    'graph', 'max_depth', 'ported' or an 'excluded' function without
+    patterns, or if 'closures' is false (e.g. so that every lookup is made to
+    warm the cache).
+
+    Whether a project is ported is judged by pypi.declares_py3() unless a
+    'ported' function is provided, which is called with the name of every
+    project looked up and its details from pypi.project_info() (None if the
+    index has none). The snapshot of ported projects isn't used then. If an
+    'edges' dict is provided, every blocker is mapped in it to its
+    dependencies.
+
+    Projects for which 'excluded' (e.g. a projects.ProjectMatcher) returns
+    True are skipped without being looked up, along with everything only they
+    depend on.
+    """
+    log = logging.getLogger('ciu')
+    if environment is None:
+        environment = target_environment()
+    if deadline is not None:
+        deadline += _now()
+    if overrides is None:
+        overrides = pypi.manual_overrides()
+    known_ported = _known_ported(index_url)
+    if graph is None:
+        graph = {}
+    # Closures found while projects were excluded leave out what is below
+    # them, so they are only kept apart by the patterns of a ProjectMatcher.
+    excluded_patterns = ([] if excluded is None else
+                         getattr(excluded, 'patterns', None))
+    if excluded is None:
+        excluded = lambda project_name: False
+    memoize = (closures and cache is not None and not graph and
+               max_depth is None and ported is None and
+               excluded_patterns is not None)
+    if memoize:
+        context = _closure_context(index_url, environment, overrides,
+                                   known_ported, excluded_patterns)
 
     def supports_py3(project_name):
         if project_name in overrides:
             return True
+        elif ported is not None:
+            info = pypi.project_info(project_name, index_url,
+                                     versions.get(project_name), cache,
+                                     timeout, session)
+            return ported(project_name, info)
+        elif project_name not in versions and project_name in known_ported:
+            # The snapshot only covers the latest releases.
+            return True
         else:
-            return pypi.supports_py3(project_name, index_url=index_url)
+            return pypi.supports_py3(project_name, index_url=index_url,
+                                     version=versions.get(project_name),
+                                     cache=cache, timeout=timeout,
+                                     session=session)
+
+    def batch_supports_py3(projects):
+        # Returns None if the index can't answer batch queries.
+        lookup = [(project, versions.get(project)) for project in projects
+                  if project not in overrides and
+                  (ported is not None or project in versions or
+                   project not in known_ported)]
+        try:
+            found = pypi.batch_project_info(lookup, index_url, cache, timeout,
+                                            session, batch)
+        except pypi.BatchUnsupported as exc:
+            log.info('Looking up projects one by one: {0}'.format(exc))
+            return None
+        statuses = {}
+        for (project, _), info in found.items():
+            if ported is not None:
+                statuses[project] = ported(project, info)
+            else:
+                # Projects the index has no details for are assumed to be
+                # ported, as with pypi.supports_py3().
+                statuses[project] = info is None or pypi.declares_py3(info)
+        return [(project, statuses.get(project, True))
+                for project in projects]
+
+    def check_level(projects):
+        # Find which projects support Python 3, returning the (project,
+        # ported) pairs of the lookups which finished and why the rest were
+        # stopped (as _gather() does).
+        if batch is not None and projects:
+            finished, stopped = _gather(executor, batch_supports_py3,
+                                        [tuple(projects)], deadline)
+            if stopped:
+                return [], stopped
+            (_, checked), = finished
+            if checked is not None:
+                return checked, None
+        return _gather(executor, supports_py3, projects, deadline)
+
+    def find_dependencies(project_name):
+        if project_name in graph:
+            return requirement_names(graph[project_name], environment,
+                                     project_name)
+        return dependencies(project_name, environment,
+                            versions.get(project_name), cache)
+
+    def likely_blocker(project_name):
+        # Sort key putting the projects most likely to be blocking first,
+        # judged from what is already cached (i.e. without any lookups).
+        version = versions.get(project_name)
+        info = pypi.cached_project_info(project_name, index_url, version,
+                                        cache)
+        known_blocker = info is not None and not pypi.declares_py3(info)
+        run_requires = graph.get(project_name)
+        if run_requires is None:
+            run_requires = _cached_requirements(project_name, version, cache)
+        return not known_blocker, -len(run_requires or ())
+
+    def closure_key(project_name):
+        return 'closure:{0}:{1}'.format(
+                context, _requirement(project_name, versions.get(project_name)))
+
+    def splice_closures(projects):
+        # Splice in the cached closures of the projects, returning the
+        # (project, parent) pairs which still need to be looked up.
+        remaining = []
+        for project, parent in projects:
+            closure = cache.get(closure_key(project))
+            if (closure is None or project not in closure['edges'] or
+                    any(versions.get(node) != version
+                        for node, version in closure['checked'].items())):
+                uncached.add(project)
+                remaining.append((project, parent))
+                continue
+            log.info('Using the cached blockers of {0}'.format(project))
+            traversal.splice(project, parent, closure['edges'])
+        return remaining
+
+    def confirmed(deps):
+        return deps is not None
 
-    check = []
-    evaluated = set(overrides)
+    # The projects whose closure wasn't cached.
+    uncached = set()
+    traversal = Traversal(project_names, overrides, excluded, max_depth,
+                          max_requests, graph, edges)
+    owns_executor = executor is None
+    if owns_executor:
+        executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_workers or ciu.CPU_COUNT)
+    try:
+        while True:
+            if memoize and traversal.pending:
+                spliced = len(traversal.pending)
+                traversal.pending = splice_closures(traversal.pending)
+                if fail_fast and len(traversal.pending) < spliced:
+                    # A cached closure always holds a confirmed blocker.
+                    log.info('Stopping at the first confirmed blocker')
+                    return traversal.confirmed_reasons()
+            lookups = traversal.lookups(likely_blocker if fail_fast else None)
+            if not lookups:
+                break
+            projects = [lookup.project for lookup in lookups]
+            if lookups[0].kind == SUPPORT:
+                found, stopped = check_level(projects)
+            else:
+                found, stopped = _gather(executor, find_dependencies,
+                                         projects, deadline,
+                                         confirmed if fail_fast else None)
+            traversal.feed((Lookup(lookups[0].kind, project), result)
+                           for project, result in found)
+            if stopped == 'until':
+                log.info('Stopping at the first confirmed blocker')
+                return traversal.confirmed_reasons()
+            if stopped:
+                raise traversal.incomplete(stopped)
+    finally:
+        if owns_executor:
+            # Don't wait on lookups which are still running after being
+            # stopped.
+            executor.shutdown(wait=False)
+    reasons = traversal.result()
+    if memoize:
+        for project in uncached:
+            if project in reasons:
+                closure = _closure(project, traversal.edges, versions)
+                pinned = all(version is not None
+                             for version in closure['checked'].values())
+                cache.set(closure_key(project), closure, immutable=pinned)
+                pypi.track_closure(cache, closure_key(project),
+                                   closure['checked'], index_url)
+    return reasons
+
+
+def prefetched(project_names, executor, index_url=pypi.PYPI_INDEX_URL,
+               environment=None, versions={}, cache=None, timeout=None,
+               session=None, graph=None, overrides=None, futures=None):
+    """Yield project names while starting their lookups in the background.
+
+    As each (new) name passes through, the executor is given the lookup of
+    whether the project supports Python 3 and, if it doesn't, of its
+    dependencies (unless they're in the 'graph'). A search started with the
+    same 'cache' once every name is read joins the lookups still in flight and
+    finds the results of the others in the cache, so reading the names
+    overlaps with the lookups instead of preceding them. If 'overrides' is a
+    future of the overrides (e.g. of pypi.manual_overrides() submitted to the
+    executor), lookups wait for it and the projects in them aren't looked up.
+    If a 'futures' list is provided, the future of every lookup is appended
+    to it (e.g. so those which haven't started can be cancelled). The other
+    arguments are those of blocker_reasons().
+    """
+    known_ported = _known_ported(index_url)
+    graph = graph or {}
+
+    def lookup(project_name):
+        if overrides is not None and project_name in overrides.result():
+            return
+        version = versions.get(project_name)
+        info = pypi.project_info(project_name, index_url, version, cache,
+                                 timeout, session)
+        if (info is not None and not pypi.declares_py3(info) and
+                project_name not in graph):
+            dependencies(project_name, environment, version, cache)
+
+    seen = set()
     for project in project_names:
-        log.info('Checking top-level project: {0} ...'.format(project))
-        evaluated.add(project)
-        if not supports_py3(project):
-            check.append(project)
-    reasons = {project: None for project in check}
-    thread_pool_executor = concurrent.futures.ThreadPoolExecutor(
-            max_workers=ciu.CPU_COUNT)
-    with thread_pool_executor as executor:
-        while len(check) > 0:
-            new_check = []
-            for parent, deps in zip(check, executor.map(dependencies, check)):
-                if deps is None:
-                    # Can't find any results for a project, so ignore it so as
-                    # to not accidentally consider indefinitely that a project
-                    # can't port.
-                    del reasons[parent]
-                    continue
-                log.info('Dependencies of {0}: {1}'.format(project, deps))
-                unchecked_deps = []
-                for dep in deps:
-                    if dep in evaluated:
-                        log.info('{0} already checked'.format(dep))
-                    else:
-                        unchecked_deps.append(dep)
-                deps_status = zip(unchecked_deps,
-                                  executor.map(supports_py3,
-                                               unchecked_deps))
-                for dep, ported in deps_status:
-                    if not ported:
-                        reasons[dep] = parent
-                        new_check.append(dep)
-                    # Make sure there's no data race in recording a dependency
-                    # has been evaluated but not reported somewhere.
-                    evaluated.add(dep)
-            check = new_check
-    return reasons_to_paths(reasons)
+        if project not in seen:
+            seen.add(project)
+            if project in versions or project not in known_ported:
+                future = executor.submit(lookup, project)
+                if futures is not None:
+                    futures.append(future)
+        yield project
+
+
+def target_reasons(project_names, targets, *args, **kwargs):
+    """Find the reasons the projects can't support each of several targets.
+
+    A target is a Python version as accepted by pypi.declares_python() (e.g.
+    "3" for any Python 3, or "3.8"). A single search is made, looking up every
+    project once and judging it against all of the targets. Returns a dict
+    mapping each target to the reasons for it (as returned by
+    blocker_reasons()).
+
+    The other arguments are those of blocker_reasons(), apart from 'ported'
+    and 'edges'. If the search stops early then IncompleteResolution is raised
+    with the blockers of any of the targets.
+    """
+    statuses = {}
+
+    def ported(project_name, info):
+        # Projects the index has no details for are assumed to be ported, as
+        # with pypi.supports_py3().
+        status = statuses[project_name] = dict(
+                (target, info is None or pypi.declares_python(info, target))
+                for target in targets)
+        return all(status.values())
+
+    edges = {}
+    kwargs.update(ported=ported, edges=edges)
+    reasons = blocker_reasons(project_names, *args, **kwargs)
+    by_target = {}
+    for target in targets:
+        # Only the blockers of the target are searched below.
+        blocking = set(project for project in reasons
+                       if not statuses[project][target])
+        found = {}
+        queue = collections.deque()
+        for project in sorted(project_names):
+            if project in blocking and project not in found:
+                found[project] = None
+                queue.append(project)
+        while queue:
+            parent = queue.popleft()
+            for dep in edges.get(parent, ()):
+                if dep in blocking and dep not in found:
+                    found[dep] = parent
+                    queue.append(dep)
+        by_target[target] = found
+    return by_target
+
+
+def shard(project_names, index, count):
+    """Select the projects which belong to a shard.
+
+    Projects are assigned to one of 'count' shards (numbered from 0) by a hash
+    of their name, so every process (or machine) gets the same assignment.
+    """
+    selected = []
+    for project_name in project_names:
+        digest = hashlib.sha1(project_name.encode('utf-8')).hexdigest()
+        if int(digest, 16) % count == index:
+            selected.append(project_name)
+    return selected
+
+
+def merge_reasons(reason_maps):
+    """Merge the reasons found for separate shards of projects.
+
+    When shards disagree on why a project is blocking, the earliest shard
+    wins; as each shard's reasons are acyclic, so are the merged ones.
+    """
+    merged = {}
+    for reasons in reason_maps:
+        for project, parent in reasons.items():
+            merged.setdefault(project, parent)
+    return merged
+
+
+def _shard_reasons(args):
+    """Find the reasons for a shard, along with why it stopped early (if it
+    did)."""
+    project_names, index, count, kwargs = args
+    try:
+        return blocker_reasons(shard(project_names, index, count),
+                               **kwargs), None
+    except IncompleteResolution as exc:
+        reasons = {}
+        for path in exc.blockers:
+            for project, parent in zip(path, path[1:] + (None,)):
+                reasons.setdefault(project, parent)
+        return reasons, exc
+
+
+def sharded_blockers(project_names, shards, **kwargs):
+    """Find the blockers with the projects split into shards.
+
+    Each shard is checked by its own process (which makes lookups with its own
+    threads). Only the specified projects are split, so dependencies shared
+    between shards are looked up by each shard reaching them, unless another
+    shard already stored the result in a shared cache.ResultCache. The keyword
+    arguments are those of blocker_reasons(), except for the executor and
+    session.
+
+    If any shard stops early then IncompleteResolution is raised with the
+    blockers found by every shard.
+    """
+    project_names = sorted(project_names)
+    pool = multiprocessing.Pool(shards)
+    try:
+        results = pool.map(_shard_reasons,
+                           [(project_names, index, shards, kwargs)
+                            for index in range(shards)])
+    finally:
+        pool.terminate()
+        pool.join()
+    blockers = reasons_to_paths(merge_reasons(reasons
+                                              for reasons, _ in results))
+    stopped = [exc for _, exc in results if exc is not None]
+    if stopped:
+        unresolved = set()
+        for exc in stopped:
+            unresolved.update(exc.unresolved)
+        raise IncompleteResolution(stopped[0].reason, blockers, unresolved)
+    return blockers
@@ -0,0 +1,194 @@
+# Copyright 2014 Google Inc. All rights reserved.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Analyse the blockers of every project in an index at once.
+
+The projects are read from a metadata dump: a file (optionally gzipped) of
+JSON objects, one per line, each holding the "name", "version",
+"classifiers", "requires_python" and "requires_dist" of a release, as in the
+public PyPI metadata dataset. Analysing needs NumPy and SciPy.
+"""
+
+from __future__ import unicode_literals
+
+from caniusepython3 import dependencies
+from caniusepython3 import pypi
+
+import packaging.utils
+import packaging.version
+
+import collections
+import gzip
+import io
+import json
+
+try:
+    import numpy
+    import scipy.sparse
+except ImportError:
+    numpy = scipy = None
+
+
+# Number of projects whose dependents are found together by analyse(). More
+# is faster but takes more memory: a byte per blocker for each, plus the
+# blockers newly found to reach them at each step.
+DEFAULT_CHUNK_SIZE = 1024
+
+
+class Ecosystem(collections.namedtuple('Ecosystem',
+                                       ['names', 'ported', 'adjacency'])):
+
+    """The dependency graph of the projects in a metadata dump.
+
+    The 'names' attribute is the list of the projects, which the other
+    attributes are indexed by: 'ported' is a boolean array of whether each
+    supports the target, and 'adjacency' is a sparse matrix with a true entry
+    at [i, j] when project i depends on project j.
+    """
+
+    __slots__ = ()
+
+
+class Analysis(collections.namedtuple('Analysis',
+                                      ['blockers', 'unblocks'])):
+
+    """The blockers of every project in an ecosystem.
+
+    Both attributes are integer arrays indexed like Ecosystem.names:
+    'blockers' is how many projects (including itself) block each project, as
+    dependencies.blockers() would find, and 'unblocks' is how many other
+    projects each one blocks, i.e. which would have one blocker fewer if it
+    were ported.
+    """
+
+    __slots__ = ()
+
+
+def _require_scipy():
+    if scipy is None:
+        raise ImportError('analysing an ecosystem requires NumPy and SciPy')
+
+
+def _read_releases(path):
+    opener = gzip.open if path.endswith('.gz') else io.open
+    with opener(path, 'rb') as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                release = json.loads(line.decode('utf-8'))
+            except ValueError:
+                release = None
+            if not isinstance(release, dict) or not release.get('name'):
+                raise ValueError('line {0} of {1} is not a release'.format(
+                        number, path))
+            yield release
+
+
+def _newer(release, other):
+    try:
+        return (packaging.version.parse(release.get('version')) >
+                packaging.version.parse(other.get('version')))
+    except (packaging.version.InvalidVersion, TypeError):
+        # Releases which can't be compared are assumed to be in order.
+        return True
+
+
+def load_dump(paths, environment=None, target='3'):
+    """Build the dependency graph of the latest releases in metadata dumps.
+
+    Dependencies are evaluated against the 'environment' (as created by
+    dependencies.target_environment()) and only those which are in the dump
+    are kept. Projects are judged by pypi.declares_python() for the
+    'target'. Returns an Ecosystem.
+    """
+    _require_scipy()
+    latest = {}
+    for path in paths:
+        for release in _read_releases(path):
+            name = packaging.utils.canonicalize_name(release['name'])
+            if name not in latest or _newer(release, latest[name]):
+                latest[name] = release
+    names = sorted(latest)
+    index = dict((name, position) for position, name in enumerate(names))
+    ported = numpy.zeros(len(names), dtype=bool)
+    rows = []
+    columns = []
+    for position, name in enumerate(names):
+        release = latest[name]
+        info = {'classifiers': release.get('classifiers') or [],
+                'requires_python': release.get('requires_python')}
+        ported[position] = pypi.declares_python(info, target)
+        deps = dependencies.requirement_names(
+                release.get('requires_dist') or [], environment, name)
+        for dep in deps:
+            if dep in index and dep != name:
+                rows.append(position)
+                columns.append(index[dep])
+    adjacency = scipy.sparse.csr_matrix(
+            (numpy.ones(len(rows), dtype=bool), (rows, columns)),
+            shape=(len(names), len(names)))
+    return Ecosystem(names, ported, adjacency)
+
+
+def analyse(ecosystem, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Count the blockers of every project in an ecosystem. Returns an Analysis.
+
+    Like dependencies.blockers(), only the dependencies of blocking projects
+    are followed. The projects which can reach each blocker are found for
+    a chunk of blockers at a time, by repeatedly multiplying the adjacency
+    matrix of the blockers with the matrix of those found so far until
+    nothing new is found.
+    """
+    _require_scipy()
+    count = len(ecosystem.names)
+    blocking = numpy.flatnonzero(~ecosystem.ported)
+    # Dependencies between blockers are the only ones followed.
+    adjacency = ecosystem.adjacency[blocking][:, blocking].astype(numpy.int32)
+    blockers = numpy.zeros(count, dtype=numpy.int64)
+    unblocks = numpy.zeros(count, dtype=numpy.int64)
+    closure_sizes = numpy.zeros(len(blocking), dtype=numpy.int64)
+    for start in range(0, len(blocking), chunk_size):
+        stop = min(start + chunk_size, len(blocking))
+        # reached[i, j] is true once blocker i is found to reach blocker
+        # start + j (which every blocker does of itself).
+        shape = (len(blocking), stop - start)
+        reached = numpy.zeros(shape, dtype=bool)
+        rows = numpy.arange(start, stop)
+        columns = numpy.arange(stop - start)
+        while len(rows):
+            reached[rows, columns] = True
+            # Only the newly found blockers are multiplied, as a sparse
+            # matrix, so no dense copies of the chunk are made.
+            frontier = scipy.sparse.csr_matrix(
+                    (numpy.ones(len(rows), dtype=numpy.int32),
+                     (rows, columns)), shape=shape)
+            found = adjacency.dot(frontier).tocoo()
+            new = ~reached[found.row, found.col]
+            rows, columns = found.row[new], found.col[new]
+        closure_sizes += reached.sum(axis=1)
+        unblocks[blocking[start:stop]] = reached.sum(axis=0) - 1
+    blockers[blocking] = closure_sizes
+    return Analysis(blockers, unblocks)
+
+
+def ranked(names, counts, top=None):
+    """Return the (name, count) pairs with the highest non-zero counts.
+
+    Ties are broken by name. At most 'top' pairs are returned, if specified.
+    """
+    order = sorted((-count, name) for name, count in zip(names, counts)
+                   if count)
+    return [(name, -count) for count, name in order[:top]]
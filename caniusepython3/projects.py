@@ -8,15 +8,30 @@ import distlib.metadata
 import packaging.requirements
 import packaging.utils
 
+import collections
+import fnmatch
 import io
+import json
 import logging
+import multiprocessing
+import os
 import re
 
+try:
+    import tomllib as toml  # Python 3.11+
+except ImportError:
+    try:
+        import tomli as toml
+    except ImportError:
+        try:
+            import toml
+        except ImportError:
+            toml = None
 
-def projects_from_requirements(requirements):
-    """Extract the project dependencies from a Requirements specification."""
+
+def _requirements(requirements):
+    """Yield the usable requirements from requirements files."""
     log = logging.getLogger('ciu')
-    valid_reqs = []
     for requirements_path in requirements:
         with io.open(requirements_path) as file:
             requirements_text = file.read()
@@ -40,14 +55,295 @@ def projects_from_requirements(requirements):
                 log.warning(
                     'Skipping {0}: URL-specified projects unsupported'.format(req.name))
             else:
-                valid_reqs.append(req.name)
-    return frozenset(map(packaging.utils.canonicalize_name, valid_reqs))
+                yield req
+
+
+def projects_from_requirements(requirements):
+    """Extract the project dependencies from a Requirements specification."""
+    return frozenset(packaging.utils.canonicalize_name(req.name)
+                     for req in _requirements(requirements))
+
+
+def pinned_versions(requirements):
+    """Map the projects pinned to an exact version to that version."""
+    pins = {}
+    for req in _requirements(requirements):
+        specifiers = list(req.specifier)
+        if len(specifiers) != 1:
+            continue
+        specifier = specifiers[0]
+        if specifier.operator in ('==', '===') and '*' not in specifier.version:
+            pins[packaging.utils.canonicalize_name(req.name)] = specifier.version
+    return pins
+
+
+# Below this many metadata files, starting a process pool costs more than it
+# saves.
+METADATA_POOL_THRESHOLD = 32
+
+
+def _names_from_metadata(data):
+    meta = distlib.metadata.Metadata(fileobj=io.StringIO(data))
+    return [packaging.utils.canonicalize_name(pypi.just_name(project))
+            for project in meta.run_requires]
+
+
+def _names_from_metadata_file(metadata_path):
+    with io.open(metadata_path) as file:
+        return _names_from_metadata(file.read())
 
 
 def projects_from_metadata(metadata):
     """Extract the project dependencies from a metadata spec."""
     projects = []
     for data in metadata:
-        meta = distlib.metadata.Metadata(fileobj=io.StringIO(data))
-        projects.extend(pypi.just_name(project) for project in meta.run_requires)
-    return frozenset(map(packaging.utils.canonicalize_name, projects))
+        projects.extend(_names_from_metadata(data))
+    return frozenset(projects)
+
+
+def _pool(processes):
+    # The caller may have threads running (e.g. lookups started while the
+    # inputs are read), so the workers are spawned rather than forked while
+    # those threads hold locks the workers would inherit.
+    try:
+        context = multiprocessing.get_context('spawn')
+    except AttributeError:  #pragma: no cover
+        # Python 2 can only fork.
+        context = multiprocessing
+    return context.Pool(processes)
+
+
+def projects_from_metadata_files(metadata_paths, processes=None):
+    """Yield the unique project dependencies from metadata files.
+
+    Large numbers of files are read and parsed in a process pool (of
+    'processes' size, defaulting to the CPU count). Names are yielded as soon
+    as the file they are found in has been parsed.
+    """
+    metadata_paths = list(metadata_paths)
+    pool = None
+    if len(metadata_paths) < METADATA_POOL_THRESHOLD:
+        parsed = map(_names_from_metadata_file, metadata_paths)
+    else:
+        processes = processes or pypi.CPU_COUNT
+        pool = _pool(processes)
+        chunksize = max(1, len(metadata_paths) // (processes * 4))
+        parsed = pool.imap_unordered(_names_from_metadata_file,
+                                     metadata_paths, chunksize)
+    seen = set()
+    try:
+        for names in parsed:
+            for name in names:
+                if name not in seen:
+                    seen.add(name)
+                    yield name
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+
+class ProjectMatcher(object):
+
+    """Check if project names match any of a set of patterns.
+
+    Patterns are globs (e.g. ``mycorp-*``) matched against canonicalized
+    project names, unless they start with ``re:``, in which case the rest is a
+    regular expression which must match the whole name. Matchers are called
+    with a project name and can be pickled.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        regexes = []
+        for pattern in self.patterns:
+            if pattern.startswith('re:'):
+                regexes.append(pattern[3:])
+            else:
+                regexes.append(fnmatch.translate(
+                        packaging.utils.canonicalize_name(pattern)))
+        if regexes:
+            self._regex = re.compile('|'.join('(?:{0})\\Z'.format(regex)
+                                              for regex in regexes))
+        else:
+            self._regex = None
+
+    def __bool__(self):
+        return self._regex is not None
+
+    __nonzero__ = __bool__
+
+    def __call__(self, project_name):
+        return self._regex is not None and bool(self._regex.match(project_name))
+
+
+def patterns_from_files(paths):
+    """Read the project patterns listed in files (one per line).
+
+    Blank lines and comments (starting with ``#``) are skipped.
+    """
+    patterns = []
+    for path in paths:
+        with io.open(path, encoding='utf-8') as file:
+            for line in file:
+                line = re.sub(r'#.*', '', line).strip()
+                if line:
+                    patterns.append(line)
+    return patterns
+
+
+class LockfileError(Exception):
+    """Raised when a file is not a lockfile which can be read."""
+
+
+class LockedGraph(collections.namedtuple('LockedGraph',
+                                         ['requirements', 'versions',
+                                          'graph'])):
+
+    """The resolved dependency graph recorded in lockfiles.
+
+    The 'requirements' attribute is the list of requirement strings of the
+    top-level projects, 'versions' maps every locked project to its version
+    and 'graph' maps every locked project to the requirement strings of its
+    dependencies (which is what dependencies.blocker_reasons() accepts).
+    """
+
+    __slots__ = ()
+
+
+def _requirement_name(requirement):
+    try:
+        name = packaging.requirements.Requirement(requirement).name
+    except packaging.requirements.InvalidRequirement:
+        name = pypi.just_name(requirement)
+    return packaging.utils.canonicalize_name(name)
+
+
+def _graph_roots(graph):
+    """Find the projects of a graph which nothing depends on.
+
+    Projects only reachable through a dependency cycle are included as well,
+    so that every project is reachable from the roots.
+    """
+    edges = dict((project, set(map(_requirement_name, deps)))
+                 for project, deps in graph.items())
+    depended_on = set()
+    for deps in edges.values():
+        depended_on.update(deps)
+    roots = sorted(project for project in graph if project not in depended_on)
+    reached = set()
+    for root in roots + sorted(graph):
+        if root in reached:
+            continue
+        if root not in roots:
+            roots.append(root)
+        stack = [root]
+        while stack:
+            project = stack.pop()
+            if project not in reached:
+                reached.add(project)
+                stack.extend(edges.get(project, ()))
+    return roots
+
+
+def _requirement_string(name, markers):
+    return name if not markers else '{0} ; {1}'.format(name, markers)
+
+
+def _poetry_lock(text, path):
+    if toml is None:
+        raise LockfileError('reading {0} requires tomli or toml to be '
+                            'installed'.format(path))
+    try:
+        lock = toml.loads(text)
+    except Exception:
+        raise LockfileError('{0} is not a poetry.lock file'.format(path))
+    versions = {}
+    graph = {}
+    for package in lock.get('package', []):
+        name = packaging.utils.canonicalize_name(package['name'])
+        versions[name] = package['version']
+        requirements = []
+        for dep, constraints in sorted(package.get('dependencies', {}).items()):
+            if not isinstance(constraints, list):
+                constraints = [constraints]
+            for constraint in constraints:
+                if not isinstance(constraint, dict):
+                    requirements.append(dep)
+                # Optional dependencies are only needed for extras, which the
+                # lock doesn't record as having been requested.
+                elif not constraint.get('optional'):
+                    requirements.append(
+                        _requirement_string(dep, constraint.get('markers')))
+        graph[name] = requirements
+    return LockedGraph(_graph_roots(graph), versions, graph)
+
+
+def _pipfile_lock(lock):
+    # Pipfile.lock lists every project needed without the edges between them,
+    # so they are all top-level projects without dependencies.
+    requirements = []
+    versions = {}
+    graph = {}
+    for section in ('default', 'develop'):
+        for name, details in sorted(lock.get(section, {}).items()):
+            name = packaging.utils.canonicalize_name(name)
+            requirements.append(
+                _requirement_string(name, details.get('markers')))
+            version = details.get('version', '')
+            if version.startswith('=='):
+                versions[name] = version[2:]
+            graph[name] = []
+    return LockedGraph(requirements, versions, graph)
+
+
+def _pip_report(report):
+    requirements = []
+    versions = {}
+    graph = {}
+    for item in report['install']:
+        metadata = item['metadata']
+        name = packaging.utils.canonicalize_name(metadata['name'])
+        versions[name] = metadata['version']
+        graph[name] = list(metadata.get('requires_dist', []))
+        if item.get('requested'):
+            requirements.append(name)
+    return LockedGraph(requirements, versions, graph)
+
+
+def read_lockfile(path):
+    """Read the dependency graph from a lockfile.
+
+    A poetry.lock, a Pipfile.lock or the JSON report of
+    `pip install --dry-run --report` can be read; reading a poetry.lock needs
+    tomllib (Python 3.11+), tomli or toml. Returns a LockedGraph. Raises
+    LockfileError if the file can't be read as any of them.
+    """
+    with io.open(path, encoding='utf-8') as file:
+        text = file.read()
+    if os.path.basename(path) == 'poetry.lock':
+        return _poetry_lock(text, path)
+    try:
+        data = json.loads(text)
+    except ValueError:
+        # Poetry lockfiles are TOML, whatever they are called.
+        return _poetry_lock(text, path)
+    if isinstance(data, dict) and '_meta' in data:
+        return _pipfile_lock(data)
+    elif isinstance(data, dict) and 'install' in data:
+        return _pip_report(data)
+    raise LockfileError('{0} is not a Pipfile.lock or pip report'.format(path))
+
+
+def read_lockfiles(paths):
+    """Read and combine the dependency graphs of lockfiles.
+
+    Returns a LockedGraph, with what later lockfiles record taking precedence.
+    """
+    combined = LockedGraph([], {}, {})
+    for path in paths:
+        locked = read_lockfile(path)
+        combined.requirements.extend(locked.requirements)
+        combined.versions.update(locked.versions)
+        combined.graph.update(locked.graph)
+    return combined
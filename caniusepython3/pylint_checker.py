@@ -15,16 +15,119 @@
 
 See the documentation for what checkers pylint includes by default
 which compliment this file.
+
+The messages emitted for a file are cached (keyed by a hash of the file's
+contents), so checking an unchanged file replays them instead. The cache is
+kept in a 'pylint' directory within the result cache directory unless the
+CIU_PYLINT_CACHE environment variable names another directory (or is set to
+'off' to disable caching).
 """
 from __future__ import absolute_import, print_function
 
+import hashlib
+import os
+import sys
 import token
 import tokenize
 
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+
+import astroid
+import pylint
 from pylint import checkers, interfaces
 
+from caniusepython3 import cache
+
+
+# Bump whenever a checker changes what it reports, so messages cached for
+# earlier versions are no longer used.
+MESSAGE_CACHE_VERSION = 1
+
+# How long, in seconds, the messages emitted for a file are cached. Expired
+# messages are removed about as often, so the cache doesn't grow forever.
+MESSAGE_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+# What the messages depend on besides the checker and the file: how names
+# resolve (and so which messages are emitted) differs between interpreters
+# and between versions of Pylint and astroid.
+_MESSAGE_CACHE_CONTEXT = '{0}:py{1}.{2}:pylint-{3}:astroid-{4}'.format(
+        MESSAGE_CACHE_VERSION, sys.version_info[0], sys.version_info[1],
+        pylint.__version__, astroid.__version__)
+
+
+def message_cache():
+    """Return the cache of emitted messages, or None if caching is disabled."""
+    directory = os.environ.get('CIU_PYLINT_CACHE')
+    if directory == 'off':
+        return None
+    if not directory:
+        directory = os.path.join(cache.default_directory(), 'pylint')
+    result_cache = cache.ResultCache(directory, MESSAGE_CACHE_MAX_AGE)
+    # Removing the expired messages means reading every entry, so it's only
+    # done when the record of the last time has expired too.
+    if result_cache.get('pylint:pruned') is None:
+        result_cache.prune()
+        result_cache.set('pylint:pruned', True)
+    return result_cache
+
+
+def _file_digest(path):
+    """Return the hash of a file's contents, or None if it can't be read."""
+    if not path:
+        return None
+    try:
+        with open(path, 'rb') as file:
+            return hashlib.sha1(file.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+class _CachedMessages(object):
+
+    """Mixin for a checker caching the messages it emits for each file."""
 
-class StrictPython3Checker(checkers.BaseChecker):
+    def __init__(self, linter=None):
+        super(_CachedMessages, self).__init__(linter)
+        self._message_cache = message_cache()
+        # The cache key and messages of the file being recorded (if any).
+        self._recording = None
+
+    def _cached_messages(self, path):
+        """Look up the messages cached for a file.
+
+        If nothing is cached then the messages emitted from now on are
+        recorded until _store_messages() is called.
+        """
+        self._recording = None
+        digest = _file_digest(path)
+        if self._message_cache is None or digest is None:
+            return None
+        key = 'pylint:{0}:{1}:{2}'.format(type(self).__name__,
+                                          _MESSAGE_CACHE_CONTEXT, digest)
+        messages = self._message_cache.get(key)
+        if messages is None:
+            self._recording = key, []
+        return messages
+
+    def _store_messages(self):
+        if self._recording is not None:
+            key, messages = self._recording
+            self._message_cache.set(key, messages)
+            self._recording = None
+
+    def add_message(self, msgid, line=None, node=None, *args, **kwargs):
+        if self._recording is not None:
+            if node is not None:
+                line = node.fromlineno
+            self._recording[1].append([msgid, line])
+        super(_CachedMessages, self).add_message(msgid, line, node, *args,
+                                                 **kwargs)
+
+
+class StrictPython3Checker(_CachedMessages, checkers.BaseChecker):
 
     __implements__ = interfaces.IAstroidChecker
 
@@ -47,13 +150,60 @@ class StrictPython3Checker(checkers.BaseChecker):
 
     _changed_builtins = frozenset(['open'])
 
+    def __init__(self, linter=None):
+        super(StrictPython3Checker, self).__init__(linter)
+        self._scope_index = (None, frozenset())
+        # The lines of the messages being replayed for the current module.
+        self._replaying = None
+
+    def visit_module(self, node):
+        messages = self._cached_messages(getattr(node, 'file', None))
+        if messages is None:
+            self._replaying = None
+            self._scope_index = node, _bound_names(node)
+        else:
+            self._replaying = frozenset(line for _, line in messages)
+            self._scope_index = node, frozenset()
+
+    def leave_module(self, node):
+        self._store_messages()
+
+    def _bound_in_module(self, node):
+        return node.name in self._scope_index[1]
+
     def visit_name(self, node):
-        if hasattr(node, 'name') and getattr(node.lookup(node.name)[0], 'name', '') == '__builtin__':
-            if node.name in self._changed_builtins:
+        if getattr(node, 'name', None) not in self._changed_builtins:
+            return
+        if self._scope_index[0] is not node.root():
+            # visit_name() was called without visit_module() (e.g. in tests).
+            self.visit_module(node.root())
+        if self._replaying is not None:
+            if node.fromlineno in self._replaying:
                 self.add_message(node.name + '-builtin', node=node)
+            return
+        # Scope lookups are expensive, so only resolve a candidate name when
+        # something in the module could be shadowing the built-in.
+        if self._bound_in_module(node):
+            scope_name = getattr(node.lookup(node.name)[0], 'name', '')
+        else:
+            # Unbound names can only resolve to the built-ins module.
+            scope_name = builtins.__name__
+        if scope_name == '__builtin__':
+            self.add_message(node.name + '-builtin', node=node)
 
 
-class UnicodeChecker(checkers.BaseTokenChecker):
+def _bound_names(module):
+    """Return the names bound in any scope of the module."""
+    names = set()
+    to_visit = [module]
+    while to_visit:
+        node = to_visit.pop()
+        names.update(getattr(node, 'locals', ()))
+        to_visit.extend(node.get_children())
+    return frozenset(names)
+
+
+class UnicodeChecker(_CachedMessages, checkers.BaseTokenChecker):
 
     __implements__ = interfaces.ITokenChecker
 
@@ -68,6 +218,15 @@ class UnicodeChecker(checkers.BaseTokenChecker):
     }
 
     def process_tokens(self, tokens):
+        messages = self._cached_messages(self.linter.current_file)
+        if messages is not None:
+            for msgid, line in messages:
+                self.add_message(msgid, line=line)
+            return
+        self._find_native_strings(tokens)
+        self._store_messages()
+
+    def _find_native_strings(self, tokens):
         # Module docstring can be a native string.
         # Also use as a flag to notice when __future__ statements are no longer
         # valid to avoid wasting time checking every NAME token
@@ -14,21 +14,33 @@
 
 from __future__ import unicode_literals
 
+from caniusepython3 import cassette
+
+import packaging.specifiers
 import packaging.utils
 import requests
 
+import concurrent.futures
 import datetime
 import json
 import logging
 import multiprocessing
 import pkgutil
 import re
+import threading
+import time
+import xml.parsers.expat
 
 try:
     from functools import lru_cache
 except ImportError:
     from backports.functools_lru_cache import lru_cache
 
+try:
+    import xmlrpc.client as xmlrpc_client
+except ImportError:
+    import xmlrpclib as xmlrpc_client
+
 
 
 try:
@@ -37,7 +49,69 @@ except NotImplementedError:  #pragma: no cover
     CPU_COUNT = 2
 
 PROJECT_NAME = re.compile(r'[\w.-]+')
+PYTHON_CLASSIFIER = 'Programming Language :: Python :: '
 PYPI_INDEX_URL = 'https://pypi.org/pypi'
+# Seconds to wait on the index when a request has no timeout specified.
+DEFAULT_TIMEOUT = 30
+# Days after being generated that the snapshot of ported projects is stale
+# (and so no longer used).
+SNAPSHOT_MAX_AGE = 2 * 365
+
+
+def _get(url, timeout=None, session=None):
+    """Make a GET request through the inserted cassette (if there is one).
+
+    The timeout defaults to DEFAULT_TIMEOUT so a stalled connection can't hang
+    forever. If a requests.Session is provided then its connection pool is
+    used.
+    """
+    if timeout is None:
+        timeout = DEFAULT_TIMEOUT
+    get = requests.get if session is None else session.get
+    recording = cassette.active()
+    if recording is None:
+        return get(url, timeout=timeout)
+
+    def fetch():
+        response = get(url, timeout=timeout)
+        return response.status_code, response.content
+
+    status, body = recording.play('GET', url, fetch)
+    return cassette.response(url, status, body)
+
+
+def _post(url, body, timeout=None, session=None, content_type='text/xml'):
+    """Make a POST request through the inserted cassette (if there is one).
+
+    Like _get(), the timeout defaults to DEFAULT_TIMEOUT.
+    """
+    if timeout is None:
+        timeout = DEFAULT_TIMEOUT
+    post = requests.post if session is None else session.post
+    headers = {'Content-Type': content_type}
+    recording = cassette.active()
+    if recording is None:
+        return post(url, data=body, headers=headers, timeout=timeout)
+
+    def fetch():
+        response = post(url, data=body, headers=headers, timeout=timeout)
+        return response.status_code, response.content
+
+    status, body = recording.play('POST', url + '\n' + body.decode('utf-8'),
+                                  fetch)
+    return cassette.response(url, status, body)
+
+
+def _xmlrpc(index_url, method, *params, **kwargs):
+    """Call a method of the XML-RPC API of an index.
+
+    The keyword arguments are passed on to _post().
+    """
+    body = xmlrpc_client.dumps(params, method).encode('utf-8')
+    response = _post(index_url, body, **kwargs)
+    response.raise_for_status()
+    (result,), _ = xmlrpc_client.loads(response.content)
+    return result
 
 
 def just_name(supposed_name):
@@ -63,8 +137,8 @@ def _manual_overrides(_cache_date=None):
     then only if that fails is the included file used.
     """
     log = logging.getLogger('ciu')
-    request = requests.get("https://raw.githubusercontent.com/brettcannon/"
-                           "caniusepython3/master/caniusepython3/overrides.json")
+    request = _get("https://raw.githubusercontent.com/brettcannon/"
+                   "caniusepython3/master/caniusepython3/overrides.json")
     if request.status_code == 200:
         log.info("Overrides loaded from GitHub and cached")
         overrides = request.json()
@@ -75,16 +149,351 @@ def _manual_overrides(_cache_date=None):
     return frozenset(map(packaging.utils.canonicalize_name, overrides.keys()))
 
 
-def supports_py3(project_name, index_url=PYPI_INDEX_URL):
-    """Check with PyPI if a project supports Python 3."""
+def known_ported():
+    """Read the snapshot of projects known to support Python 3.
+
+    The snapshot is bundled with the package (see
+    scripts/update_ported_snapshot.py) and only says whether the latest
+    releases of projects supported Python 3 when it was generated. A stale
+    snapshot is ignored.
+    """
+    return _known_ported(datetime.date.today())
+
+
+@lru_cache(maxsize=1)
+def _known_ported(today):
+    log = logging.getLogger('ciu')
+    raw_bytes = pkgutil.get_data(__name__, 'ported.json')
+    snapshot = json.loads(raw_bytes.decode('utf-8'))
+    generated = datetime.datetime.strptime(snapshot['generated'],
+                                           '%Y-%m-%d').date()
+    if (today - generated).days > SNAPSHOT_MAX_AGE:
+        log.warning('Ignoring the snapshot of ported projects from {} as it '
+                    'is stale'.format(generated))
+        return frozenset()
+    return frozenset(snapshot['projects'])
+
+
+class SingleFlight(object):
+
+    """Share one call among concurrent callers asking for the same thing.
+
+    Callers which ask for a key while a call for it is in flight wait for and
+    share that call's result (or exception). Nothing is remembered once the
+    call finishes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def call(self, key, func):
+        """Return func() or the result of the in-flight call for the key."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = concurrent.futures.Future()
+        if not leader:
+            return future.result()
+        try:
+            result = func()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        return result
+
+
+_project_info_calls = SingleFlight()
+
+
+def _project_url(project_name, index_url, version):
+    if version is None:
+        return "{}/{}/json".format(index_url, project_name)
+    else:
+        return "{}/{}/{}/json".format(index_url, project_name, version)
+
+
+def cached_project_info(project_name, index_url=PYPI_INDEX_URL, version=None,
+                        cache=None):
+    """Return the details of a project from the cache alone.
+
+    None is returned if there is no cache or it holds no details.
+    """
+    if cache is None:
+        return None
+    return cache.get(_project_url(project_name, index_url, version))
+
+
+def project_info(project_name, index_url=PYPI_INDEX_URL, version=None,
+                 cache=None, timeout=None, session=None):
+    """Fetch the details of a project (or one of its releases) from an index.
+
+    Only the details needed to judge Python 3 support are returned. None is
+    returned if the index has no details to provide. Concurrent calls for the
+    same details share a single request.
+
+    If a cache is provided then the details are looked for there first and
+    stored there after being fetched. Released metadata never changes, so when
+    a version is specified the details are cached without expiry.
+    """
+    url = _project_url(project_name, index_url, version)
+    return _project_info_calls.call(
+            url, lambda: _fetch_project_info(project_name, url,
+                                             version is not None, cache,
+                                             timeout, session))
+
+
+def _fetch_project_info(project_name, url, immutable, cache, timeout,
+                        session):
     log = logging.getLogger("ciu")
-    log.info("Checking {} ...".format(project_name))
-    request = requests.get("{}/{}/json".format(index_url, project_name))
+    if cache is not None:
+        info = cache.get(url)
+        if info is not None:
+            log.info("Using cached details for {}".format(project_name))
+            return info
+    request = _get(url, timeout=timeout, session=session)
     if request.status_code >= 400:
-        log = logging.getLogger("ciu")
-        log.warning("problem fetching {}, assuming ported ({})".format(
-                        project_name, request.status_code))
+        log.warning("problem fetching {} ({})".format(
+                        url, request.status_code))
+        return None
+    info = _details(request.json()["info"])
+    if cache is not None:
+        cache.set(url, info, immutable=immutable)
+    return info
+
+
+def _details(info):
+    # The details of a project's "info" (from the JSON API) which are kept.
+    return {"classifiers": info["classifiers"],
+            "requires_python": info.get("requires_python")}
+
+
+class BatchUnsupported(Exception):
+    """Raised when an index can't answer batch queries."""
+
+
+class JSONBatchProtocol(object):
+
+    """Ask an index for the details of many projects in a single request.
+
+    The projects are POSTed to the index URL plus 'path' as
+    {"projects": [{"name": ..., "version": ...}, ...]} (with a null version
+    for the latest release). The index answers with {"projects": [...]},
+    holding either the "info" object its JSON API has for each project or null
+    when it has none, in the order asked for.
+
+    Any other batch protocol needs the same query() method. Once an index is
+    found to not support the protocol it isn't asked again.
+    """
+
+    def __init__(self, path="/batch"):
+        self.path = path
+        self._unsupported = set()
+
+    def query(self, index_url, projects, timeout=None, session=None):
+        """Fetch the "info" of the (name, version) pairs from an index.
+
+        Returns a list holding the info (or None) of each project in order.
+        Raises BatchUnsupported if the index doesn't support the protocol.
+        """
+        if index_url in self._unsupported:
+            raise BatchUnsupported(index_url)
+        body = json.dumps({"projects": [{"name": name, "version": version}
+                                        for name, version in projects]})
+        try:
+            response = _post(index_url + self.path, body.encode("utf-8"),
+                             timeout=timeout, session=session,
+                             content_type="application/json")
+            response.raise_for_status()
+            infos = response.json()["projects"]
+        except (requests.RequestException, ValueError, KeyError,
+                TypeError) as exc:
+            self._unsupported.add(index_url)
+            raise BatchUnsupported("{} can't answer batch queries "
+                                   "({})".format(index_url, exc))
+        if len(infos) != len(projects):
+            self._unsupported.add(index_url)
+            raise BatchUnsupported("{} answered {} of {} projects".format(
+                                       index_url, len(infos), len(projects)))
+        return infos
+
+
+def batch_project_info(projects, index_url=PYPI_INDEX_URL, cache=None,
+                       timeout=None, session=None, protocol=None):
+    """Fetch the details of many projects (or releases) at once.
+
+    The 'projects' argument is a sequence of (name, version) pairs, with a
+    version of None for the latest release. The details found in the cache
+    are used and the rest are asked for with one query of the batch
+    'protocol' (a JSONBatchProtocol by default), then cached like those of
+    project_info(). Returns a dict mapping every pair to its details (or None
+    if the index has none). Raises BatchUnsupported if the index can't answer
+    batch queries.
+    """
+    if protocol is None:
+        protocol = JSONBatchProtocol()
+    found = {}
+    missing = []
+    for name, version in projects:
+        info = cached_project_info(name, index_url, version, cache)
+        if info is None:
+            missing.append((name, version))
+        else:
+            found[name, version] = info
+    if missing:
+        infos = protocol.query(index_url, missing, timeout, session)
+        for (name, version), info in zip(missing, infos):
+            if info is not None:
+                info = _details(info)
+                if cache is not None:
+                    cache.set(_project_url(name, index_url, version), info,
+                              immutable=version is not None)
+            found[name, version] = info
+    return found
+
+
+def _changeable_keys(project_name, index_url):
+    # The cache keys of the results which change along with a project.
+    names = {project_name, packaging.utils.canonicalize_name(project_name)}
+    for name in names:
+        yield _project_url(name, index_url, None)
+        yield 'distlib:' + name
+
+
+# Serializes updating which closures hold a project (see track_closure()).
+_closures_lock = threading.Lock()
+
+
+def _closures_key(project_name, index_url):
+    # The cache key of the keys of the closures holding a project.
+    return 'closures:{0}:{1}'.format(
+            index_url, packaging.utils.canonicalize_name(project_name))
+
+
+def track_closure(cache, key, project_names, index_url=PYPI_INDEX_URL):
+    """Record that the cached closure (see dependencies.blocker_reasons())
+    stored under the key holds the projects.
+
+    sync_cache() invalidates the closure once any of the projects changes.
+    """
+    with _closures_lock:
+        for project_name in project_names:
+            closures_key = _closures_key(project_name, index_url)
+            keys = cache.get(closures_key) or []
+            if key not in keys:
+                cache.set(closures_key, keys + [key], immutable=True)
+
+
+def sync_cache(cache, index_url=PYPI_INDEX_URL, timeout=None, session=None):
+    """Invalidate the cached results of projects which changed on the index.
+
+    The index's changelog serial is kept in the cache, so only the projects
+    changed since the previous sync are asked for. From then on, results stored
+    after the first sync don't expire as they're invalidated when their project
+    changes instead. Returns the names of the changed projects, or None if they
+    are unknown (i.e. on the first sync or when the index has no changelog).
+    """
+    log = logging.getLogger("ciu")
+    key = "serial:" + index_url
+    state = cache.get(key)
+    try:
+        if state is None:
+            # Everything cached so far keeps expiring, as there's no telling
+            # what changed before now.
+            state = {"serial": _xmlrpc(index_url, "changelog_last_serial",
+                                       timeout=timeout, session=session),
+                     "since": time.time()}
+            changes = None
+        else:
+            events = _xmlrpc(index_url, "changelog_since_serial",
+                             state["serial"], timeout=timeout,
+                             session=session)
+            changes = set()
+            for event in events:
+                changes.add(event[0])
+                state["serial"] = max(state["serial"], event[4])
+    except (requests.RequestException, xmlrpc_client.Error,
+            xml.parsers.expat.ExpatError, ValueError) as exc:
+        log.warning("could not read the changelog of {} ({}); cached "
+                    "results will expire instead".format(index_url, exc))
+        return None
+    if changes:
+        log.info("{} project(s) changed since the last sync".format(
+                    len(changes)))
+        for project_name in changes:
+            for changed_key in _changeable_keys(project_name, index_url):
+                cache.invalidate(changed_key)
+            # So do the blockers found below anything depending on it.
+            closures_key = _closures_key(project_name, index_url)
+            for closure_key in cache.get(closures_key) or ():
+                cache.invalidate(closure_key)
+            cache.invalidate(closures_key)
+    cache.set(key, state, immutable=True)
+    cache.trusted_since = state["since"]
+    return changes
+
+
+def supports_py3(project_name, index_url=PYPI_INDEX_URL, version=None,
+                 cache=None, timeout=None, session=None):
+    """Check with PyPI if a project supports Python 3.
+
+    If a version is specified then that release is checked instead of the
+    latest one. The 'timeout' argument is the number of seconds to wait on the
+    index (defaulting to DEFAULT_TIMEOUT). The 'session' argument is a
+    requests.Session to make the request with.
+    """
+    log = logging.getLogger("ciu")
+    log.info("Checking {} ...".format(project_name))
+    info = project_info(project_name, index_url, version, cache, timeout,
+                        session)
+    if info is None:
+        log.info("assuming {} is ported".format(project_name))
         return True
-    response = request.json()
+    return declares_py3(info)
+
+
+def declares_py3(info):
+    """Check if the details from project_info() declare Python 3 support."""
     return any(c.startswith("Programming Language :: Python :: 3")
-               for c in response["info"]["classifiers"])
+               for c in info["classifiers"])
+
+
+def declares_python(info, target):
+    """Check if the details from project_info() declare support for a target.
+
+    A target of a major version (e.g. "3") is supported by any project with a
+    classifier for that major version. A minor version (e.g. "3.8") is not
+    supported if requires_python excludes it; otherwise it is supported if
+    the project has a classifier for it or, when the project has no
+    classifiers for specific minor versions, for its major version.
+    """
+    major = target.split(".")[0]
+    if "." not in target:
+        return any(c.startswith(PYTHON_CLASSIFIER + major)
+                   for c in info["classifiers"])
+    requires_python = info.get("requires_python")
+    if requires_python:
+        try:
+            specifier = packaging.specifiers.SpecifierSet(requires_python)
+        except packaging.specifiers.InvalidSpecifier:
+            specifier = None
+        # Any micro release of the minor version will do.
+        if specifier is not None and not (
+                specifier.contains(target + ".0", prereleases=True) or
+                specifier.contains(target + ".99", prereleases=True)):
+            return False
+    minors = set()
+    for classifier in info["classifiers"]:
+        version = classifier[len(PYTHON_CLASSIFIER):]
+        if (classifier.startswith(PYTHON_CLASSIFIER) and
+                re.match(re.escape(major) + r"\.\d+$", version)):
+            minors.add(version)
+    if minors:
+        return target in minors
+    return declares_python(info, major)
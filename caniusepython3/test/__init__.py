@@ -11,6 +11,13 @@ except ImportError:
     import mock
 
 import functools
+import json
+import threading
+
+try:
+    import http.server as http_server
+except ImportError:
+    import BaseHTTPServer as http_server
 
 def skip_pypi_timeouts(method):
     @functools.wraps(method)
@@ -20,3 +27,73 @@ def skip_pypi_timeouts(method):
         except requests.ConnectionError as exc:
             raise unittest.SkipTest('PyPI had an error:' + str(exc))
     return closure
+
+
+class StandInIndex(object):
+
+    """A local index serving the JSON API and, optionally, batch queries.
+
+    The 'projects' argument maps the project names the index knows about to
+    their classifiers. Every request made is recorded as a (method, path)
+    pair in 'requests'. The index must be closed once done with.
+    """
+
+    def __init__(self, projects, batch=True):
+        self.projects = projects
+        self.batch = batch
+        self.requests = []
+        self.server = http_server.HTTPServer(('127.0.0.1', 0),
+                                             self._handler())
+        self.url = 'http://127.0.0.1:{0}'.format(self.server.server_port)
+        # Poll often so closing the index doesn't hold up the tests.
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  args=(0.01,))
+        thread.daemon = True
+        thread.start()
+
+    def info(self, project_name):
+        if project_name not in self.projects:
+            return None
+        return {'classifiers': self.projects[project_name],
+                'requires_python': None}
+
+    def _handler(self):
+        index = self
+
+        class Handler(http_server.BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status, document):
+                body = json.dumps(document).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                index.requests.append(('GET', self.path))
+                info = index.info(self.path.split('/')[1])
+                if info is None or not self.path.endswith('/json'):
+                    self.reply(404, {'message': 'Not Found'})
+                else:
+                    self.reply(200, {'info': info})
+
+            def do_POST(self):
+                index.requests.append(('POST', self.path))
+                length = int(self.headers['Content-Length'])
+                body = json.loads(self.rfile.read(length).decode('utf-8'))
+                if not index.batch or self.path != '/batch':
+                    self.reply(404, {'message': 'Not Found'})
+                else:
+                    self.reply(200, {'projects': [index.info(project['name'])
+                                                  for project in
+                                                  body['projects']]})
+
+        return Handler
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
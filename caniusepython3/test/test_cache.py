@@ -0,0 +1,291 @@
+# Copyright 2014 Google Inc. All rights reserved.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+from caniusepython3 import cache
+from caniusepython3.test import mock, unittest
+
+import gzip
+import os
+import shutil
+import tempfile
+import time
+
+
+class DefaultDirectoryTests(unittest.TestCase):
+
+    def test_environment_variable(self):
+        with mock.patch.dict(os.environ, {'CIU_CACHE_DIR': 'somewhere'}):
+            self.assertEqual(cache.default_directory(), 'somewhere')
+
+    def test_user_cache(self):
+        environ = {'XDG_CACHE_HOME': 'user-cache'}
+        with mock.patch.dict(os.environ, environ, clear=True):
+            self.assertEqual(cache.default_directory(),
+                             os.path.join('user-cache', 'caniusepython3'))
+
+
+class ResultCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cache = cache.ResultCache(self.directory)
+
+    def test_missing(self):
+        self.assertIsNone(self.cache.get('missing'))
+
+    def test_round_trip(self):
+        value = {'classifiers': ['Programming Language :: Python :: 3']}
+        self.cache.set('key', value)
+        self.assertEqual(self.cache.get('key'), value)
+
+    def test_shared(self):
+        self.cache.set('key', True)
+        other = cache.ResultCache(self.directory)
+        self.assertTrue(other.get('key'))
+
+    def test_overwrite(self):
+        self.cache.set('key', 1)
+        self.cache.set('key', 2)
+        self.assertEqual(self.cache.get('key'), 2)
+
+    def test_expired(self):
+        expiring = cache.ResultCache(self.directory, max_age=60)
+        expiring.set('key', 1)
+        self.assertEqual(expiring.get('key'), 1)
+        with mock.patch('time.time', return_value=time.time() + 61):
+            self.assertIsNone(expiring.get('key'))
+
+    def test_immutable(self):
+        expiring = cache.ResultCache(self.directory, max_age=60)
+        expiring.set('key', 1, immutable=True)
+        with mock.patch('time.time', return_value=time.time() + 10 ** 9):
+            self.assertEqual(expiring.get('key'), 1)
+
+    def test_trusted(self):
+        expiring = cache.ResultCache(self.directory, max_age=60)
+        expiring.set('old', 1)
+        expiring.trusted_since = time.time()
+        expiring.set('new', 2)
+        with mock.patch('time.time', return_value=time.time() + 61):
+            self.assertIsNone(expiring.get('old'))
+            self.assertEqual(expiring.get('new'), 2)
+
+    def test_prune(self):
+        expiring = cache.ResultCache(self.directory, max_age=60)
+        expiring.set('old', 1)
+        expiring.set('immutable', 2, immutable=True)
+        with mock.patch('time.time', return_value=time.time() + 61):
+            expiring.set('new', 3)
+            self.assertEqual(expiring.prune(), 1)
+        self.assertEqual(sorted(entry['key'] for entry in expiring.entries()),
+                         ['immutable', 'new'])
+
+    def test_invalidate(self):
+        self.cache.set('key', 1)
+        self.cache.invalidate('key')
+        self.cache.invalidate('missing')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_stats(self):
+        expiring = cache.ResultCache(self.directory, max_age=60)
+        expiring.get('key')
+        expiring.set('key', 1)
+        expiring.get('key')
+        with mock.patch('time.time', return_value=time.time() + 61):
+            expiring.get('key')
+        self.assertEqual(expiring.stats,
+                         {'missing': 1, 'hit': 1, 'expired': 1})
+
+    def test_corrupt(self):
+        self.cache.set('key', 1)
+        with open(self.cache._path('key'), 'w') as file:
+            file.write('{')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_unwritable(self):
+        path = os.path.join(self.directory, 'file')
+        open(path, 'w').close()
+        unwritable = cache.ResultCache(path)
+        # Failing to cache is not an error.
+        unwritable.set('key', 1)
+        self.assertIsNone(unwritable.get('key'))
+
+
+class MemoryCacheTests(unittest.TestCase):
+
+    def test_round_trip(self):
+        memory = cache.MemoryCache()
+        self.assertIsNone(memory.get('key'))
+        memory.set('key', [1])
+        self.assertEqual(memory.get('key'), [1])
+
+    def test_bounded(self):
+        memory = cache.MemoryCache(max_entries=2)
+        memory.set('a', 1)
+        memory.set('b', 2)
+        # Using 'a' makes 'b' the least recently used entry.
+        memory.get('a')
+        memory.set('c', 3)
+        self.assertEqual(len(memory), 2)
+        self.assertIsNone(memory.get('b'))
+        self.assertEqual(memory.get('a'), 1)
+        self.assertEqual(memory.get('c'), 3)
+
+    def test_expired(self):
+        memory = cache.MemoryCache(max_age=60)
+        memory.set('key', 1)
+        memory.set('immutable', 2, immutable=True)
+        with mock.patch('time.time', return_value=time.time() + 61):
+            self.assertIsNone(memory.get('key'))
+            self.assertEqual(memory.get('immutable'), 2)
+        self.assertEqual(memory.stats['expired'], 1)
+
+    def test_backing(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        backing = cache.ResultCache(directory)
+        backing.set('old', 1, immutable=True)
+        memory = cache.MemoryCache(backing=backing)
+        memory.set('new', 2)
+        self.assertEqual(backing.get('new'), 2)
+        self.assertEqual(memory.get('old'), 1)
+        self.assertTrue(memory.entry('old')['immutable'])
+        self.assertEqual(backing.stats['hit'], 2)
+
+
+class BundleTests(unittest.TestCase):
+
+    def make_cache(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        return cache.ResultCache(directory)
+
+    def bundle_path(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        return os.path.join(directory, 'cache.bundle')
+
+    def test_round_trip(self):
+        source = self.make_cache()
+        source.set('a', 1)
+        source.set('b', [2], immutable=True)
+        path = self.bundle_path()
+        self.assertEqual(source.export_bundle(path), 2)
+        destination = self.make_cache()
+        self.assertEqual(destination.import_bundle(path), (2, 2))
+        self.assertEqual(destination.get('a'), 1)
+        self.assertEqual(destination.get('b'), [2])
+
+    def test_metadata(self):
+        path = self.bundle_path()
+        self.make_cache().export_bundle(path)
+        with gzip.open(path, 'rb') as file:
+            header = cache.read_bundle_header(file, path)
+        self.assertEqual(header['format'], cache.BUNDLE_FORMAT)
+        self.assertLessEqual(header['created'], time.time())
+
+    def test_newer_entries_win(self):
+        older, newer = self.make_cache(), self.make_cache()
+        older.set('key', 'old')
+        with mock.patch('time.time', return_value=time.time() + 10):
+            newer.set('key', 'new')
+        older_path, newer_path = self.bundle_path(), self.bundle_path()
+        older.export_bundle(older_path)
+        newer.export_bundle(newer_path)
+        merged = self.make_cache()
+        # Import order must not matter.
+        self.assertEqual(merged.import_bundle(newer_path), (1, 1))
+        self.assertEqual(merged.import_bundle(older_path), (1, 0))
+        self.assertEqual(merged.get('key'), 'new')
+        self.assertEqual(older.import_bundle(newer_path), (1, 1))
+        self.assertEqual(older.get('key'), 'new')
+
+    def test_keeps_stored_time(self):
+        source = self.make_cache()
+        with mock.patch('time.time', return_value=time.time() - 10 ** 6):
+            source.set('key', 1)
+        path = self.bundle_path()
+        source.export_bundle(path)
+        destination = self.make_cache()
+        destination.import_bundle(path)
+        # Importing an entry doesn't make it any fresher.
+        self.assertIsNone(destination.get('key'))
+
+    def test_sync_state_not_bundled(self):
+        source = self.make_cache()
+        source.set('serial:index', {'serial': 2, 'since': 0}, immutable=True)
+        source.set('closures:index:a', ['closure:a'])
+        source.set('key', 1)
+        path = self.bundle_path()
+        self.assertEqual(source.export_bundle(path), 1)
+        destination = self.make_cache()
+        destination.set('serial:index', {'serial': 1, 'since': 0},
+                        immutable=True)
+        destination.trusted_since = 0
+        self.assertEqual(destination.import_bundle(path), (1, 1))
+        # The changes between the serials were never seen by either cache.
+        self.assertIsNone(destination.get('serial:index'))
+        self.assertIsNone(destination.trusted_since)
+
+    def test_sync_state_kept_when_nothing_stored(self):
+        path = self.bundle_path()
+        self.make_cache().export_bundle(path)
+        destination = self.make_cache()
+        destination.set('serial:index', {'serial': 1, 'since': 0},
+                        immutable=True)
+        destination.import_bundle(path)
+        self.assertIsNotNone(destination.get('serial:index'))
+
+    def test_not_a_bundle(self):
+        path = self.bundle_path()
+        with open(path, 'w') as file:
+            file.write('not a bundle')
+        with self.assertRaises(cache.BundleError):
+            self.make_cache().import_bundle(path)
+
+    def test_unsupported_format(self):
+        path = self.bundle_path()
+        with gzip.open(path, 'wb') as file:
+            file.write(b'{"format": 0}\n')
+        with self.assertRaises(cache.BundleError):
+            self.make_cache().import_bundle(path)
+
+    def test_truncated(self):
+        source = self.make_cache()
+        for index in range(100):
+            source.set('key{0}'.format(index), 'x' * 100)
+        path = self.bundle_path()
+        source.export_bundle(path)
+        with open(path, 'rb') as file:
+            data = file.read()
+        with open(path, 'wb') as file:
+            file.write(data[:len(data) // 2])
+        with self.assertRaises(cache.BundleError):
+            self.make_cache().import_bundle(path)
+
+    def test_malformed_entries(self):
+        header = '{{"format": {0}}}\n'.format(cache.BUNDLE_FORMAT)
+        for line in ['not json', '{"key": "a", "value": 1}', '[1]']:
+            path = self.bundle_path()
+            with gzip.open(path, 'wb') as file:
+                file.write((header + line + '\n').encode('utf-8'))
+            with self.assertRaises(cache.BundleError):
+                self.make_cache().import_bundle(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
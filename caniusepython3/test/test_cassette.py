@@ -0,0 +1,124 @@
+# Copyright 2014 Google Inc. All rights reserved.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import setuptools  # To silence a warning.
+
+from caniusepython3 import cassette, dependencies, pypi
+from caniusepython3.test import mock, unittest
+
+import json
+import os
+import shutil
+import tempfile
+
+
+def no_network(*args, **kwargs):
+    raise AssertionError('network used while replaying')
+
+
+class CassetteTests(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'cassette.db')
+
+    def record(self, responses):
+        recording = cassette.Cassette(self.path, 'record')
+        for (kind, key), response in responses.items():
+            got = recording.play(kind, key, lambda: response)
+            self.assertEqual(got, response)
+        recording.close()
+
+    def test_round_trip(self):
+        responses = {('GET', 'https://index/a/json'): (200, b'{"a": 1}'),
+                     ('GET', 'https://index/b/json'): (404, b'')}
+        self.record(responses)
+        replaying = cassette.Cassette(self.path, 'replay')
+        for (kind, key), response in responses.items():
+            self.assertEqual(replaying.play(kind, key, no_network), response)
+
+    def test_rerecord(self):
+        self.record({('GET', 'url'): (200, b'old')})
+        self.record({('GET', 'url'): (200, b'new')})
+        replaying = cassette.Cassette(self.path, 'replay')
+        self.assertEqual(replaying.play('GET', 'url', no_network),
+                         (200, b'new'))
+
+    def test_not_recorded(self):
+        self.record({})
+        replaying = cassette.Cassette(self.path, 'replay')
+        with self.assertRaises(cassette.ReplayError):
+            replaying.play('GET', 'url', no_network)
+
+    def test_missing_cassette(self):
+        with self.assertRaises(cassette.ReplayError):
+            cassette.Cassette(self.path, 'replay')
+
+    def test_bad_mode(self):
+        with self.assertRaises(ValueError):
+            cassette.Cassette(self.path, 'rewind')
+
+    def test_inserted(self):
+        self.assertIsNone(cassette.active())
+        recording = cassette.Cassette(self.path, 'record')
+        with cassette.inserted(recording):
+            self.assertIs(cassette.active(), recording)
+        self.assertIsNone(cassette.active())
+        self.assertTrue(os.path.exists(self.path))
+
+
+class TrafficTests(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'cassette.db')
+
+    def test_index_requests(self):
+        response = mock.Mock(status_code=200)
+        response.content = json.dumps(
+                {'info': {'classifiers': ['Programming Language :: Python :: 3']}}
+                ).encode('utf-8')
+        with mock.patch('requests.get', return_value=response):
+            with cassette.inserted(cassette.Cassette(self.path, 'record')):
+                self.assertTrue(pypi.supports_py3('project', 'https://index'))
+        with mock.patch('requests.get', no_network):
+            with cassette.inserted(cassette.Cassette(self.path, 'replay')):
+                self.assertTrue(pypi.supports_py3('project', 'https://index'))
+
+    def test_located_dependencies(self):
+        class FakeLocated(object):
+            run_requires = ['six']
+        with mock.patch('distlib.locators.locate',
+                        return_value=FakeLocated()):
+            with cassette.inserted(cassette.Cassette(self.path, 'record')):
+                self.assertEqual(dependencies.dependencies('project'), {'six'})
+        with mock.patch('distlib.locators.locate', no_network):
+            with cassette.inserted(cassette.Cassette(self.path, 'replay')):
+                self.assertEqual(dependencies.dependencies('project'), {'six'})
+
+    def test_not_found_dependencies(self):
+        with mock.patch('distlib.locators.locate', return_value=None):
+            with cassette.inserted(cassette.Cassette(self.path, 'record')):
+                self.assertIsNone(dependencies.dependencies('project'))
+        with mock.patch('distlib.locators.locate', no_network):
+            with cassette.inserted(cassette.Cassette(self.path, 'replay')):
+                self.assertIsNone(dependencies.dependencies('project'))
+
+
+if __name__ == '__main__':
+    unittest.main()
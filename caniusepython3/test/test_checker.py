@@ -0,0 +1,81 @@
+# Copyright 2014 Google Inc. All rights reserved.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import caniusepython3 as ciu
+from caniusepython3 import checker
+from caniusepython3.test import mock, unittest
+from caniusepython3.test.test_dependencies import FakeIndex
+
+import concurrent.futures
+
+
+class CheckerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.checker = checker.Checker()
+        self.addCleanup(self.checker.close)
+
+    def test_exported(self):
+        self.assertIs(ciu.Checker, checker.Checker)
+        self.assertIs(ciu.Report, checker.Report)
+
+    def test_blockers(self):
+        FakeIndex({'a': ['b'], 'b': []}).install(self)
+        report = self.checker.blockers(['a'])
+        self.assertEqual(report.projects, frozenset(['a']))
+        self.assertEqual(report.blockers, frozenset([('b', 'a')]))
+        self.assertFalse(report.passed)
+
+    def test_check(self):
+        FakeIndex({'a': []}, ported=['a']).install(self)
+        report = self.checker.check(projects=['A'])
+        self.assertEqual(report.projects, frozenset(['a']))
+        self.assertTrue(report.passed)
+
+    def test_overrides_read_once(self):
+        FakeIndex({'a': []}).install(self)
+        with mock.patch('caniusepython3.pypi.manual_overrides',
+                        return_value=frozenset()) as overrides:
+            self.checker.blockers(['a'])
+            self.checker.blockers(['a'])
+        self.assertEqual(overrides.call_count, 1)
+
+    def test_executor_shared(self):
+        FakeIndex({'a': []}).install(self)
+        with mock.patch('concurrent.futures.ThreadPoolExecutor') as executor:
+            self.checker.blockers(['a'])
+        self.assertFalse(executor.called)
+        self.assertFalse(self.checker._executor._shutdown)
+
+    def test_results_cached(self):
+        with mock.patch('caniusepython3.pypi.manual_overrides',
+                        return_value=frozenset()), \
+                mock.patch('caniusepython3.pypi._get') as get:
+            get.return_value.status_code = 200
+            get.return_value.json.return_value = {'info': {
+                    'classifiers': ['Programming Language :: Python :: 3']}}
+            self.checker.blockers(['a'])
+            self.checker.blockers(['a'])
+        self.assertEqual(get.call_count, 1)
+        self.assertIs(get.call_args[1]['session'], self.checker._session)
+
+    def test_thread_safe(self):
+        FakeIndex({'a': ['b'], 'b': [], 'c': []}).install(self)
+        with concurrent.futures.ThreadPoolExecutor(4) as pool:
+            reports = list(pool.map(self.checker.blockers,
+                                    [['a'], ['c']] * 4))
+        self.assertEqual({report.blockers for report in reports},
+                         {frozenset([('b', 'a')]), frozenset([('c',)])})
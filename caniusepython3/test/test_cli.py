@@ -15,12 +15,49 @@
 from __future__ import unicode_literals
 
 import caniusepython3.__main__ as ciu_main
-from caniusepython3 import projects, pypi
+from caniusepython3 import cache, dependencies, projects, pypi
 from caniusepython3.test import mock, unittest, skip_pypi_timeouts
 
+import collections
+import concurrent.futures
+import gzip
 import io
+import json
 import logging
+import os
+import pickle
+import shutil
 import tempfile
+import threading
+
+
+class ImmediateExecutor(object):
+
+    """Make calls as soon as they're submitted."""
+
+    def __init__(self, max_workers=None):
+        pass
+
+    def submit(self, func, *args):
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def offline(test):
+    """Keep the lookups started while reading the inputs off the network."""
+    test = mock.patch.multiple('caniusepython3.pypi',
+                               manual_overrides=lambda: frozenset(),
+                               project_info=lambda *args, **kwargs: None)(test)
+    # Finish the lookups before the patches are undone.
+    return mock.patch('concurrent.futures.ThreadPoolExecutor',
+                      ImmediateExecutor)(test)
 
 
 EXAMPLE_REQUIREMENTS = """
@@ -101,6 +138,14 @@ class CLITests(unittest.TestCase):
         want = self.expected_requirements.union(self.expected_extra_requirements)
         self.assertEqual(set(got), want)
 
+    def test_pinned_versions(self):
+        with tempfile.NamedTemporaryFile('w') as file:
+            file.write(EXAMPLE_REQUIREMENTS)
+            file.write('Pinned.Project==1.2.3\nwild==1.*\nexact===abc\n')
+            file.flush()
+            got = projects.pinned_versions([file.name])
+        self.assertEqual(got, {'pinned-project': '1.2.3', 'exact': 'abc'})
+
     def test_metadata(self):
         got = projects.projects_from_metadata([EXAMPLE_METADATA])
         self.assertEqual(set(got), self.expected_metadata)
@@ -111,6 +156,41 @@ class CLITests(unittest.TestCase):
         want = self.expected_metadata.union(self.expected_extra_metadata)
         self.assertEqual(set(got), want)
 
+    def metadata_files(self, count):
+        paths = []
+        for index in range(count):
+            file = tempfile.NamedTemporaryFile('w')
+            self.addCleanup(file.close)
+            file.write(EXAMPLE_METADATA if index % 2 else EXAMPLE_EXTRA_METADATA)
+            file.flush()
+            paths.append(file.name)
+        return paths
+
+    def test_metadata_files(self):
+        got = list(projects.projects_from_metadata_files(self.metadata_files(4)))
+        self.assertEqual(len(got), len(set(got)))
+        want = self.expected_metadata.union(self.expected_extra_metadata)
+        self.assertEqual(set(got), want)
+
+    @mock.patch('caniusepython3.projects.METADATA_POOL_THRESHOLD', 2)
+    def test_metadata_files_process_pool(self):
+        got = list(projects.projects_from_metadata_files(self.metadata_files(8),
+                                                         processes=2))
+        self.assertEqual(len(got), len(set(got)))
+        want = self.expected_metadata.union(self.expected_extra_metadata)
+        self.assertEqual(set(got), want)
+
+    @mock.patch('caniusepython3.projects.METADATA_POOL_THRESHOLD', 2)
+    def test_metadata_files_spawned(self):
+        # Forking while lookups are running in threads could deadlock.
+        with mock.patch('multiprocessing.get_context') as get_context:
+            pool = get_context.return_value.Pool.return_value
+            pool.imap_unordered.return_value = [['foo']]
+            got = list(projects.projects_from_metadata_files(
+                    self.metadata_files(4), processes=2))
+        self.assertEqual(got, ['foo'])
+        get_context.assert_called_once_with('spawn')
+
     def test_cli_for_requirements(self):
         with tempfile.NamedTemporaryFile('w') as file:
             file.write(EXAMPLE_REQUIREMENTS)
@@ -132,6 +212,28 @@ class CLITests(unittest.TestCase):
         self.assertNotIn('pickything', set(got))
         self.assertEqual(set(got), expected_requirements)
 
+    def test_project_matcher(self):
+        matcher = projects.ProjectMatcher(['MyCorp_*', 're:internal-\\d+'])
+        self.assertTrue(matcher('mycorp-utils'))
+        self.assertTrue(matcher('internal-42'))
+        self.assertFalse(matcher('internal-42-extra'))
+        self.assertFalse(matcher('requests'))
+        self.assertTrue(pickle.loads(pickle.dumps(matcher))('mycorp-x'))
+        self.assertFalse(projects.ProjectMatcher([]))
+        self.assertFalse(projects.ProjectMatcher([])('anything'))
+
+    def test_ported_file(self):
+        with tempfile.NamedTemporaryFile('w') as file:
+            file.write('# Internal projects.\nmycorp-*\n\nlegacy  # Ported.\n')
+            file.flush()
+            self.assertEqual(projects.patterns_from_files([file.name]),
+                             ['mycorp-*', 'legacy'])
+            parsed = ciu_main.arguments_from_cli(
+                    ['-p', 'foo', 'legacy', 'MyCorp.Web', '-e', 're:f.o',
+                     '--ported-file', file.name])
+            self.assertTrue(ciu_main.excluded_from_parsed(parsed)('mycorp-web'))
+            self.assertEqual(ciu_main.projects_from_parsed(parsed), set())
+
     def test_cli_for_metadata(self):
         with tempfile.NamedTemporaryFile('w') as file:
             file.write(EXAMPLE_METADATA)
@@ -158,6 +260,438 @@ class CLITests(unittest.TestCase):
         parsed = ciu_main.arguments_from_cli(args)
         self.assertEqual(parsed.index, 'https://pypi.org/pypi')
 
+    def test_cli_for_target_environment(self):
+        args = ['--projects', 'foo', '--python-version', '3.6',
+                '--platform', 'win32', '--extras', 'security', 'socks']
+        parsed = ciu_main.arguments_from_cli(args)
+        self.assertEqual(parsed.python_version, '3.6')
+        self.assertEqual(parsed.platform, 'win32')
+        self.assertEqual(parsed.extras, ['security', 'socks'])
+
+    def test_cli_for_target_environment_default(self):
+        args = ['--projects', 'foo']
+        parsed = ciu_main.arguments_from_cli(args)
+        self.assertIsNone(parsed.python_version)
+        self.assertIsNone(parsed.platform)
+        self.assertEqual(parsed.extras, ())
+
+    def test_cli_for_cache(self):
+        args = ['--projects', 'foo', '--cache-dir', 'some-dir']
+        parsed = ciu_main.arguments_from_cli(args)
+        self.assertEqual(ciu_main.cache_from_parsed(parsed).directory,
+                         'some-dir')
+
+    def test_cli_for_changelog(self):
+        args = ['--projects', 'foo', '--cache-dir', 'some-dir', '--changelog']
+        parsed = ciu_main.arguments_from_cli(args)
+        with mock.patch('caniusepython3.pypi.sync_cache') as sync_cache:
+            result_cache = ciu_main.cache_from_parsed(parsed)
+        sync_cache.assert_called_once_with(result_cache, pypi.PYPI_INDEX_URL,
+                                           None)
+
+    def test_cli_for_no_cache(self):
+        args = ['--projects', 'foo', '--no-cache']
+        parsed = ciu_main.arguments_from_cli(args)
+        self.assertIsNone(ciu_main.cache_from_parsed(parsed))
+
+    def test_cli_for_tuning(self):
+        args = ['--projects', 'foo', '--jobs', '16', '--timeout', '2.5',
+                '--format', 'json']
+        parsed = ciu_main.arguments_from_cli(args)
+        self.assertEqual(parsed.jobs, 16)
+        self.assertEqual(parsed.timeout, 2.5)
+        self.assertEqual(parsed.format, 'json')
+
+    def test_cli_for_tuning_default(self):
+        parsed = ciu_main.arguments_from_cli(['--projects', 'foo'])
+        self.assertIsNone(parsed.jobs)
+        self.assertIsNone(parsed.timeout)
+        self.assertEqual(parsed.format, 'text')
+
+    def test_json_blockers(self):
+        got = json.loads(ciu_main.json_blockers({('A', 'C'), ('B',)}))
+        self.assertEqual(got, {'ported': False,
+                               'blockers': [['B'], ['A', 'C']]})
+        got = json.loads(ciu_main.json_blockers(set()))
+        self.assertEqual(got, {'ported': True, 'blockers': []})
+
+    @mock.patch('caniusepython3.dependencies.blockers',
+                lambda projects, index_url, **kwargs: {('A', 'B')})
+    def test_check_json_output(self):
+        with mock.patch('sys.stdout', io.StringIO()) as stdout:
+            passed = ciu_main.check(['B'], output_format='json')
+        self.assertFalse(passed)
+        got = json.loads(stdout.getvalue())
+        self.assertEqual(got['blockers'], [['A', 'B']])
+
+    def test_cli_for_record(self):
+        args = ['--projects', 'foo', '--record', 'traffic.db']
+        parsed = ciu_main.arguments_from_cli(args)
+        recording = ciu_main.cassette_from_parsed(parsed)
+        self.assertEqual(recording.path, 'traffic.db')
+        self.assertEqual(recording.mode, 'record')
+        self.assertIsNone(ciu_main.cache_from_parsed(parsed))
+
+    @mock.patch('caniusepython3.cassette.Cassette._load')
+    def test_cli_for_replay(self, _load):
+        args = ['--projects', 'foo', '--replay', 'traffic.db']
+        parsed = ciu_main.arguments_from_cli(args)
+        recording = ciu_main.cassette_from_parsed(parsed)
+        self.assertEqual(recording.mode, 'replay')
+        self.assertIsNone(ciu_main.cache_from_parsed(parsed))
+
+    @mock.patch('argparse.ArgumentParser.error', side_effect=SystemExit)
+    def test_cli_record_and_replay(self, parser_error):
+        args = ['--projects', 'foo', '--record', 'a.db', '--replay', 'b.db']
+        with self.assertRaises(SystemExit):
+            ciu_main.arguments_from_cli(args)
+
+    def test_cli_no_cassette(self):
+        parsed = ciu_main.arguments_from_cli(['--projects', 'foo'])
+        self.assertIsNone(ciu_main.cassette_from_parsed(parsed))
+
+    def test_cli_for_warm(self):
+        parsed = ciu_main.arguments_from_cli(['warm', '--projects', 'foo'])
+        self.assertEqual(parsed.command, 'warm')
+        self.assertEqual(parsed.projects, ['foo'])
+
+    def test_cli_for_check(self):
+        parsed = ciu_main.arguments_from_cli(['--projects', 'foo'])
+        self.assertEqual(parsed.command, 'check')
+
+    @mock.patch('argparse.ArgumentParser.error', side_effect=SystemExit)
+    def test_cli_warm_requires_cache(self, parser_error):
+        with self.assertRaises(SystemExit):
+            ciu_main.arguments_from_cli(['warm', '-p', 'foo', '--no-cache'])
+        self.assertEqual(mock.call("'warm' requires the result cache"),
+                         parser_error.call_args)
+
+    def test_warm(self):
+        result_cache = mock.Mock(stats=collections.Counter(
+                                    missing=3, expired=2, hit=1))
+        with mock.patch('caniusepython3.dependencies.blockers') as blockers:
+            with mock.patch('sys.stdout', io.StringIO()) as stdout:
+                self.assertTrue(ciu_main.warm(['foo'], cache=result_cache))
+        self.assertEqual(blockers.call_args[1]['cache'], result_cache)
+        self.assertEqual(blockers.call_args[1]['max_workers'],
+                         ciu_main.WARM_JOBS)
+        # Every lookup is made rather than splicing in cached closures.
+        self.assertFalse(blockers.call_args[1]['closures'])
+        self.assertEqual(stdout.getvalue(),
+                         'Fetched 3, refreshed 2, and skipped 1 cached '
+                         'lookup\n')
+
+    def test_cli_for_batch(self):
+        parsed = ciu_main.arguments_from_cli(['-p', 'foo'])
+        self.assertIsNone(ciu_main.batch_from_parsed(parsed))
+        parsed = ciu_main.arguments_from_cli(['-p', 'foo', '--batch'])
+        self.assertIsInstance(ciu_main.batch_from_parsed(parsed),
+                              pypi.JSONBatchProtocol)
+
+    def test_cli_for_target(self):
+        parsed = ciu_main.arguments_from_cli(['-p', 'foo', '--target', '3',
+                                              '3.8'])
+        self.assertEqual(parsed.target, ['3', '3.8'])
+
+    @mock.patch('argparse.ArgumentParser.error', side_effect=SystemExit)
+    def test_cli_for_invalid_target(self, parser_error):
+        with self.assertRaises(SystemExit):
+            ciu_main.arguments_from_cli(['-p', 'foo', '--target', 'py3'])
+
+    def test_check_targets(self):
+        by_target = {'3': {}, '3.12': {'a': None, 'b': 'a'}}
+        with mock.patch('caniusepython3.dependencies.target_reasons',
+                        return_value=by_target) as target_reasons:
+            with mock.patch('sys.stdout', io.StringIO()) as stdout:
+                passed = ciu_main.check(['a'], targets=['3', '3.12'],
+                                        output_format='json')
+        self.assertFalse(passed)
+        self.assertEqual(target_reasons.call_args[0][1], ['3', '3.12'])
+        document = json.loads(stdout.getvalue())
+        self.assertEqual(document['targets']['3'],
+                         {'ported': True, 'blockers': []})
+        self.assertEqual(document['targets']['3.12'],
+                         {'ported': False, 'blockers': [['b', 'a']]})
+
+    def test_report_targets(self):
+        with mock.patch('sys.stdout', io.StringIO()) as stdout:
+            ciu_main.report_targets([('3', set()),
+                                     ('3.12', {('b', 'a')})])
+        self.assertEqual(stdout.getvalue(),
+                         '\nPython 3: 0 projects blocking\n'
+                         '\nPython 3.12: 2 projects blocking\n'
+                         '  b (which is blocking a)\n')
+
+    @offline
+    def test_lookups_start_while_reading(self):
+        with mock.patch('caniusepython3.dependencies.blockers',
+                        return_value=[]) as blockers:
+            with mock.patch('sys.stdout', io.StringIO()):
+                ciu_main.main(['--projects', 'foo', '--no-cache'])
+        args, kwargs = blockers.call_args
+        self.assertEqual(args[0], {'foo'})
+        self.assertIsInstance(kwargs['cache'], cache.MemoryCache)
+        self.assertEqual(kwargs['overrides'], frozenset())
+        self.assertIn('executor', kwargs)
+
+    def test_prefetches_cancelled_once_read(self):
+        # Queued lookups would otherwise keep running after the report.
+        looked_up = []
+        released = threading.Event()
+
+        def project_info(project_name, *args, **kwargs):
+            looked_up.append(project_name)
+            released.wait(5)
+
+        with mock.patch.multiple('caniusepython3.pypi',
+                                 manual_overrides=lambda: frozenset(),
+                                 project_info=project_info):
+            with mock.patch('caniusepython3.dependencies.blockers',
+                            return_value=[]) as blockers:
+                with mock.patch('sys.stdout', io.StringIO()):
+                    ciu_main.main(['-p', 'a', 'b', 'c', '--no-cache',
+                                   '--jobs', '1'])
+            released.set()
+            blockers.call_args[1]['executor'].shutdown(wait=True)
+        self.assertLessEqual(set(looked_up), {'a'})
+
+    def test_deadline_from_parsed(self):
+        parsed = ciu_main.arguments_from_cli(['-p', 'foo', '--deadline', '60'])
+        # Reading the inputs counts towards the deadline.
+        with mock.patch.object(ciu_main, '_now',
+                               return_value=parsed.started + 50):
+            self.assertEqual(ciu_main.deadline_from_parsed(parsed), 10)
+        with mock.patch.object(ciu_main, '_now',
+                               return_value=parsed.started + 70):
+            self.assertEqual(ciu_main.deadline_from_parsed(parsed), 0)
+        parsed = ciu_main.arguments_from_cli(['-p', 'foo'])
+        self.assertIsNone(ciu_main.deadline_from_parsed(parsed))
+
+    def test_iter_projects_from_parsed(self):
+        with tempfile.NamedTemporaryFile('w') as file:
+            file.write(EXAMPLE_REQUIREMENTS)
+            file.flush()
+            parsed = ciu_main.arguments_from_cli(['-r', file.name,
+                                                  '-p', 'foo'])
+            got = ciu_main.iter_projects_from_parsed(parsed)
+            # Named projects come first, without waiting on any file.
+            self.assertEqual(next(got), 'foo')
+            self.assertEqual(set(got), self.expected_requirements)
+
+    def test_cli_for_deadline(self):
+        parsed = ciu_main.arguments_from_cli(['-p', 'foo', '--deadline', '60'])
+        self.assertEqual(parsed.deadline, 60)
+        parsed = ciu_main.arguments_from_cli(['-p', 'foo'])
+        self.assertIsNone(parsed.deadline)
+
+    def test_cli_for_limits(self):
+        args = ['-p', 'foo', '--max-depth', '2', '--max-requests', '100']
+        parsed = ciu_main.arguments_from_cli(args)
+        self.assertEqual(parsed.max_depth, 2)
+        self.assertEqual(parsed.max_requests, 100)
+        parsed = ciu_main.arguments_from_cli(['-p', 'foo'])
+        self.assertIsNone(parsed.max_depth)
+        self.assertIsNone(parsed.max_requests)
+
+    def test_pprint_truncated(self):
+        got = ciu_main.pprint_blockers({('B', 'A'), ('C',)}, {'B'})
+        self.assertEqual(got, ['B (which is blocking A) [truncated]', 'C'])
+
+    def test_limit_report(self):
+        incomplete = dependencies.IncompleteResolution('max-depth', {('A',)},
+                                                       {'A'})
+        with mock.patch('caniusepython3.dependencies.blockers',
+                        side_effect=incomplete) as blockers:
+            with mock.patch('sys.stdout', io.StringIO()) as stdout:
+                with self.assertRaises(dependencies.IncompleteResolution):
+                    ciu_main.check(['A'], max_depth=0)
+        self.assertEqual(blockers.call_args[1]['max_depth'], 0)
+        self.assertIn('Stopped early (maximum depth reached)',
+                      stdout.getvalue())
+
+    def test_cli_for_fail_fast(self):
+        parsed = ciu_main.arguments_from_cli(['-p', 'foo', '--fail-fast'])
+        self.assertTrue(parsed.fail_fast)
+        parsed = ciu_main.arguments_from_cli(['-p', 'foo'])
+        self.assertFalse(parsed.fail_fast)
+
+    def test_json_blockers_fail_fast(self):
+        got = json.loads(ciu_main.json_blockers({('A',)}, fail_fast=True))
+        self.assertEqual(got['incomplete'], 'fail-fast')
+        got = json.loads(ciu_main.json_blockers(set(), fail_fast=True))
+        self.assertNotIn('incomplete', got)
+
+    def test_check_fail_fast(self):
+        with mock.patch('caniusepython3.dependencies.blockers',
+                        return_value={('A',)}) as blockers:
+            with mock.patch('sys.stdout', io.StringIO()) as stdout:
+                self.assertFalse(ciu_main.check(['A'], fail_fast=True))
+        self.assertTrue(blockers.call_args[1]['fail_fast'])
+        self.assertIn('Stopped at the first confirmed blocker',
+                      stdout.getvalue())
+
+    def test_json_blockers_incomplete(self):
+        incomplete = dependencies.IncompleteResolution('deadline', {('A',)},
+                                                       {'A', 'B'})
+        got = json.loads(ciu_main.json_blockers(incomplete.blockers,
+                                                incomplete))
+        self.assertEqual(got, {'ported': False, 'blockers': [['A']],
+                               'incomplete': 'deadline',
+                               'truncated': [['A']],
+                               'unresolved': ['A', 'B']})
+
+    def test_incomplete_report(self):
+        incomplete = dependencies.IncompleteResolution('deadline', {('A',)},
+                                                       {'A', 'B'})
+        with mock.patch('caniusepython3.dependencies.blockers',
+                        side_effect=incomplete):
+            with mock.patch('sys.stdout', io.StringIO()) as stdout:
+                with self.assertRaises(dependencies.IncompleteResolution):
+                    ciu_main.check(['A'], deadline=1)
+        output = stdout.getvalue()
+        self.assertIn('Stopped early (deadline reached)', output)
+        self.assertIn('  A [truncated]\n', output)
+        self.assertIn('Unresolved projects (2): A, B', output)
+
+    @offline
+    def test_incomplete_return_code(self):
+        incomplete = dependencies.IncompleteResolution('interrupted', set(),
+                                                       {'foo'})
+        with mock.patch('caniusepython3.dependencies.blockers',
+                        side_effect=incomplete):
+            with mock.patch('sys.stdout', io.StringIO()):
+                with self.assertRaises(SystemExit) as context:
+                    ciu_main.main(['--projects', 'foo', '--no-cache'])
+        self.assertEqual(context.exception.code, 4)
+
+    def test_cli_for_cache_bundles(self):
+        parsed = ciu_main.cache_arguments_from_cli(
+                ['import', 'a.bundle', 'b.bundle', '--cache-dir', 'some-dir'])
+        self.assertEqual(parsed.action, 'import')
+        self.assertEqual(parsed.bundles, ['a.bundle', 'b.bundle'])
+        self.assertEqual(parsed.cache_dir, 'some-dir')
+
+    @mock.patch('argparse.ArgumentParser.error', side_effect=SystemExit)
+    def test_cli_for_cache_export_one_bundle(self, parser_error):
+        with self.assertRaises(SystemExit):
+            ciu_main.cache_arguments_from_cli(['export', 'a', 'b'])
+
+    def test_cache_export_and_import(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        source = os.path.join(directory, 'source')
+        cache.ResultCache(source).set('key', 1)
+        bundle = os.path.join(directory, 'cache.bundle')
+        destination = os.path.join(directory, 'destination')
+        with mock.patch('sys.stdout', io.StringIO()) as stdout:
+            ciu_main.main(['cache', 'export', bundle, '--cache-dir', source])
+            ciu_main.main(['cache', 'import', bundle,
+                           '--cache-dir', destination])
+        self.assertEqual(stdout.getvalue(),
+                         'Exported 1 entry to {0}\n'
+                         'Imported 1 of 1 entry from {0}\n'.format(bundle))
+        self.assertEqual(cache.ResultCache(destination).get('key'), 1)
+
+    def test_cache_import_corrupt(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        bundle = os.path.join(directory, 'cache.bundle')
+        with gzip.open(bundle, 'wb') as file:
+            file.write('{{"format": {0}}}\nnot json\n'.format(
+                    cache.BUNDLE_FORMAT).encode('utf-8'))
+        with self.assertRaises(SystemExit) as context:
+            ciu_main.main(['cache', 'import', bundle, '--cache-dir',
+                           os.path.join(directory, 'cache')])
+        self.assertTrue(str(context.exception).startswith('error: '))
+
+    def test_cli_for_processes(self):
+        parsed = ciu_main.arguments_from_cli(['-p', 'foo', '--processes', '4'])
+        self.assertEqual(parsed.processes, 4)
+
+    def test_check_processes(self):
+        with mock.patch('caniusepython3.dependencies.sharded_blockers',
+                        return_value=set()) as sharded_blockers:
+            with mock.patch('sys.stdout', io.StringIO()):
+                self.assertTrue(ciu_main.check(['A'], 'some-url',
+                                               processes=4))
+        args, kwargs = sharded_blockers.call_args
+        self.assertEqual(args, (['A'], 4))
+        self.assertEqual(kwargs['index_url'], 'some-url')
+
+    @mock.patch('argparse.ArgumentParser.error', side_effect=SystemExit)
+    def test_cli_processes_and_replay(self, parser_error):
+        with self.assertRaises(SystemExit):
+            ciu_main.arguments_from_cli(['-p', 'foo', '--processes', '2',
+                                         '--replay', 'a.db'])
+
+    @mock.patch('argparse.ArgumentParser.error', side_effect=SystemExit)
+    def test_cli_shards_require_cache(self, parser_error):
+        for args in [['--processes', '2'],
+                     ['--shard', '1/2', '--save-reasons', 'part.json']]:
+            with self.assertRaises(SystemExit):
+                ciu_main.arguments_from_cli(['-p', 'foo', '--no-cache'] + args)
+
+    def test_cli_for_shard(self):
+        args = ['-p', 'foo', '--shard', '2/4', '--save-reasons', 'part.json']
+        parsed = ciu_main.arguments_from_cli(args)
+        self.assertEqual(parsed.shard, (1, 4))
+        self.assertEqual(parsed.save_reasons, 'part.json')
+
+    @mock.patch('argparse.ArgumentParser.error', side_effect=SystemExit)
+    def test_cli_shard_requires_save_reasons(self, parser_error):
+        with self.assertRaises(SystemExit):
+            ciu_main.arguments_from_cli(['-p', 'foo', '--shard', '1/2'])
+
+    @mock.patch('sys.stderr', io.StringIO())
+    def test_cli_bad_shard(self):
+        for spec in ['0/2', '3/2', 'first']:
+            with self.assertRaises(SystemExit):
+                ciu_main.arguments_from_cli(['-p', 'foo', '--shard', spec,
+                                             '--save-reasons', 'part.json'])
+
+    def test_shards_merged(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        paths = [os.path.join(directory, 'part{0}.json'.format(index))
+                 for index in range(2)]
+        reasons = [{'b': 'a', 'a': None}, {'c': None}]
+
+        def blocker_reasons(projects, *args, **kwargs):
+            return reasons.pop(0)
+        with mock.patch('caniusepython3.dependencies.blocker_reasons',
+                        blocker_reasons):
+            with mock.patch('sys.stdout', io.StringIO()):
+                for index, path in enumerate(paths):
+                    ciu_main.main(['-p', 'a', 'c', '--cache-dir', directory,
+                                   '--shard', '{0}/2'.format(index + 1),
+                                   '--save-reasons', path])
+        with mock.patch('sys.stdout', io.StringIO()) as stdout:
+            with self.assertRaises(SystemExit) as context:
+                ciu_main.main(['merge', '--format', 'json'] + paths)
+        self.assertEqual(context.exception.code, 3)
+        got = json.loads(stdout.getvalue())
+        self.assertEqual(got['blockers'], [['b', 'a'], ['c']])
+
+    def test_merge_missing_shard(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'part.json')
+        ciu_main.save_reasons(path, {}, (0, 2))
+        with self.assertRaises(ValueError) as context:
+            ciu_main.merge([path])
+        self.assertIn('missing shard(s) 2', str(context.exception))
+
+    def test_merge_not_saved_shard(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'part.json')
+        with open(path, 'w') as file:
+            file.write('[]')
+        with mock.patch('sys.stderr', io.StringIO()):
+            with self.assertRaises(SystemExit) as context:
+                ciu_main.main(['merge', path])
+        self.assertIn('is not a saved shard', context.exception.code)
+
     def test_message_plural(self):
         blockers = [['A'], ['B']]
         messages = ciu_main.message(blockers)
@@ -211,7 +745,8 @@ class CLITests(unittest.TestCase):
     def test_projects_must_be_specified(self, parser_error):
         ciu_main.arguments_from_cli([])
         self.assertEqual(
-            mock.call("Missing 'requirements', 'metadata', or 'projects'"),
+            mock.call("Missing 'requirements', 'metadata', 'projects', or "
+                      "'lockfile'"),
             parser_error.call_args)
 
     def test_verbose_output(self):
@@ -219,7 +754,8 @@ class CLITests(unittest.TestCase):
         self.assertTrue(logging.getLogger('ciu').isEnabledFor(logging.INFO))
 
     @mock.patch('caniusepython3.dependencies.blockers',
-                lambda projects, index_url: ['blocker'])
+                lambda projects, index_url, **kwargs: ['blocker'])
+    @offline
     def test_nonzero_return_code(self):
         args = ['--projects', 'foo', 'bar.baz']
         with self.assertRaises(SystemExit) as context:
@@ -227,6 +763,171 @@ class CLITests(unittest.TestCase):
         self.assertNotEqual(context.exception.code, 0)
 
 
+EXAMPLE_POETRY_LOCK = """
+[[package]]
+name = "App.Core"
+version = "1.0"
+
+[package.dependencies]
+requests = ">=2"
+colorama = {version = "*", markers = "sys_platform == \\"win32\\""}
+pyopenssl = {version = "*", optional = true}
+
+[[package]]
+name = "requests"
+version = "2.25.1"
+
+[package.dependencies]
+idna = [
+    {version = "<3", markers = "python_version < \\"3\\""},
+    {version = ">=3", markers = "python_version >= \\"3\\""},
+]
+
+[[package]]
+name = "idna"
+version = "3.1"
+
+[[package]]
+name = "colorama"
+version = "0.4.4"
+
+[[package]]
+name = "pytest"
+version = "6.2.2"
+
+[metadata]
+lock-version = "1.1"
+"""
+
+EXAMPLE_PIPFILE_LOCK = {
+    "_meta": {"hash": {"sha256": "..."}},
+    "default": {
+        "requests": {"version": "==2.25.1"},
+        "pywin32": {"version": "==300", "markers": "sys_platform == 'win32'"},
+    },
+    "develop": {"pytest": {"version": "==6.2.2"}},
+}
+
+EXAMPLE_PIP_REPORT = {
+    "version": "1",
+    "install": [
+        {"requested": True,
+         "metadata": {"name": "Requests", "version": "2.25.1",
+                      "requires_dist": ["idna<3,>=2.5",
+                                        "PySocks; extra == 'socks'"]}},
+        {"requested": False,
+         "metadata": {"name": "idna", "version": "2.10"}},
+    ],
+}
+
+
+class LockfileTests(unittest.TestCase):
+
+    def lockfile(self, contents, name):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, name)
+        with io.open(path, 'w', encoding='utf-8') as file:
+            if not isinstance(contents, str):
+                contents = json.dumps(contents)
+            file.write(contents)
+        return path
+
+    @unittest.skipIf(projects.toml is None, 'no TOML parser installed')
+    def test_poetry_lock(self):
+        got = projects.read_lockfile(self.lockfile(EXAMPLE_POETRY_LOCK,
+                                                   'poetry.lock'))
+        self.assertEqual(got.requirements, ['app-core', 'pytest'])
+        self.assertEqual(got.versions['requests'], '2.25.1')
+        self.assertEqual(got.graph['app-core'],
+                         ['colorama ; sys_platform == "win32"', 'requests'])
+        self.assertEqual(got.graph['requests'],
+                         ['idna ; python_version < "3"',
+                          'idna ; python_version >= "3"'])
+        self.assertEqual(got.graph['idna'], [])
+
+    @unittest.skipIf(projects.toml is None, 'no TOML parser installed')
+    def test_poetry_lock_cycle(self):
+        lock = """
+[[package]]
+name = "a"
+version = "1"
+[package.dependencies]
+b = "*"
+
+[[package]]
+name = "b"
+version = "1"
+[package.dependencies]
+a = "*"
+"""
+        got = projects.read_lockfile(self.lockfile(lock, 'poetry.lock'))
+        self.assertEqual(got.requirements, ['a'])
+
+    def test_pipfile_lock(self):
+        got = projects.read_lockfile(self.lockfile(EXAMPLE_PIPFILE_LOCK,
+                                                   'Pipfile.lock'))
+        self.assertEqual(got.requirements,
+                         ["pywin32 ; sys_platform == 'win32'", 'requests',
+                          'pytest'])
+        self.assertEqual(got.versions, {'pywin32': '300',
+                                        'requests': '2.25.1',
+                                        'pytest': '6.2.2'})
+        self.assertEqual(got.graph, {'pywin32': [], 'requests': [],
+                                     'pytest': []})
+
+    def test_pip_report(self):
+        got = projects.read_lockfile(self.lockfile(EXAMPLE_PIP_REPORT,
+                                                   'report.json'))
+        self.assertEqual(got.requirements, ['requests'])
+        self.assertEqual(got.versions, {'requests': '2.25.1', 'idna': '2.10'})
+        self.assertEqual(got.graph['requests'],
+                         ['idna<3,>=2.5', "PySocks; extra == 'socks'"])
+        self.assertEqual(got.graph['idna'], [])
+
+    def test_unknown_lockfile(self):
+        path = self.lockfile({'something': 'else'}, 'other.json')
+        self.assertRaises(projects.LockfileError, projects.read_lockfile,
+                          path)
+
+    def test_read_lockfiles(self):
+        got = projects.read_lockfiles(
+                [self.lockfile(EXAMPLE_PIPFILE_LOCK, 'Pipfile.lock'),
+                 self.lockfile(EXAMPLE_PIP_REPORT, 'report.json')])
+        self.assertEqual(got.versions['idna'], '2.10')
+        self.assertIn('pytest', got.graph)
+        self.assertEqual(len(got.requirements), 4)
+
+    def test_cli_for_lockfile(self):
+        path = self.lockfile(EXAMPLE_PIPFILE_LOCK, 'Pipfile.lock')
+        parsed = ciu_main.arguments_from_cli(['--lockfile', path,
+                                              '--platform', 'linux'])
+        locked = projects.read_lockfiles(parsed.lockfile)
+        got = ciu_main.projects_from_parsed(parsed, locked)
+        self.assertEqual(got, {'requests', 'pytest'})
+        self.assertEqual(ciu_main.versions_from_parsed(parsed, locked)['pytest'],
+                         '6.2.2')
+
+    @offline
+    def test_check_uses_lockfile_graph(self):
+        path = self.lockfile(EXAMPLE_PIP_REPORT, 'report.json')
+        with mock.patch('caniusepython3.dependencies.blockers',
+                        return_value=[]) as blockers:
+            with mock.patch('sys.stdout', io.StringIO()):
+                ciu_main.main(['--lockfile', path])
+        args, kwargs = blockers.call_args
+        self.assertEqual(args[0], {'requests'})
+        self.assertEqual(kwargs['versions'],
+                         {'requests': '2.25.1', 'idna': '2.10'})
+        self.assertIn('idna', kwargs['graph'])
+
+    def test_unreadable_lockfile(self):
+        path = self.lockfile({'something': 'else'}, 'other.json')
+        with self.assertRaises(SystemExit) as context:
+            ciu_main.main(['--lockfile', path])
+        self.assertIn('is not a Pipfile.lock', str(context.exception.code))
+
+
 #@unittest.skip('faster testing')
 class NetworkTests(unittest.TestCase):
 
@@ -14,14 +14,19 @@
 
 from __future__ import unicode_literals
 
-from caniusepython3 import command
+from caniusepython3 import command, pypi
 from caniusepython3.test import unittest, skip_pypi_timeouts, mock
 
 import setuptools  # To suppress a warning.
 from distutils import dist
+from distutils.errors import DistutilsOptionError
 
-def make_command(requires):
-    return command.Command(dist.Distribution(requires))
+def make_command(requires, **options):
+    cmd = command.Command(dist.Distribution(requires))
+    for option, value in options.items():
+        setattr(cmd, option, value)
+    cmd.ensure_finalized()
+    return cmd
 
 class RequiresTests(unittest.TestCase):
 
@@ -44,7 +49,7 @@ class RequiresTests(unittest.TestCase):
         self.assertEqual(got, frozenset(['pip']))
 
     @mock.patch('caniusepython3.dependencies.blockers',
-                lambda projects, index_url: ['blocker'])
+                lambda projects, index_url, **kwargs: ['blocker'])
     def test_nonzero_return_code(self):
         cmd = make_command({'install_requires': ['pip']})
         with self.assertRaises(SystemExit) as context:
@@ -58,6 +63,45 @@ class OptionsTests(unittest.TestCase):
         # Don't expect anything to happen.
         make_command({}).finalize_options()
 
+    def test_defaults(self):
+        cmd = make_command({})
+        self.assertEqual(cmd.index, pypi.PYPI_INDEX_URL)
+        self.assertIsNone(cmd.jobs)
+        self.assertIsNone(cmd.timeout)
+        self.assertEqual(cmd.output_format, 'text')
+
+    def test_conversion(self):
+        cmd = make_command({}, jobs='8', timeout='2.5')
+        self.assertEqual(cmd.jobs, 8)
+        self.assertEqual(cmd.timeout, 2.5)
+
+    def test_bad_number(self):
+        with self.assertRaises(DistutilsOptionError):
+            make_command({}, jobs='many')
+
+    def test_bad_output_format(self):
+        with self.assertRaises(DistutilsOptionError):
+            make_command({}, output_format='xml')
+
+    @mock.patch('caniusepython3.__main__.check', return_value=True)
+    def test_options_used(self, check):
+        cmd = make_command({'install_requires': ['pip']}, index='some-url',
+                           jobs='3', timeout='1', cache_dir='some-dir',
+                           output_format='json', fail_fast=True)
+        cmd.run()
+        args, kwargs = check.call_args
+        self.assertEqual(args, (['pip'], 'some-url'))
+        self.assertTrue(kwargs['fail_fast'])
+        self.assertEqual(kwargs['max_workers'], 3)
+        self.assertEqual(kwargs['timeout'], 1.0)
+        self.assertEqual(kwargs['output_format'], 'json')
+        self.assertEqual(kwargs['cache'].directory, 'some-dir')
+
+    @mock.patch('caniusepython3.__main__.check', return_value=True)
+    def test_no_cache(self, check):
+        make_command({'install_requires': ['pip']}, no_cache=True).run()
+        self.assertIsNone(check.call_args[1]['cache'])
+
 
 class NetworkTests(unittest.TestCase):
 
@@ -16,10 +16,16 @@ from __future__ import unicode_literals
 import setuptools  # To silence a warning.
 import distlib.locators
 
-from caniusepython3 import dependencies, pypi
-from caniusepython3.test import mock, unittest
+from caniusepython3 import cache, dependencies, projects, pypi
+from caniusepython3.test import mock, unittest, StandInIndex
 
+import concurrent.futures
 import io
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
 
 
 class GraphResolutionTests(unittest.TestCase):
@@ -63,7 +69,675 @@ class DependenciesTests(unittest.TestCase):
         got = dependencies.dependencies('does not matter')
         self.assertEqual({'easy-thumbnail', 'stuff'}, frozenset(got))
 
-# XXX Tests covering dependency loops, e.g. a -> b, b -> a.
+    @mock.patch('distlib.locators.locate')
+    def test_version(self, locate_mock):
+        locate_mock.return_value = None
+        dependencies.dependencies('project', version='1.2.3')
+        self.assertEqual(locate_mock.call_args[0][0], 'project (== 1.2.3)')
+
+    @mock.patch('distlib.locators.locate')
+    def test_cached(self, locate_mock):
+        class FakeLocated(object):
+            run_requires = ['six']
+        locate_mock.return_value = FakeLocated()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        result_cache = cache.ResultCache(directory)
+        for _ in range(2):
+            got = dependencies.dependencies('project', cache=result_cache)
+            self.assertEqual({'six'}, got)
+        self.assertEqual(locate_mock.call_count, 1)
+
+    def located_dependencies(self, environment):
+        class FakeLocated(object):
+            run_requires = ['futures; python_version < "3"',
+                            'pywin32; sys_platform == "win32"',
+                            'pyopenssl; extra == "security"',
+                            'six']
+        with mock.patch('distlib.locators.locate',
+                        lambda *args, **kwargs: FakeLocated()):
+            return frozenset(dependencies.dependencies('does not matter',
+                                                       environment))
+
+    def test_markers(self):
+        environment = dependencies.target_environment('3.8', 'linux')
+        self.assertEqual({'six'}, self.located_dependencies(environment))
+
+    def test_markers_platform(self):
+        environment = dependencies.target_environment('3.8', 'win32')
+        self.assertEqual({'six', 'pywin32'},
+                         self.located_dependencies(environment))
+
+    def test_markers_python_version(self):
+        environment = dependencies.target_environment('2.7', 'linux')
+        self.assertEqual({'six', 'futures'},
+                         self.located_dependencies(environment))
+
+    def test_markers_extras(self):
+        environment = dependencies.target_environment('3.8', 'linux',
+                                                      ['security'])
+        self.assertEqual({'six', 'pyopenssl'},
+                         self.located_dependencies(environment))
+
+
+class TargetEnvironmentTests(unittest.TestCase):
+
+    def test_defaults(self):
+        environment = dependencies.target_environment()
+        self.assertIn('python_version', environment)
+        self.assertEqual((), environment['extras'])
+
+    def test_python_version(self):
+        environment = dependencies.target_environment('3.6')
+        self.assertEqual('3.6', environment['python_version'])
+        self.assertEqual('3.6.0', environment['python_full_version'])
+
+    def test_platform(self):
+        environment = dependencies.target_environment(platform='win32')
+        self.assertEqual('win32', environment['sys_platform'])
+        self.assertEqual('nt', environment['os_name'])
+        self.assertEqual('Windows', environment['platform_system'])
+
+class FakeIndex(object):
+
+    """Stand in for the index when finding blockers.
+
+    The 'graph' maps projects to their dependencies; projects missing from it
+    can't be found. Lookups for 'slow' projects block until released. The
+    'classifiers' of projects are only used to judge Python versions other
+    than 3, with ported projects defaulting to supporting Python 3.
+    """
+
+    def __init__(self, graph, ported=(), overrides=(), slow=(),
+                 known_ported=(), classifiers={}):
+        self.graph = graph
+        self.classifiers = classifiers
+        self.ported = frozenset(ported)
+        self.overrides = frozenset(overrides)
+        self.known_ported = frozenset(known_ported)
+        self.slow = frozenset(slow)
+        self.released = threading.Event()
+        self.status_lookups = []
+        self.dependency_lookups = []
+
+    def supports_py3(self, project_name, **kwargs):
+        self.status_lookups.append(project_name)
+        if project_name in self.slow:
+            self.released.wait(10)
+        return project_name in self.ported
+
+    def project_info(self, project_name, *args, **kwargs):
+        self.status_lookups.append(project_name)
+        classifiers = self.classifiers.get(project_name)
+        if classifiers is None:
+            classifiers = ['3'] if project_name in self.ported else []
+        return {'classifiers': ['Programming Language :: Python :: ' + version
+                                for version in classifiers],
+                'requires_python': None}
+
+    def dependencies(self, project_name, *args, **kwargs):
+        self.dependency_lookups.append(project_name)
+        if project_name in self.slow:
+            self.released.wait(10)
+        deps = self.graph.get(project_name)
+        return None if deps is None else set(deps)
+
+    def install(self, test):
+        patches = [mock.patch('caniusepython3.pypi.manual_overrides',
+                              lambda: self.overrides),
+                   mock.patch('caniusepython3.pypi.known_ported',
+                              lambda: self.known_ported),
+                   mock.patch('caniusepython3.pypi.supports_py3',
+                              self.supports_py3),
+                   mock.patch('caniusepython3.pypi.project_info',
+                              self.project_info),
+                   mock.patch('caniusepython3.dependencies.dependencies',
+                              self.dependencies)]
+        for patch in patches:
+            patch.start()
+            test.addCleanup(patch.stop)
+        test.addCleanup(self.released.set)
+        return self
+
+
+class BlockersTests(unittest.TestCase):
+
+    def test_blockers(self):
+        graph = {'a': ['b', 'c'], 'b': ['d'], 'c': [], 'd': []}
+        FakeIndex(graph, ported=['c']).install(self)
+        got = dependencies.blockers(['a'])
+        self.assertEqual(got, {('d', 'b', 'a')})
+
+    def test_ported(self):
+        index = FakeIndex({'a': ['b']}, ported=['a', 'b']).install(self)
+        self.assertEqual(dependencies.blockers(['a']), set())
+        self.assertEqual(index.dependency_lookups, [])
+
+    def test_overrides(self):
+        index = FakeIndex({'a': ['b'], 'b': []}, overrides=['b']).install(self)
+        self.assertEqual(dependencies.blockers(['a']), {('a',)})
+        self.assertNotIn('b', index.status_lookups)
+
+    def test_known_ported(self):
+        index = FakeIndex({'a': ['b'], 'b': []},
+                          known_ported=['b']).install(self)
+        self.assertEqual(dependencies.blockers(['a']), {('a',)})
+        self.assertNotIn('b', index.status_lookups)
+
+    def test_futures(self):
+        FakeIndex({'a': []}).install(self)
+        executor = mock.Mock()
+        futures = []
+        names = dependencies.prefetched(['a', 'a'], executor, futures=futures)
+        self.assertEqual(list(names), ['a', 'a'])
+        self.assertEqual(futures, [executor.submit.return_value])
+
+    def test_known_ported_other_index(self):
+        # The snapshot is of PyPI, not of private indexes.
+        index = FakeIndex({'a': ['b'], 'b': []},
+                          known_ported=['b']).install(self)
+        got = dependencies.blockers(['a'],
+                                    index_url='https://internal.example/pypi')
+        self.assertEqual(got, {('b', 'a')})
+        self.assertIn('b', index.status_lookups)
+
+    def test_known_ported_pinned(self):
+        # The snapshot says nothing about older releases.
+        index = FakeIndex({'a': ['b'], 'b': []},
+                          known_ported=['b']).install(self)
+        got = dependencies.blockers(['a'], versions={'b': '1.0'})
+        self.assertEqual(got, {('b', 'a')})
+        self.assertIn('b', index.status_lookups)
+
+    def test_shared_dependency(self):
+        graph = {'a': ['c'], 'b': ['c'], 'c': []}
+        index = FakeIndex(graph).install(self)
+        got = dependencies.blockers(['a', 'b'])
+        self.assertEqual(got, {('c', 'a'), ('b',)})
+        self.assertEqual(index.status_lookups.count('c'), 1)
+
+    def test_not_found(self):
+        FakeIndex({'a': ['b']}).install(self)
+        self.assertEqual(dependencies.blockers(['a']), {('a',)})
+
+    def test_deadline(self):
+        graph = {'a': ['b', 'c'], 'b': [], 'c': []}
+        FakeIndex(graph, slow=['c']).install(self)
+        with self.assertRaises(dependencies.IncompleteResolution) as context:
+            dependencies.blockers(['a'], deadline=0.5)
+        exc = context.exception
+        self.assertEqual(exc.reason, 'deadline')
+        self.assertEqual(exc.unresolved, {'b', 'c'})
+        self.assertEqual(exc.blockers, {('b', 'a')})
+
+    def test_interrupted(self):
+        FakeIndex({'a': []}).install(self)
+        with mock.patch('concurrent.futures.wait',
+                        side_effect=KeyboardInterrupt):
+            with self.assertRaises(dependencies.IncompleteResolution) as context:
+                dependencies.blockers(['a'])
+        self.assertEqual(context.exception.reason, 'interrupted')
+        self.assertEqual(context.exception.unresolved, {'a'})
+
+    def test_max_depth(self):
+        graph = {'a': ['b'], 'b': ['c'], 'c': []}
+        index = FakeIndex(graph).install(self)
+        with self.assertRaises(dependencies.IncompleteResolution) as context:
+            dependencies.blockers(['a'], max_depth=1)
+        exc = context.exception
+        self.assertEqual(exc.reason, 'max-depth')
+        self.assertEqual(exc.blockers, {('b', 'a')})
+        self.assertEqual(exc.unresolved, {'b'})
+        self.assertNotIn('c', index.status_lookups)
+
+    def test_max_depth_not_reached(self):
+        FakeIndex({'a': ['b'], 'b': []}, ported=['b']).install(self)
+        self.assertEqual(dependencies.blockers(['a'], max_depth=1), {('a',)})
+
+    def test_max_requests(self):
+        graph = {'a': ['b', 'c'], 'b': [], 'c': []}
+        index = FakeIndex(graph).install(self)
+        with self.assertRaises(dependencies.IncompleteResolution) as context:
+            dependencies.blockers(['a'], max_requests=3)
+        exc = context.exception
+        self.assertEqual(exc.reason, 'max-requests')
+        self.assertEqual(len(index.status_lookups + index.dependency_lookups),
+                         3)
+        self.assertEqual(exc.blockers, {('b', 'a')})
+        self.assertEqual(exc.unresolved, {'b', 'c'})
+
+    def test_fail_fast(self):
+        index = FakeIndex({'a': ['b'], 'b': []}).install(self)
+        self.assertEqual(dependencies.blockers(['a'], fail_fast=True),
+                         {('a',)})
+        self.assertNotIn('b', index.status_lookups)
+
+    def test_fail_fast_not_found(self):
+        # A project which can't be located doesn't confirm a blocker.
+        FakeIndex({'a': ['b'], 'b': ['c'], 'c': []}).install(self)
+        self.assertEqual(dependencies.blockers(['x', 'a'], fail_fast=True),
+                         {('a',)})
+
+    def test_fail_fast_unconfirmed_dropped(self):
+        # 'a' blocks but its dependencies are still being looked up (and
+        # can't be found) when 'b' is confirmed.
+        index = FakeIndex({'b': []}).install(self)
+
+        def dependencies_(project_name, *args, **kwargs):
+            if project_name == 'a':
+                index.released.wait(10)
+            return index.dependencies(project_name)
+
+        patch = mock.patch('caniusepython3.dependencies.dependencies',
+                           dependencies_)
+        patch.start()
+        self.addCleanup(patch.stop)
+        got = dependencies.blockers(['a', 'b'], max_workers=2, fail_fast=True)
+        self.assertEqual(got, {('b',)})
+
+    def test_fail_fast_likely_blockers_first(self):
+        index = FakeIndex({'a': [], 'b': [], 'c': []}).install(self)
+        memory = cache.MemoryCache()
+        memory.set(pypi.PYPI_INDEX_URL + '/c/json',
+                   {'classifiers': [], 'requires_python': None})
+        memory.set('distlib:b', ['x', 'y'])
+        dependencies.blockers(['a', 'b', 'c'], cache=memory, max_workers=1,
+                              fail_fast=True)
+        self.assertEqual(index.status_lookups, ['c', 'b', 'a'])
+        self.assertEqual(index.dependency_lookups[0], 'c')
+
+    def test_excluded(self):
+        graph = {'a': ['mycorp-b', 'c'], 'mycorp-b': ['d'], 'c': [], 'd': [],
+                 'mycorp-e': []}
+        index = FakeIndex(graph).install(self)
+        excluded = projects.ProjectMatcher(['mycorp-*'])
+        got = dependencies.blockers(['a', 'mycorp-e'], excluded=excluded)
+        self.assertEqual(got, {('c', 'a')})
+        self.assertEqual(sorted(index.status_lookups), ['a', 'c'])
+
+    def test_excluded_closure(self):
+        # A cached closure holding an excluded project isn't spliced in.
+        FakeIndex({'a': ['b'], 'b': []}).install(self)
+        memory = cache.MemoryCache()
+        dependencies.blockers(['a'], cache=memory)
+        got = dependencies.blockers(['a'], cache=memory,
+                                    excluded=projects.ProjectMatcher(['b']))
+        self.assertEqual(got, {('a',)})
+
+    def test_graph(self):
+        index = FakeIndex({}).install(self)
+        graph = {'a': ['b', 'c ; sys_platform == "win32"'], 'b': [], 'c': []}
+        environment = dependencies.target_environment(platform='linux')
+        got = dependencies.blockers(['a'], environment=environment,
+                                    graph=graph)
+        self.assertEqual(got, {('b', 'a')})
+        self.assertEqual(index.status_lookups, ['a', 'b'])
+        self.assertEqual(index.dependency_lookups, [])
+
+    def test_graph_requests(self):
+        # Dependencies taken from the graph don't count as requests.
+        index = FakeIndex({'b': []}).install(self)
+        got = dependencies.blockers(['a'], graph={'a': ['b']}, max_requests=3)
+        self.assertEqual(got, {('b', 'a')})
+        self.assertEqual(index.dependency_lookups, ['b'])
+
+
+class BatchBlockersTests(unittest.TestCase):
+
+    GRAPH = {'a': ['b', 'c'], 'b': ['d'], 'c': [], 'd': []}
+
+    def blockers(self, batch):
+        index = StandInIndex({'a': [], 'b': [], 'd': [],
+                              'c': ['Programming Language :: Python :: 3']},
+                             batch)
+        self.addCleanup(index.close)
+        with mock.patch('caniusepython3.pypi.known_ported', frozenset):
+            got = dependencies.blockers(['a'], index.url, overrides=set(),
+                                        graph=self.GRAPH,
+                                        batch=pypi.JSONBatchProtocol())
+        return got, index.requests
+
+    def test_one_request_per_level(self):
+        got, requests = self.blockers(batch=True)
+        self.assertEqual(got, {('d', 'b', 'a')})
+        self.assertEqual(requests, [('POST', '/batch')] * 3)
+
+    def test_fallback(self):
+        got, requests = self.blockers(batch=False)
+        self.assertEqual(got, {('d', 'b', 'a')})
+        self.assertEqual(requests[0], ('POST', '/batch'))
+        self.assertEqual(sorted(requests[1:]),
+                         [('GET', '/{0}/json'.format(project))
+                          for project in 'abcd'])
+
+
+class ClosureTests(unittest.TestCase):
+
+    GRAPH = {'a': ['b'], 'x': ['b'], 'b': ['c', 'd'], 'c': [], 'd': []}
+
+    def setUp(self):
+        self.index = FakeIndex(self.GRAPH, ported=['d']).install(self)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.cache = cache.ResultCache(directory)
+        dependencies.blockers(['a'], cache=self.cache)
+        self.index.status_lookups[:] = []
+        self.index.dependency_lookups[:] = []
+
+    def test_spliced(self):
+        got = dependencies.blockers(['x'], cache=self.cache)
+        self.assertEqual(got, {('c', 'b', 'x')})
+        self.assertEqual(self.index.status_lookups, ['x'])
+        self.assertEqual(self.index.dependency_lookups, ['x'])
+
+    def test_disabled(self):
+        # As when warming the cache, where only lookups should be counted.
+        self.cache.stats.clear()
+        got = dependencies.blockers(['a'], cache=self.cache, closures=False)
+        self.assertEqual(got, {('c', 'b', 'a')})
+        self.assertEqual(self.index.status_lookups, ['a', 'b', 'c', 'd'])
+        self.assertEqual(self.cache.stats, {})
+
+    def test_top_level(self):
+        got = dependencies.blockers(['a'], cache=self.cache)
+        self.assertEqual(got, {('c', 'b', 'a')})
+        self.assertEqual(self.index.status_lookups, [])
+
+    def test_stored_for_spliced_searches(self):
+        dependencies.blockers(['x'], cache=self.cache)
+        self.index.status_lookups[:] = []
+        dependencies.blockers(['x'], cache=self.cache)
+        self.assertEqual(self.index.status_lookups, [])
+
+    def test_pinned_below(self):
+        # The closure of b was found with the latest release of c.
+        got = dependencies.blockers(['x'], versions={'c': '1.0'},
+                                    cache=self.cache)
+        self.assertEqual(got, {('c', 'b', 'x')})
+        self.assertIn('c', self.index.status_lookups)
+
+    def test_changelog(self):
+        # Moving on to a new serial keeps the closures...
+        self.cache.set('serial:' + pypi.PYPI_INDEX_URL,
+                       {'serial': 42, 'since': 0}, immutable=True)
+        dependencies.blockers(['a'], cache=self.cache)
+        self.assertEqual(self.index.status_lookups, [])
+        # ... unless a project in them changed.
+        changelog = [['Unrelated', '1.0', 0, 'new release', 43],
+                     ['C', '2.0', 0, 'new release', 44]]
+        with mock.patch('caniusepython3.pypi._xmlrpc',
+                        return_value=changelog):
+            pypi.sync_cache(self.cache)
+        dependencies.blockers(['x'], cache=self.cache)
+        self.assertIn('b', self.index.status_lookups)
+
+    def test_fail_fast(self):
+        got = dependencies.blockers(['a'], cache=self.cache, fail_fast=True)
+        self.assertEqual(got, {('c', 'b', 'a')})
+        self.assertEqual(self.index.status_lookups, [])
+
+    def test_excluded(self):
+        # The closure found while b was excluded leaves out its blockers.
+        excluded = projects.ProjectMatcher(['b'])
+        got = dependencies.blockers(['x'], cache=self.cache, excluded=excluded)
+        self.assertEqual(got, {('x',)})
+        got = dependencies.blockers(['x'], cache=self.cache)
+        self.assertEqual(got, {('c', 'b', 'x')})
+
+    def test_excluded_by_function(self):
+        # What a function excludes can't be told apart, so nothing is cached.
+        excluded = lambda project_name: project_name == 'b'
+        dependencies.blockers(['x'], cache=self.cache, excluded=excluded)
+        got = dependencies.blockers(['x'], cache=self.cache)
+        self.assertEqual(got, {('c', 'b', 'x')})
+        self.assertIn('x', self.index.dependency_lookups[1:])
+
+    def test_not_stored_when_incomplete(self):
+        memory = cache.MemoryCache()
+        with self.assertRaises(dependencies.IncompleteResolution):
+            dependencies.blockers(['x'], cache=memory, max_requests=2)
+        self.assertFalse([key for key in memory._entries
+                          if key.startswith('closure:')])
+
+
+class TargetReasonsTests(unittest.TestCase):
+
+    def test_targets(self):
+        graph = {'r': ['a', 'b'], 'a': ['c'], 'b': [], 'c': []}
+        classifiers = {'r': [], 'a': ['3.8'], 'b': ['3.12'], 'c': []}
+        index = FakeIndex(graph, classifiers=classifiers).install(self)
+        got = dependencies.target_reasons(['r'], ['3', '3.8', '3.12'])
+        self.assertEqual(got['3'], {'r': None})
+        self.assertEqual(got['3.8'], {'r': None, 'b': 'r'})
+        self.assertEqual(got['3.12'], {'r': None, 'a': 'r', 'c': 'a'})
+        self.assertEqual(sorted(index.status_lookups), ['a', 'b', 'c', 'r'])
+        self.assertEqual(sorted(index.dependency_lookups),
+                         ['a', 'b', 'c', 'r'])
+
+    def test_known_ported_unused(self):
+        # The snapshot says nothing about specific versions.
+        index = FakeIndex({'a': []}, known_ported=['a'],
+                          classifiers={'a': ['3.6']}).install(self)
+        got = dependencies.target_reasons(['a'], ['3.12'])
+        self.assertEqual(got, {'3.12': {'a': None}})
+        self.assertEqual(index.status_lookups, ['a'])
+
+
+class TraversalTests(unittest.TestCase):
+
+    # r -> a -> c, r -> b (ported), c -> r (a cycle), a -> x (excluded).
+    graph = {'r': {'a', 'b'}, 'a': {'c', 'x'}, 'b': set(), 'c': {'r'},
+             'x': set()}
+    ported = {'b'}
+
+    def recorded(self):
+        results = {}
+        for project, deps in self.graph.items():
+            results[dependencies.Lookup(dependencies.SUPPORT, project)] = (
+                    project in self.ported)
+            results[dependencies.Lookup(dependencies.DEPENDENCIES,
+                                        project)] = deps
+        return results
+
+    def test_levels(self):
+        traversal = dependencies.Traversal(['r'],
+                                           excluded=lambda name: name == 'x')
+        resolve = dependencies.replay_resolver(self.recorded())
+        asked = []
+        while True:
+            lookups = traversal.lookups()
+            if not lookups:
+                break
+            asked.append([tuple(lookup) for lookup in lookups])
+            traversal.feed(resolve(lookups))
+        self.assertEqual(asked, [[('support', 'r')], [('dependencies', 'r')],
+                                 [('support', 'a'), ('support', 'b')],
+                                 [('dependencies', 'a')], [('support', 'c')],
+                                 [('dependencies', 'c')]])
+        self.assertEqual(traversal.result(), {'r': None, 'a': 'r', 'c': 'a'})
+        self.assertEqual(traversal.edges, {'r': ['a', 'b'], 'a': ['c', 'x'],
+                                           'c': ['r']})
+
+    def test_outstanding(self):
+        traversal = dependencies.Traversal(['a', 'b'])
+        support = dependencies.SUPPORT
+        lookups = traversal.lookups()
+        traversal.feed([(lookups[0], True)])
+        self.assertEqual(traversal.lookups(),
+                         [dependencies.Lookup(support, 'b')])
+        self.assertEqual(traversal.unresolved, {'b'})
+        error = traversal.incomplete('deadline')
+        self.assertEqual(error.reason, 'deadline')
+        self.assertEqual(error.unresolved, {'b'})
+
+    def test_bounds(self):
+        traversal = dependencies.Traversal(['r'], max_requests=3)
+        with self.assertRaises(dependencies.IncompleteResolution) as context:
+            dependencies.drive(traversal,
+                               dependencies.replay_resolver(self.recorded()))
+        self.assertEqual(context.exception.reason, 'max-requests')
+        self.assertEqual(traversal.requests, 3)
+        traversal = dependencies.Traversal(['r'], max_depth=1)
+        with self.assertRaises(dependencies.IncompleteResolution) as context:
+            dependencies.drive(traversal,
+                               dependencies.replay_resolver(self.recorded()))
+        self.assertEqual(context.exception.reason, 'max-depth')
+
+    def test_fail_fast(self):
+        traversal = dependencies.Traversal(['r'])
+        reasons = dependencies.drive(
+                traversal, dependencies.replay_resolver(self.recorded()),
+                fail_fast=True)
+        self.assertEqual(reasons, {'r': None})
+
+    def test_unrecorded(self):
+        resolve = dependencies.replay_resolver({})
+        with self.assertRaises(LookupError):
+            dependencies.drive(dependencies.Traversal(['r']), resolve)
+
+    def test_threaded_resolver(self):
+        import concurrent.futures
+        recorded = self.recorded()
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            resolve = dependencies.threaded_resolver(recorded.get, executor)
+            reasons = dependencies.drive(dependencies.Traversal(['r']),
+                                         resolve)
+        self.assertEqual(reasons, {'r': None, 'a': 'r', 'c': 'a', 'x': 'a'})
+
+    @unittest.skipIf(sys.version_info < (3, 5), 'asyncio.gather() needed')
+    def test_asyncio_resolver(self):
+        import asyncio
+        recorded = self.recorded()
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        resolve = dependencies.asyncio_resolver(
+                lambda lookup: asyncio.sleep(0, result=recorded[lookup]), loop)
+        reasons = dependencies.drive(dependencies.Traversal(['r']), resolve)
+        self.assertEqual(reasons, {'r': None, 'a': 'r', 'c': 'a', 'x': 'a'})
+
+    def test_matches_blockers(self):
+        FakeIndex(dict((project, sorted(deps))
+                       for project, deps in self.graph.items()),
+                  ported=self.ported).install(self)
+        expected = dependencies.blocker_reasons(['r'])
+        traversal = dependencies.Traversal(['r'])
+        got = dependencies.drive(traversal,
+                                 dependencies.replay_resolver(self.recorded()))
+        self.assertEqual(got, expected)
+
+
+class PrefetchedTests(unittest.TestCase):
+
+    def test_lookups_start_while_reading(self):
+        index = FakeIndex({'a': ['c'], 'b': []}, ported=['b'],
+                          known_ported=['k']).install(self)
+        submitted = []
+
+        def submit(func, project):
+            submitted.append(project)
+            func(project)
+
+        names = dependencies.prefetched(iter(['a', 'b', 'a', 'k']),
+                                        mock.Mock(submit=submit))
+        self.assertEqual(next(names), 'a')
+        self.assertEqual(submitted, ['a'])
+        self.assertEqual(list(names), ['b', 'a', 'k'])
+        self.assertEqual(submitted, ['a', 'b'])
+        # Only the dependencies of blockers are looked up.
+        self.assertEqual(index.dependency_lookups, ['a'])
+
+    def test_overrides(self):
+        index = FakeIndex({'a': [], 'b': []}).install(self)
+        overrides = concurrent.futures.Future()
+        overrides.set_result(frozenset(['a']))
+        executor = mock.Mock(submit=lambda func, project: func(project))
+        names = dependencies.prefetched(['a', 'b'], executor,
+                                        overrides=overrides)
+        self.assertEqual(list(names), ['a', 'b'])
+        self.assertEqual(index.status_lookups, ['b'])
+
+    def test_known_ported_other_index(self):
+        FakeIndex({'k': []}, known_ported=['k']).install(self)
+        submitted = []
+        executor = mock.Mock(submit=lambda func, project:
+                             submitted.append(project))
+        names = dependencies.prefetched(
+                ['k'], executor, index_url='https://internal.example/pypi')
+        self.assertEqual(list(names), ['k'])
+        self.assertEqual(submitted, ['k'])
+
+
+class FakePool(object):
+
+    """Stand in for a process pool by running everything in-process."""
+
+    def __init__(self, processes):
+        self.processes = processes
+
+    def map(self, func, iterable):
+        return list(map(func, iterable))
+
+    def terminate(self):
+        pass
+
+    def join(self):
+        pass
+
+
+class ShardTests(unittest.TestCase):
+
+    def test_shard(self):
+        projects = ['project{0}'.format(index) for index in range(100)]
+        shards = [dependencies.shard(projects, index, 3)
+                  for index in range(3)]
+        self.assertEqual(sorted(sum(shards, [])), sorted(projects))
+        self.assertTrue(all(shards))
+        self.assertEqual(dependencies.shard(reversed(projects), 1, 3),
+                         list(reversed(shards[1])))
+
+    def test_merge_reasons(self):
+        merged = dependencies.merge_reasons([{'c': 'a', 'a': None},
+                                             {'c': 'b', 'b': None}])
+        self.assertEqual(merged, {'a': None, 'b': None, 'c': 'a'})
+
+    def test_merge_reasons_acyclic(self):
+        # 'a' and 'b' depend on each other, so shards reaching them from
+        # different projects disagree on which blocks which.
+        merged = dependencies.merge_reasons([
+                {'x': None, 'a': 'x', 'b': 'a'},
+                {'y': None, 'b': 'y', 'a': 'b'}])
+        self.assertEqual(dependencies.reasons_to_paths(merged),
+                         {('b', 'a', 'x'), ('y',)})
+
+    @mock.patch('multiprocessing.Pool', FakePool)
+    def test_sharded_blockers(self):
+        # 'b' and 'd' are in the first shard while 'e' is in the second.
+        graph = {'b': ['c'], 'e': ['c'], 'c': [], 'd': []}
+        FakeIndex(graph, ported=['d']).install(self)
+        got = dependencies.sharded_blockers(['e', 'd', 'b'], 2)
+        self.assertEqual(got, {('c', 'b'), ('e',)})
+
+    @mock.patch('multiprocessing.Pool', FakePool)
+    def test_sharded_blockers_incomplete(self):
+        # Only the second shard runs out of requests, before finding the
+        # dependencies of g.
+        graph = {'b': ['c'], 'e': ['f'], 'c': [], 'd': [], 'f': ['g'],
+                 'g': []}
+        FakeIndex(graph, ported=['d']).install(self)
+        with self.assertRaises(dependencies.IncompleteResolution) as context:
+            dependencies.sharded_blockers(['e', 'd', 'b'], 2, max_requests=5)
+        self.assertEqual(context.exception.reason, 'max-requests')
+        self.assertEqual(context.exception.blockers,
+                         {('c', 'b'), ('g', 'f', 'e')})
+        self.assertEqual(context.exception.unresolved, {'g'})
+
+    def test_incomplete_resolution_pickles(self):
+        exc = dependencies.IncompleteResolution('deadline', {('a',)}, {'b'})
+        unpickled = pickle.loads(pickle.dumps(exc))
+        self.assertEqual((unpickled.reason, unpickled.blockers,
+                          unpickled.unresolved),
+                         ('deadline', {('a',)}, {'b'}))
+
 
 class NetworkTests(unittest.TestCase):
 
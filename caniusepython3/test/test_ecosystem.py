@@ -0,0 +1,164 @@
+# Copyright 2014 Google Inc. All rights reserved.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import caniusepython3.__main__ as ciu_main
+from caniusepython3 import dependencies, ecosystem
+from caniusepython3.test import mock, unittest
+
+import gzip
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+
+PY3 = 'Programming Language :: Python :: 3'
+
+
+def release(name, version='1.0', requires=(), ported=False):
+    return {'name': name, 'version': version,
+            'classifiers': [PY3] if ported else [],
+            'requires_python': None, 'requires_dist': list(requires)}
+
+
+def closure(graph, ported, project):
+    """Find the blockers of a project by walking the graph."""
+    if ported[project]:
+        return set()
+    found = {project}
+    todo = [project]
+    while todo:
+        for dep in graph[todo.pop()]:
+            if dep not in found and not ported[dep]:
+                found.add(dep)
+                todo.append(dep)
+    return found
+
+
+@unittest.skipIf(ecosystem.scipy is None, 'NumPy and SciPy not installed')
+class EcosystemTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, releases, filename='dump.jsonl'):
+        path = os.path.join(self.directory, filename)
+        opener = gzip.open if filename.endswith('.gz') else io.open
+        with opener(path, 'wb') as file:
+            for each in releases:
+                file.write(json.dumps(each).encode('utf-8') + b'\n')
+        return path
+
+    def test_load_dump(self):
+        path = self.write([release('A', '1.0', ['missing']),
+                           release('a', '2.0', ['B', 'c; python_version<"3"']),
+                           release('b', ported=True),
+                           release('c')])
+        environment = dependencies.target_environment('3.8')
+        graph = ecosystem.load_dump([path], environment)
+        self.assertEqual(graph.names, ['a', 'b', 'c'])
+        self.assertEqual(list(graph.ported), [False, True, False])
+        self.assertEqual(graph.adjacency.toarray().tolist(),
+                         [[False, True, False], [False] * 3, [False] * 3])
+
+    def test_gzipped(self):
+        path = self.write([release('a', requires=['b']), release('b')],
+                          'dump.jsonl.gz')
+        graph = ecosystem.load_dump([path])
+        self.assertEqual(graph.adjacency.nnz, 1)
+
+    def test_not_a_release(self):
+        path = self.write([release('a'), ['not', 'a', 'release']])
+        with self.assertRaises(ValueError):
+            ecosystem.load_dump([path])
+
+    def test_analyse(self):
+        # a -> b -> c -> b (a cycle), a -> d (ported) -> e, f alone.
+        path = self.write([release('a', requires=['b', 'd']),
+                           release('b', requires=['c']),
+                           release('c', requires=['b']),
+                           release('d', requires=['e'], ported=True),
+                           release('e'), release('f')])
+        graph = ecosystem.load_dump([path])
+        for chunk_size in (1, 2, ecosystem.DEFAULT_CHUNK_SIZE):
+            analysis = ecosystem.analyse(graph, chunk_size)
+            self.assertEqual(list(analysis.blockers), [3, 2, 2, 0, 1, 1])
+            self.assertEqual(list(analysis.unblocks), [0, 2, 2, 0, 0, 0])
+
+    def test_analyse_matches_walking(self):
+        rng = random.Random(42)
+        count = 60
+        graph = dict((index, set(rng.sample(range(count), 3)) - {index})
+                     for index in range(count))
+        ported = dict((index, rng.random() < 0.3) for index in range(count))
+        releases = [release('p{0:02}'.format(index),
+                            requires=['p{0:02}'.format(dep)
+                                      for dep in graph[index]],
+                            ported=ported[index])
+                    for index in range(count)]
+        loaded = ecosystem.load_dump([self.write(releases)])
+        analysis = ecosystem.analyse(loaded, chunk_size=7)
+        closures = dict((index, closure(graph, ported, index))
+                        for index in range(count))
+        for index in range(count):
+            self.assertEqual(analysis.blockers[index], len(closures[index]))
+            dependents = sum(1 for other in range(count)
+                             if other != index and index in closures[other])
+            self.assertEqual(analysis.unblocks[index], dependents)
+
+    def test_ranked(self):
+        self.assertEqual(ecosystem.ranked(['a', 'b', 'c', 'd'], [1, 3, 0, 1]),
+                         [('b', 3), ('a', 1), ('d', 1)])
+        self.assertEqual(ecosystem.ranked(['a', 'b'], [1, 3], 1), [('b', 3)])
+
+    def test_cli(self):
+        path = self.write([release('a', requires=['b']), release('b'),
+                           release('c', ported=True)])
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            ciu_main.main(['ecosystem', path, '--format', 'json'])
+        document = json.loads(stdout.getvalue())
+        self.assertEqual(document, {'projects': 3, 'blocking': 2,
+                                    'blocked': [['a', 2], ['b', 1]],
+                                    'unblocks': [['b', 1]]})
+
+    def test_cli_text(self):
+        path = self.write([release('a', requires=['b']), release('b')])
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            ciu_main.main(['ecosystem', path, '--top', '1'])
+        output = stdout.getvalue()
+        self.assertIn('2 of 2 projects are blocking', output)
+        self.assertIn('  a: 2', output)
+        self.assertIn('  b: 1', output)
+
+
+class MissingSciPyTests(unittest.TestCase):
+
+    def test_cli_error(self):
+        with mock.patch.object(ecosystem, 'scipy', None):
+            with self.assertRaises(SystemExit) as context:
+                ciu_main.main(['ecosystem', 'dump.jsonl'])
+        self.assertIn('NumPy and SciPy', str(context.exception))
+
+    def test_not_imported_by_cli(self):
+        # NumPy and SciPy would slow down starting every command.
+        code = ('import sys, caniusepython3.__main__; '
+                'print("caniusepython3.ecosystem" in sys.modules)')
+        output = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(output.strip(), b'False')
@@ -13,18 +13,24 @@
 # limitations under the License.
 from __future__ import absolute_import, unicode_literals
 
-from caniusepython3.test import unittest
+from caniusepython3.test import mock, unittest
 
 ALL_GOOD = True
 try:
     import io
+    import os
+    import shutil
     import sys
+    import tempfile
+    import time
     import tokenize
 
+    import astroid
     from astroid import test_utils
     from pylint import testutils
     from pylint.testutils import CheckerTestCase
 
+    from caniusepython3 import pylint_checker
     from caniusepython3.pylint_checker import StrictPython3Checker, UnicodeChecker
 except (ImportError, SyntaxError):
     ALL_GOOD = False
@@ -71,6 +77,48 @@ class StrictPython3CheckerTest(CheckerTestCase):
         with self.assertNoMessages():
             self.checker.visit_name(node)
 
+
+@new_enough
+class NameResolutionTest(unittest.TestCase):
+
+    """Which names StrictPython3Checker resolves the scope of.
+
+    Unlike CheckerTestCase, this runs under any test runner and pylint.
+    """
+
+    def setUp(self):
+        self.linter = testutils.UnittestLinter()
+        self.checker = StrictPython3Checker(self.linter)
+
+    def visit(self, source):
+        node = astroid.extract_node(source)
+        lookups = []
+        original = type(node).lookup
+
+        def lookup(self, name):
+            lookups.append(name)
+            return original(self, name)
+
+        with mock.patch.object(type(node), 'lookup', lookup):
+            self.checker.visit_module(node.root())
+            self.checker.visit_name(node)
+        return bool(lookups), self.linter.release_messages()
+
+    def test_shadowed_builtin(self):
+        resolved, messages = self.visit('def open(): pass\nopen  #@')
+        self.assertTrue(resolved)
+        self.assertEqual(messages, [])
+
+    def test_only_candidates_resolved(self):
+        resolved, _ = self.visit('def len(): pass\nlen  #@')
+        self.assertFalse(resolved)
+
+    def test_unbound_candidate_not_resolved(self):
+        resolved, messages = self.visit('open  #@')
+        self.assertFalse(resolved)
+        self.assertEqual(messages, [])
+
+
 @new_enough
 class UnicodeCheckerTest(CheckerTestCase):
 
@@ -119,6 +167,62 @@ class UnicodeCheckerTest(CheckerTestCase):
             self.checker.process_tokens(tokens)
 
 
+@new_enough
+class MessageCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        patch = mock.patch.dict(os.environ, {'CIU_PYLINT_CACHE': directory})
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.path = os.path.join(directory, 'module.py')
+        with io.open(self.path, 'w') as file:
+            file.write(u"val = 'abc'\n")
+
+    def check(self, tokens):
+        linter = testutils.UnittestLinter()
+        linter.current_file = self.path
+        UnicodeChecker(linter).process_tokens(tokens)
+        return [(message.msg_id, message.line)
+                for message in linter.release_messages()]
+
+    def test_replayed(self):
+        tokens = tokenize.generate_tokens(io.StringIO(u"val = 'abc'\n").readline)
+        self.assertEqual(self.check(tokens), [('native-string', 1)])
+        # The file is unchanged, so the tokens aren't even looked at.
+        self.assertEqual(self.check(iter(())), [('native-string', 1)])
+
+    def test_changed_file(self):
+        tokens = tokenize.generate_tokens(io.StringIO(u"val = 'abc'\n").readline)
+        self.check(tokens)
+        with io.open(self.path, 'w') as file:
+            file.write(u"val = b'abc'\n")
+        self.assertEqual(self.check(iter(())), [])
+
+    def test_other_interpreter(self):
+        tokens = tokenize.generate_tokens(io.StringIO(u"val = 'abc'\n").readline)
+        self.check(tokens)
+        # Which messages are emitted depends on the interpreter.
+        with mock.patch.object(pylint_checker, '_MESSAGE_CACHE_CONTEXT',
+                               'other'):
+            self.assertEqual(self.check(iter(())), [])
+
+    def test_expired(self):
+        tokens = tokenize.generate_tokens(io.StringIO(u"val = 'abc'\n").readline)
+        self.check(tokens)
+        later = time.time() + pylint_checker.MESSAGE_CACHE_MAX_AGE + 1
+        with mock.patch('time.time', return_value=later):
+            # Creating the cache removes the expired messages.
+            message_cache = pylint_checker.message_cache()
+        self.assertEqual([entry['key'] for entry in message_cache.entries()],
+                         ['pylint:pruned'])
+
+    def test_disabled(self):
+        with mock.patch.dict(os.environ, {'CIU_PYLINT_CACHE': 'off'}):
+            self.assertIsNone(pylint_checker.message_cache())
+
+
 if __name__ == '__main__':
     import unittest
     unittest.main()
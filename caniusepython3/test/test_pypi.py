@@ -14,10 +14,23 @@
 
 from __future__ import unicode_literals
 
-from caniusepython3 import pypi
-from caniusepython3.test import unittest, skip_pypi_timeouts
+from caniusepython3 import cache, pypi
+from caniusepython3.test import (mock, unittest, skip_pypi_timeouts,
+                                 StandInIndex)
 
 import packaging.utils
+import requests
+
+import datetime
+import shutil
+import tempfile
+import threading
+import time
+
+try:
+    import xmlrpc.client as xmlrpc_client
+except ImportError:
+    import xmlrpclib as xmlrpc_client
 
 
 class NameTests(unittest.TestCase):
@@ -59,6 +72,327 @@ class OverridesTests(unittest.TestCase):
         self.assertIn("unittest2", overrides)
 
 
+class KnownPortedTests(unittest.TestCase):
+
+    def setUp(self):
+        pypi._known_ported.cache_clear()
+        self.addCleanup(pypi._known_ported.cache_clear)
+
+    def test_snapshot(self):
+        known_ported = pypi.known_ported()
+        self.assertIn('requests', known_ported)
+        self.assertTrue(all(name == packaging.utils.canonicalize_name(name)
+                            for name in known_ported))
+
+    def test_stale(self):
+        snapshot = b'{"generated": "2000-01-01", "projects": ["requests"]}'
+        with mock.patch('pkgutil.get_data', return_value=snapshot):
+            self.assertEqual(pypi.known_ported(), frozenset())
+            pypi._known_ported.cache_clear()
+            today = datetime.date(2000, 6, 1)
+            self.assertEqual(pypi._known_ported(today),
+                             frozenset(['requests']))
+
+
+def fake_response(status_code=200, classifiers=()):
+    response = mock.Mock(status_code=status_code)
+    response.json.return_value = {'info': {'classifiers': list(classifiers),
+                                           'requires_python': None}}
+    return response
+
+
+class SupportsPy3Tests(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.cache = cache.ResultCache(directory)
+
+    @mock.patch('requests.get')
+    def test_latest(self, get):
+        get.return_value = fake_response(
+                classifiers=['Programming Language :: Python :: 3'])
+        self.assertTrue(pypi.supports_py3('project', 'https://index'))
+        get.assert_called_once_with('https://index/project/json',
+                                    timeout=pypi.DEFAULT_TIMEOUT)
+
+    @mock.patch('requests.get')
+    def test_missing(self, get):
+        get.return_value = fake_response(status_code=404)
+        self.assertTrue(pypi.supports_py3('project', 'https://index'))
+
+    @mock.patch('requests.get')
+    def test_version(self, get):
+        get.return_value = fake_response(classifiers=['Programming Language :: Python'])
+        self.assertFalse(pypi.supports_py3('project', 'https://index', '1.0'))
+        get.assert_called_once_with('https://index/project/1.0/json',
+                                    timeout=pypi.DEFAULT_TIMEOUT)
+
+    @mock.patch('requests.get')
+    def test_version_cached(self, get):
+        get.return_value = fake_response(
+                classifiers=['Programming Language :: Python :: 3'])
+        for _ in range(2):
+            self.assertTrue(pypi.supports_py3('project', 'https://index',
+                                              '1.0', self.cache))
+        self.assertEqual(get.call_count, 1)
+
+    @mock.patch('requests.get')
+    def test_latest_cached(self, get):
+        get.return_value = fake_response()
+        for _ in range(2):
+            pypi.supports_py3('project', 'https://index', cache=self.cache)
+        self.assertEqual(get.call_count, 1)
+
+    @mock.patch('requests.get')
+    def test_latest_cache_expires(self, get):
+        get.return_value = fake_response()
+        self.cache.max_age = 0
+        pypi.supports_py3('project', 'https://index', cache=self.cache)
+        with mock.patch('time.time', return_value=time.time() + 1):
+            pypi.supports_py3('project', 'https://index', cache=self.cache)
+        self.assertEqual(get.call_count, 2)
+
+    @mock.patch('requests.get')
+    def test_timeout(self, get):
+        get.return_value = fake_response()
+        pypi.supports_py3('project', 'https://index', timeout=3)
+        get.assert_called_once_with('https://index/project/json', timeout=3)
+
+    @mock.patch('requests.get')
+    def test_failure_not_cached(self, get):
+        get.return_value = fake_response(status_code=500)
+        for _ in range(2):
+            pypi.supports_py3('project', 'https://index', '1.0', self.cache)
+        self.assertEqual(get.call_count, 2)
+
+
+class DeclaresPythonTests(unittest.TestCase):
+
+    def info(self, *versions, **kwargs):
+        return {'classifiers': ['Programming Language :: Python :: ' + version
+                                for version in versions],
+                'requires_python': kwargs.get('requires_python')}
+
+    def test_major(self):
+        self.assertTrue(pypi.declares_python(self.info('3 :: Only'), '3'))
+        self.assertTrue(pypi.declares_python(self.info('3.6'), '3'))
+        self.assertFalse(pypi.declares_python(self.info('2.7'), '3'))
+
+    def test_minor_classifiers(self):
+        info = self.info('3', '3.7', '3.8')
+        self.assertTrue(pypi.declares_python(info, '3.8'))
+        self.assertFalse(pypi.declares_python(info, '3.12'))
+
+    def test_no_minor_classifiers(self):
+        self.assertTrue(pypi.declares_python(self.info('3'), '3.12'))
+        self.assertFalse(pypi.declares_python(self.info('2'), '3.12'))
+
+    def test_requires_python(self):
+        info = self.info('3', requires_python='>=3.9')
+        self.assertFalse(pypi.declares_python(info, '3.8'))
+        self.assertTrue(pypi.declares_python(info, '3.12'))
+        info = self.info('3', requires_python='>=3.8.1,<3.9')
+        self.assertTrue(pypi.declares_python(info, '3.8'))
+        self.assertFalse(pypi.declares_python(info, '3.9'))
+
+    def test_invalid_requires_python(self):
+        info = self.info('3.8', requires_python='>=3.x')
+        self.assertTrue(pypi.declares_python(info, '3.8'))
+
+
+class SingleFlightTests(unittest.TestCase):
+
+    @mock.patch('requests.get')
+    def test_concurrent_lookups_shared(self, get):
+        started, release = threading.Event(), threading.Event()
+
+        def slow_get(url, timeout):
+            started.set()
+            release.wait(5)
+            return fake_response(
+                    classifiers=['Programming Language :: Python :: 3'])
+        get.side_effect = slow_get
+        results = []
+
+        def lookup():
+            results.append(pypi.supports_py3('project', 'https://index'))
+        leader = threading.Thread(target=lookup)
+        leader.start()
+        self.assertTrue(started.wait(5))
+        follower = threading.Thread(target=lookup)
+        follower.start()
+        # Give the follower time to join the in-flight lookup.
+        time.sleep(0.1)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+        self.assertEqual(results, [True, True])
+        self.assertEqual(get.call_count, 1)
+
+    def test_exception_shared(self):
+        calls = pypi.SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        errors = []
+
+        def failing():
+            started.set()
+            release.wait(5)
+            raise ValueError('boom')
+
+        def call():
+            try:
+                calls.call('key', failing)
+            except ValueError as exc:
+                errors.append(exc)
+        leader = threading.Thread(target=call)
+        leader.start()
+        self.assertTrue(started.wait(5))
+        follower = threading.Thread(target=call)
+        follower.start()
+        time.sleep(0.1)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+        self.assertEqual(len(errors), 2)
+        self.assertIs(errors[0], errors[1])
+
+    def test_not_remembered(self):
+        calls = pypi.SingleFlight()
+        self.assertEqual(calls.call('key', lambda: 1), 1)
+        self.assertEqual(calls.call('key', lambda: 2), 2)
+
+
+def xmlrpc_response(result):
+    response = mock.Mock(status_code=200)
+    response.content = xmlrpc_client.dumps((result,),
+                                           methodresponse=True).encode('utf-8')
+    return response
+
+
+class BatchQueryTests(unittest.TestCase):
+
+    PY3 = ['Programming Language :: Python :: 3']
+
+    def index(self, batch=True):
+        index = StandInIndex({'a': self.PY3, 'b': []}, batch)
+        self.addCleanup(index.close)
+        return index
+
+    def test_batch(self):
+        index = self.index()
+        got = pypi.batch_project_info([('a', None), ('b', '1.0'),
+                                       ('c', None)], index.url)
+        self.assertEqual(got[('a', None)]['classifiers'], self.PY3)
+        self.assertEqual(got[('b', '1.0')],
+                         {'classifiers': [], 'requires_python': None})
+        self.assertIsNone(got[('c', None)])
+        self.assertEqual(index.requests, [('POST', '/batch')])
+
+    def test_cached(self):
+        index = self.index()
+        memory = cache.MemoryCache()
+        memory.set(index.url + '/a/json', {'classifiers': [],
+                                           'requires_python': None})
+        got = pypi.batch_project_info([('a', None), ('b', '1.0')], index.url,
+                                      memory)
+        self.assertEqual(got[('a', None)]['classifiers'], [])
+        entry = memory.entry(index.url + '/b/1.0/json')
+        self.assertTrue(entry['immutable'])
+        # Everything asked for is now cached.
+        pypi.batch_project_info([('a', None), ('b', '1.0')], index.url,
+                                memory)
+        self.assertEqual(len(index.requests), 1)
+
+    def test_unsupported(self):
+        index = self.index(batch=False)
+        protocol = pypi.JSONBatchProtocol()
+        for _ in range(2):
+            self.assertRaises(pypi.BatchUnsupported,
+                              pypi.batch_project_info, [('a', None)],
+                              index.url, protocol=protocol)
+        # The index isn't asked again.
+        self.assertEqual(index.requests, [('POST', '/batch')])
+
+    def test_matches_project_info(self):
+        index = self.index()
+        batched = pypi.batch_project_info([('a', None)], index.url)
+        self.assertEqual(batched[('a', None)],
+                         pypi.project_info('a', index.url))
+
+
+class SyncCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.cache = cache.ResultCache(directory, max_age=0)
+
+    def called_method(self, post):
+        body = post.call_args[1]['data']
+        return xmlrpc_client.loads(body)
+
+    @mock.patch('requests.post')
+    def test_first_sync(self, post):
+        post.return_value = xmlrpc_response(100)
+        self.assertIsNone(pypi.sync_cache(self.cache, 'https://index'))
+        self.assertEqual(self.called_method(post),
+                         ((), 'changelog_last_serial'))
+        self.assertEqual(post.call_args[0], ('https://index',))
+        self.assertIsNotNone(self.cache.trusted_since)
+
+    @mock.patch('requests.post')
+    def test_changed_invalidated(self, post):
+        post.return_value = xmlrpc_response(100)
+        pypi.sync_cache(self.cache, 'https://index')
+        self.cache.set('https://index/foo-bar/json', {'classifiers': []})
+        self.cache.set('distlib:foo-bar', [])
+        self.cache.set('https://index/other/json', {'classifiers': []})
+        # Entries stored since the first sync are trusted despite their age.
+        with mock.patch('time.time', return_value=time.time() + 60):
+            self.assertIsNotNone(self.cache.get('https://index/other/json'))
+        post.return_value = xmlrpc_response([
+                ['Foo_Bar', '1.0', 1500000000, 'new release', 101],
+                ['Foo_Bar', '1.0', 1500000001, 'add py3 file', 102]])
+        changes = pypi.sync_cache(self.cache, 'https://index')
+        self.assertEqual(changes, {'Foo_Bar'})
+        self.assertEqual(self.called_method(post),
+                         ((100,), 'changelog_since_serial'))
+        self.assertIsNone(self.cache.get('https://index/foo-bar/json'))
+        self.assertIsNone(self.cache.get('distlib:foo-bar'))
+        self.assertIsNotNone(self.cache.get('https://index/other/json'))
+        post.return_value = xmlrpc_response([])
+        self.assertEqual(pypi.sync_cache(self.cache, 'https://index'), set())
+        self.assertEqual(self.called_method(post),
+                         ((102,), 'changelog_since_serial'))
+
+    @mock.patch('requests.post')
+    def test_closures_invalidated(self, post):
+        post.return_value = xmlrpc_response(100)
+        pypi.sync_cache(self.cache, 'https://index')
+        self.cache.set('closure:1', {})
+        self.cache.set('closure:2', {})
+        pypi.track_closure(self.cache, 'closure:1', ['foo-bar', 'baz'],
+                           'https://index')
+        pypi.track_closure(self.cache, 'closure:2', ['baz'], 'https://index')
+        post.return_value = xmlrpc_response([
+                ['Foo_Bar', '1.0', 1500000000, 'new release', 101]])
+        pypi.sync_cache(self.cache, 'https://index')
+        self.assertIsNone(self.cache.get('closure:1'))
+        self.assertIsNotNone(self.cache.get('closure:2'))
+
+    @mock.patch('requests.post')
+    def test_no_changelog(self, post):
+        post.return_value = mock.Mock(status_code=404)
+        post.return_value.raise_for_status.side_effect = (
+                requests.HTTPError('404'))
+        with mock.patch('logging.Logger.warning') as warning:
+            self.assertIsNone(pypi.sync_cache(self.cache, 'https://index'))
+        self.assertTrue(warning.called)
+        self.assertIsNone(self.cache.trusted_since)
+        self.assertIsNone(self.cache.get('serial:https://index'))
+
+
 class NetworkTests(unittest.TestCase):
 
     @skip_pypi_timeouts
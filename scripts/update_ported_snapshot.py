@@ -0,0 +1,71 @@
+"""Regenerate the bundled snapshot of projects known to support Python 3.
+
+The most downloaded projects on PyPI (or the projects listed in a file, one per
+line) are looked up and those whose latest release declares support for
+Python 3 are written to caniusepython3/ported.json along with today's date.
+The snapshot goes stale pypi.SNAPSHOT_MAX_AGE days later, so regenerate it for
+every release.
+
+Run with ``python scripts/update_ported_snapshot.py [--top N] [--names FILE]``.
+"""
+from __future__ import print_function
+
+import argparse
+import concurrent.futures
+import datetime
+import io
+import json
+import os
+
+import packaging.utils
+import requests
+
+from caniusepython3 import pypi
+
+TOP_PROJECTS_URL = ('https://hugovk.github.io/top-pypi-packages/'
+                    'top-pypi-packages-30-days.min.json')
+SNAPSHOT_PATH = os.path.join(os.path.dirname(__file__), os.pardir,
+                             'caniusepython3', 'ported.json')
+
+
+def top_projects(count):
+    """Return the names of the most downloaded projects on PyPI."""
+    response = requests.get(TOP_PROJECTS_URL, timeout=pypi.DEFAULT_TIMEOUT)
+    response.raise_for_status()
+    return [row['project'] for row in response.json()['rows'][:count]]
+
+
+def ported(project_name):
+    info = pypi.project_info(project_name)
+    return info is not None and pypi.declares_py3(info)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--top', type=int, default=5000,
+                        help='number of the most downloaded projects to check')
+    parser.add_argument('--names', help='file listing the projects to check')
+    parser.add_argument('--jobs', type=int, default=32)
+    parsed = parser.parse_args()
+
+    if parsed.names:
+        with io.open(parsed.names, encoding='utf-8') as file:
+            names = [line.strip() for line in file
+                     if line.strip() and not line.startswith('#')]
+    else:
+        names = top_projects(parsed.top)
+    names = set(map(packaging.utils.canonicalize_name, names))
+    with concurrent.futures.ThreadPoolExecutor(parsed.jobs) as executor:
+        checked = zip(sorted(names), executor.map(ported, sorted(names)))
+        projects = [name for name, supported in checked if supported]
+
+    snapshot = {'generated': datetime.date.today().isoformat(),
+                'projects': projects}
+    with io.open(SNAPSHOT_PATH, 'w', encoding='utf-8') as file:
+        file.write(json.dumps(snapshot, indent=0, sort_keys=True) + '\n')
+    print('{0} of {1} projects are known to be ported'.format(len(projects),
+                                                               len(names)))
+
+
+if __name__ == '__main__':
+    main()
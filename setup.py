@@ -27,6 +27,9 @@ setup(name='caniusepython3',
                         'backports.functools_lru_cache',
                         'futures ; python_version=="2.7"',
                         'requests'],  # Functionality
+      extras_require={'poetry': ['tomli ; python_version>="3.7" and python_version<"3.11"',
+                                 'toml ; python_version<"3.7"'],
+                      'ecosystem': ['numpy', 'scipy']},
       tests_require=tests_require,  # Testing, external due to Travis
       test_suite='caniusepython3.test',
       classifiers=[